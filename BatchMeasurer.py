@@ -0,0 +1,198 @@
+# Copyright (c) 2023 Aldo Hoeben / fieldOfView
+# MeasureTool is released under the terms of the AGPLv3 or higher.
+
+from .Calipers import CaliperMeasurement, getHullPoints, measureCalipers
+from .GeometryCache import GeometryCache, NodeGeometry
+from .MeshDistance import ClosestPoints, _boxDistances, findClosestPoints, getCachedClosestPoints, setCachedClosestPoints
+from .RayCastPicker import getPickableItems
+
+import itertools
+import numpy
+
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Union
+
+
+##  The distance between two points in world space.
+class DistanceQuery:
+    def __init__(self, point_a: Sequence[float], point_b: Sequence[float], tag: Any = None) -> None:
+        self.point_a = point_a
+        self.point_b = point_b
+        self.tag = tag  # any value that identifies the query to the caller; it is not used by the measurer
+
+
+##  The clearance between two objects: the closest points between their meshes.
+#   Objects can be single nodes, groups, or lists of nodes; all meshes below them are measured.
+class ClearanceQuery:
+    def __init__(self, nodes_a: Union[Any, List[Any]], nodes_b: Union[Any, List[Any]], tag: Any = None) -> None:
+        self.nodes_a = nodes_a
+        self.nodes_b = nodes_b
+        self.tag = tag
+
+
+##  The extents of an object along the world axes, and optionally its smallest oriented box and widths.
+class ExtentsQuery:
+    def __init__(self, nodes: Union[Any, List[Any]], oriented: bool = False, tag: Any = None) -> None:
+        self.nodes = nodes
+        self.oriented = oriented
+        self.tag = tag
+
+
+class DistanceResult:
+    def __init__(self, query: DistanceQuery, distance: float, delta: numpy.ndarray) -> None:
+        self.query = query
+        self.distance = distance  # in mm
+        self.delta = delta  # point_b minus point_a, per axis
+
+
+class ClearanceResult:
+    def __init__(self, query: ClearanceQuery, closest_points: Optional[ClosestPoints]) -> None:
+        self.query = query
+        self.closest_points = closest_points  # None if either object has no triangles
+        self.distance = closest_points.distance if closest_points is not None else None  # type: Optional[float]
+
+
+class ExtentsResult:
+    def __init__(self, query: ExtentsQuery, minimum: Optional[numpy.ndarray], maximum: Optional[numpy.ndarray], calipers: Optional[CaliperMeasurement]) -> None:
+        self.query = query
+        self.minimum = minimum  # exact minimum corner of the vertices in world space, or None if there are none
+        self.maximum = maximum
+        self.calipers = calipers  # smallest oriented box and widths if the query asked for them
+
+
+##  Evaluates measurements without the tool, for example from scripts that check many projects.
+#
+#   Queries are read from an iterable in batches, and the results of each batch are yielded in the order of the
+#   queries as soon as the batch is done, so arbitrarily many queries can be measured without keeping all results.
+#   Within a batch, queries of the same type are evaluated together: distances in a single vectorized step, the
+#   extents of all objects from one array of their transformed convex hulls, and clearances by the pairs of meshes of
+#   all queries, in the order of the distance between their bounds so pairs that cannot be closer than a pair that
+#   was already measured are skipped.
+#
+#   The hierarchies and hulls of meshes are kept in the geometry cache, and so are shared between queries, batches and
+#   nodes that use the same mesh data. Pass the geometry cache of the tool to share them with the tool as well.
+class BatchMeasurer:
+    DefaultBatchSize = 256
+
+    def __init__(self, geometry_cache: Optional[GeometryCache] = None) -> None:
+        self._geometry_cache = geometry_cache if geometry_cache is not None else GeometryCache()
+
+    ##  Measure queries, yielding a result for each query in the same order.
+    #   \param queries DistanceQuery, ClearanceQuery and ExtentsQuery objects; any iterable, including generators.
+    #   \param batch_size The number of queries that are read and evaluated at once.
+    def measure(self, queries: Iterable[Any], batch_size: int = DefaultBatchSize) -> Iterator[Any]:
+        query_iterator = iter(queries)
+        while True:
+            batch = list(itertools.islice(query_iterator, max(1, batch_size)))
+            if not batch:
+                return
+            yield from self._measureBatch(batch)
+
+    ##  Measure a list of queries at once, returning a list of results in the same order.
+    def measureAll(self, queries: Iterable[Any]) -> List[Any]:
+        queries = list(queries)
+        return list(self.measure(queries, batch_size=len(queries)))
+
+    def _measureBatch(self, batch: List[Any]) -> List[Any]:
+        results = [None] * len(batch)  # type: List[Any]
+        indices = {DistanceQuery: [], ClearanceQuery: [], ExtentsQuery: []}  # type: Dict[type, List[int]]
+        for index, query in enumerate(batch):
+            query_indices = indices.get(type(query))
+            if query_indices is None:
+                raise TypeError("Unsupported measurement query: {}".format(type(query).__name__))
+            query_indices.append(index)
+
+        geometries = {}  # type: Dict[int, List[NodeGeometry]]  # by the id of the node or list of nodes of a query
+        self._measureDistances(batch, indices[DistanceQuery], results)
+        self._measureExtents(batch, indices[ExtentsQuery], results, geometries)
+        self._measureClearances(batch, indices[ClearanceQuery], results, geometries)
+        return results
+
+    def _measureDistances(self, batch: List[Any], indices: List[int], results: List[Any]) -> None:
+        if not indices:
+            return
+        points_a = numpy.array([batch[index].point_a for index in indices], dtype=numpy.float64).reshape(-1, 3)
+        points_b = numpy.array([batch[index].point_b for index in indices], dtype=numpy.float64).reshape(-1, 3)
+        deltas = points_b - points_a
+        distances = numpy.sqrt(numpy.einsum("ij,ij->i", deltas, deltas))
+        for position, index in enumerate(indices):
+            results[index] = DistanceResult(batch[index], float(distances[position]), deltas[position])
+
+    ##  The extents of each mesh are the extents of its transformed convex hull; the hulls of all meshes in the batch
+    #   are transformed and reduced together.
+    def _measureExtents(self, batch: List[Any], indices: List[int], results: List[Any], geometries: Dict[int, List[NodeGeometry]]) -> None:
+        if not indices:
+            return
+        query_geometries = [self._getGeometries(batch[index].nodes, geometries) for index in indices]
+        unique_geometries = {id(node_geometry): node_geometry for node_geometry in itertools.chain(*query_geometries)}
+        hulls = []  # type: List[numpy.ndarray]
+        positions = {}  # type: Dict[int, int]
+        for key, node_geometry in unique_geometries.items():
+            hull_points = getHullPoints(node_geometry.mesh_geometry)
+            if len(hull_points):
+                positions[key] = len(hulls)
+                hulls.append(node_geometry.transformPoints(hull_points))
+
+        if hulls:
+            world_points = numpy.concatenate(hulls)
+            starts = numpy.cumsum([0] + [len(hull_points) for hull_points in hulls[:-1]])
+            minima = numpy.minimum.reduceat(world_points, starts)
+            maxima = numpy.maximum.reduceat(world_points, starts)
+
+        for index, node_geometries in zip(indices, query_geometries):
+            query = batch[index]
+            members = [positions[id(node_geometry)] for node_geometry in node_geometries if id(node_geometry) in positions]
+            if not members:
+                results[index] = ExtentsResult(query, None, None, None)
+                continue
+            calipers = measureCalipers(node_geometries) if query.oriented else None
+            results[index] = ExtentsResult(query, minima[members].min(axis=0), maxima[members].max(axis=0), calipers)
+
+    ##  The clearance between two objects is the smallest distance between any of their pairs of meshes. The pairs of
+    #   all queries in the batch are sorted by the distance between their bounds, which is a lower bound of the
+    #   distance between the meshes, so a pair is only measured if it could be closer than the closest pair so far.
+    def _measureClearances(self, batch: List[Any], indices: List[int], results: List[Any], geometries: Dict[int, List[NodeGeometry]]) -> None:
+        if not indices:
+            return
+        pair_queries = []  # type: List[int]
+        pairs = []  # type: List[Any]
+        for position, index in enumerate(indices):
+            for geometry_a in self._getGeometries(batch[index].nodes_a, geometries):
+                for geometry_b in self._getGeometries(batch[index].nodes_b, geometries):
+                    pair_queries.append(position)
+                    pairs.append((geometry_a, geometry_b))
+
+        nearest = [None] * len(indices)  # type: List[Optional[ClosestPoints]]
+        if pairs:
+            bounds_a = [geometry_a.getWorldBounds() for geometry_a, _ in pairs]
+            bounds_b = [geometry_b.getWorldBounds() for _, geometry_b in pairs]
+            lower_bounds = _boxDistances(
+                numpy.array([bounds[0] for bounds in bounds_a]), numpy.array([bounds[1] for bounds in bounds_a]),
+                numpy.array([bounds[0] for bounds in bounds_b]), numpy.array([bounds[1] for bounds in bounds_b])
+            )
+            for pair in numpy.lexsort((lower_bounds, pair_queries)):
+                position = pair_queries[pair]
+                if nearest[position] is not None and lower_bounds[pair] >= nearest[position].distance:
+                    continue
+                geometry_a, geometry_b = pairs[pair]
+                closest_points = getCachedClosestPoints(geometry_a, geometry_b)
+                if closest_points is None:
+                    closest_points = findClosestPoints(geometry_a, geometry_b)
+                    if closest_points is None:
+                        continue
+                    setCachedClosestPoints(geometry_a, geometry_b, closest_points)
+                if nearest[position] is None or closest_points.distance < nearest[position].distance:
+                    nearest[position] = closest_points
+
+        for position, index in enumerate(indices):
+            results[index] = ClearanceResult(batch[index], nearest[position])
+
+    ##  Get the geometry of all meshes of a node, a group or a list of nodes, once per batch.
+    def _getGeometries(self, nodes: Union[Any, List[Any]], geometries: Dict[int, List[NodeGeometry]]) -> List[NodeGeometry]:
+        node_geometries = geometries.get(id(nodes))
+        if node_geometries is None:
+            items = itertools.chain.from_iterable(
+                getPickableItems(node) for node in (nodes if isinstance(nodes, (list, tuple)) else [nodes])
+            )
+            node_geometries = self._geometry_cache.getNodeGeometries(items)
+            geometries[id(nodes)] = node_geometries
+        return node_geometries
@@ -0,0 +1,35 @@
+# Copyright (c) 2023 Aldo Hoeben / fieldOfView
+# MeasureTool is released under the terms of the AGPLv3 or higher.
+
+from UM.Job import Job
+
+from .Calipers import getCachedCalipers, measureCalipers
+from .GeometryCache import NodeGeometry
+
+from typing import List
+
+
+##  Measures the oriented bounding box and the smallest and largest width of objects in a background thread.
+#
+#   The convex hull of each mesh is kept with the mesh, and the result for a single object is kept per scale of the
+#   object, so only the first measurement of a mesh is slow. The result is None if the objects have no vertices, or if
+#   the job was cancelled.
+class CaliperJob(Job):
+    def __init__(self, geometries: List[NodeGeometry]) -> None:
+        super().__init__()
+        self._geometries = geometries
+        self._cancelled = False
+
+    ##  Check whether the measurement of the objects is already known, so the job can be run without a thread.
+    def isCached(self) -> bool:
+        return bool(self._geometries) and getCachedCalipers(self._geometries) is not None
+
+    def cancel(self) -> None:
+        self._cancelled = True
+        super().cancel()
+
+    def isCancelled(self) -> bool:
+        return self._cancelled
+
+    def run(self) -> None:
+        self.setResult(measureCalipers(self._geometries, self.isCancelled))
@@ -0,0 +1,458 @@
+# Copyright (c) 2023 Aldo Hoeben / fieldOfView
+# MeasureTool is released under the terms of the AGPLv3 or higher.
+
+from .GeometryCache import MeshGeometry, NodeGeometry
+
+import numpy
+import weakref
+
+try:
+    from scipy.spatial import ConvexHull
+except ImportError:
+    ConvexHull = None
+
+from typing import Callable, Iterator, List, Optional, Tuple
+
+
+##  The oriented bounding box of one or more objects, with their smallest and largest width, in world space.
+class CaliperMeasurement:
+    def __init__(self, center: numpy.ndarray, axes: numpy.ndarray, extents: numpy.ndarray, minimum_width: float, minimum_width_direction: numpy.ndarray, maximum_width_points: numpy.ndarray) -> None:
+        self.center = center  # center of the box
+        self.axes = axes  # unit directions of the edges of the box as rows, from the longest to the shortest edge
+        self.extents = extents  # lengths of the edges of the box along those directions, in mm
+        self.minimum_width = minimum_width  # smallest distance between two parallel planes that enclose the objects
+        self.minimum_width_direction = minimum_width_direction  # normal of those planes
+        self.maximum_width_points = maximum_width_points  # the two points of the objects that are farthest apart
+
+    def getVolume(self) -> float:
+        return float(numpy.prod(self.extents))
+
+    def getMaximumWidth(self) -> float:
+        return float(numpy.linalg.norm(self.maximum_width_points[1] - self.maximum_width_points[0]))
+
+    ##  Get the corners of the box, as an array of shape (8, 3).
+    def getCorners(self) -> numpy.ndarray:
+        return self.center + (_BoxCornerSigns * self.extents).dot(self.axes)
+
+    ##  Get the edges of the box, as an array of shape (12, 2, 3).
+    def getEdges(self) -> numpy.ndarray:
+        return self.getCorners()[_BoxEdges]
+
+    ##  Get a copy of this measurement, moved along with objects that were moved or rotated (but not scaled).
+    #   \param transformation The 4x4 matrix that moves the objects from where they were measured.
+    def transformed(self, transformation: numpy.ndarray) -> "CaliperMeasurement":
+        linear = transformation[:3, :3]
+        translation = transformation[:3, 3]
+        return CaliperMeasurement(
+            linear.dot(self.center) + translation,
+            self.axes.dot(linear.T),
+            self.extents.copy(),
+            self.minimum_width,
+            linear.dot(self.minimum_width_direction),
+            self.maximum_width_points.dot(linear.T) + translation
+        )
+
+
+##  Measure the oriented bounding box and the smallest and largest width of the meshes of one or more nodes together.
+#
+#   Only the vertices of the convex hull of a mesh matter for these measurements. Because the convex hull of an affine
+#   transformation of a mesh is the transformation of its convex hull, the hull is computed once per mesh in its local
+#   space and cached, so moving, rotating or scaling an object only transforms its hull. The measurement of a single
+#   node is also cached per scale of the node, so rotating or moving it only moves the previous result along.
+#
+#   \param is_cancelled Optional function that is called between steps; the measurement stops if it returns True.
+#   \return The measurement, or None if the meshes have no vertices or the measurement was cancelled.
+def measureCalipers(node_geometries: List[NodeGeometry], is_cancelled: Optional[Callable[[], bool]] = None) -> Optional[CaliperMeasurement]:
+    if not node_geometries:
+        return None
+    measurement = getCachedCalipers(node_geometries)
+    if measurement is not None:
+        return measurement
+
+    points = []  # type: List[numpy.ndarray]
+    for node_geometry in node_geometries:
+        hull_points = getHullPoints(node_geometry.mesh_geometry, is_cancelled)
+        if hull_points is None:
+            return None
+        points.append(node_geometry.transformPoints(hull_points))
+    world_points = numpy.concatenate(points)
+    if len(world_points) == 0:
+        return None
+
+    measurement = _measurePoints(world_points, is_cancelled)
+    if measurement is None:
+        return None
+
+    first = node_geometries[0]
+    if len(node_geometries) == 1:
+        first.setDerived("calipers", measurement)
+        first.mesh_geometry.setDerived(("calipers", first.getMetricKey()), (first.transformation, measurement))
+    else:
+        first.setDerived(_getGroupKey(node_geometries), measurement)
+    return measurement
+
+
+##  Get the measurement of nodes if it is known for their current geometry, without measuring them.
+def getCachedCalipers(node_geometries: List[NodeGeometry]) -> Optional[CaliperMeasurement]:
+    first = node_geometries[0]
+    if len(node_geometries) > 1:
+        return first.getCachedDerived(_getGroupKey(node_geometries))
+
+    measurement = first.getCachedDerived("calipers")
+    if measurement is None:
+        stored = first.mesh_geometry.getCachedDerived(("calipers", first.getMetricKey()))
+        if stored is not None:
+            # The node was only moved or rotated since it was measured, so the result is moved along with it
+            transformation, stored_measurement = stored
+            measurement = stored_measurement.transformed(first.transformation.dot(numpy.linalg.inv(transformation)))
+            first.setDerived("calipers", measurement)
+    return measurement
+
+
+##  Get the vertices of the convex hull of a mesh, in the local space of the mesh.
+#   Large meshes are split into chunks of which the hulls are computed separately, so the hull can be cancelled
+#   between chunks; the hull of the vertices of those hulls is the hull of the mesh.
+#   \return The vertices, or None if computing them was cancelled.
+def getHullPoints(mesh_geometry: MeshGeometry, is_cancelled: Optional[Callable[[], bool]] = None) -> Optional[numpy.ndarray]:
+    hull_points = mesh_geometry.getCachedDerived("convex_hull_points")
+    if hull_points is not None:
+        return hull_points
+
+    vertices = mesh_geometry.getVertices()
+    chunks = []  # type: List[numpy.ndarray]
+    for start in range(0, len(vertices), _HullChunkSize):
+        if is_cancelled is not None and is_cancelled():
+            return None
+        chunks.append(_getHullVertices(numpy.asarray(vertices[start:start + _HullChunkSize], dtype=numpy.float64)))
+
+    if not chunks:
+        hull_points = numpy.zeros((0, 3))
+    elif len(chunks) == 1:
+        hull_points = chunks[0]
+    else:
+        hull_points = _getHullVertices(numpy.concatenate(chunks))
+    mesh_geometry.setDerived("convex_hull_points", hull_points)
+    return hull_points
+
+
+_HullChunkSize = 1 << 20  # vertices per convex hull computed at once
+_ReducedPointCount = 1024  # hulls with more vertices are searched with their extreme points along fixed directions
+_SupportDirectionCount = 2048  # directions along which extreme points are taken when there is no convex hull
+_SampledNormalCount = 512  # orientations that are tried when there is no convex hull to take them from
+_SampledAngleCount = 90  # rotations of the box around each of those orientations
+_RefinedCandidateCount = 8  # best orientations that are evaluated again with all points of the hull
+_RefineStartAngle = 2.0  # degrees of the first rotation that is tried when refining the best box
+_RefineEndAngle = 0.01  # degrees of the smallest rotation
+_CancelInterval = 64  # orientations tried between checks for cancellation
+_EdgePairChunkSize = 1 << 20  # pairs of hull edges checked at once for the smallest width
+
+_BoxCornerSigns = numpy.array([[x, y, z] for x in (-0.5, 0.5) for y in (-0.5, 0.5) for z in (-0.5, 0.5)])
+_BoxEdges = numpy.array([(corner, corner | bit) for corner in range(8) for bit in (4, 2, 1) if not corner & bit])
+
+
+def _getGroupKey(node_geometries: List[NodeGeometry]) -> Tuple:
+    return ("calipers", tuple(weakref.ref(node_geometry) for node_geometry in node_geometries[1:]))
+
+
+##  Get the convex hull of points with scipy, or None if scipy is not available or there are too few points.
+#   Flat sets of points have no proper hull, so they are joggled slightly to get a hull that is very thin instead.
+def _getConvexHull(points: numpy.ndarray) -> Optional["ConvexHull"]:
+    if ConvexHull is None or len(points) < 4:
+        return None
+    try:
+        return ConvexHull(points)
+    except (RuntimeError, ValueError):
+        pass
+    try:
+        return ConvexHull(points, qhull_options="QJ")
+    except (RuntimeError, ValueError):
+        return None
+
+
+##  Get the vertices of the convex hull of a set of points.
+#   Without scipy, the extreme points along a fixed set of directions are used instead.
+def _getHullVertices(points: numpy.ndarray) -> numpy.ndarray:
+    hull = _getConvexHull(points)
+    if hull is not None:
+        return points[hull.vertices]
+    if len(points) <= _SupportDirectionCount:
+        return numpy.unique(points, axis=0)
+    return _getSupportPoints(points, _SupportDirectionCount)
+
+
+##  Get the points that are farthest along a fixed set of directions, evenly spread over a sphere.
+#   \param count The number of directions, and so the maximum number of points.
+def _getSupportPoints(points: numpy.ndarray, count: int) -> numpy.ndarray:
+    directions = _getDirections(count // 2)
+    indices = []  # type: List[numpy.ndarray]
+    for start in range(0, len(points), 65536):
+        projections = directions.dot(points[start:start + 65536].T)
+        indices.append(start + numpy.argmax(projections, axis=1))
+        indices.append(start + numpy.argmin(projections, axis=1))
+    if len(indices) > 2:
+        # The extreme points of each chunk are candidates; the extreme points of those are the extreme points of all
+        return _getSupportPoints(points[numpy.unique(numpy.concatenate(indices))], count)
+    return points[numpy.unique(numpy.concatenate(indices))]
+
+
+##  Get unit directions that are evenly spread over a hemisphere, on a Fibonacci spiral.
+def _getDirections(count: int) -> numpy.ndarray:
+    index = numpy.arange(count) + 0.5
+    z = index / count
+    radius = numpy.sqrt(1 - z * z)
+    angle = index * numpy.pi * (3 - numpy.sqrt(5))
+    return numpy.column_stack([radius * numpy.cos(angle), radius * numpy.sin(angle), z])
+
+
+##  Get the normals of the faces of the convex hull of points, and the edges of the hull with their two faces.
+#   \return A tuple of the face normals, the indices of the points at the start and the end of each edge and the
+#   indices of the faces on either side of each edge, or None if there is no hull.
+def _getHullFaces(points: numpy.ndarray) -> Optional[Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray, numpy.ndarray, numpy.ndarray]]:
+    hull = _getConvexHull(points)
+    if hull is None:
+        return None
+
+    faces = numpy.repeat(numpy.arange(len(hull.simplices)), 3)
+    corners = numpy.tile(numpy.arange(3), len(hull.simplices))
+    others = hull.neighbors.reshape(-1)
+    keep = faces < others  # every edge is shared by two faces
+    faces = faces[keep]
+    corners = corners[keep]
+    others = others[keep]
+    starts = hull.simplices[faces, (corners + 1) % 3]
+    ends = hull.simplices[faces, (corners + 2) % 3]
+    return hull.equations[:, :3], starts, ends, faces, others
+
+
+##  Get unique directions, treating opposite directions as the same.
+def _getUniqueDirections(directions: numpy.ndarray) -> numpy.ndarray:
+    signs = numpy.sign(directions[numpy.arange(len(directions)), numpy.argmax(numpy.abs(directions), axis=1)])
+    directions = directions * signs[:, numpy.newaxis]
+    _, first = numpy.unique(numpy.round(directions, 6), axis=0, return_index=True)
+    return directions[numpy.sort(first)]
+
+
+##  Get the orientations to try for the box: the normal of one of its faces, the directions of the edges of that face
+#   to try, and the points that determine the extents of the box along those directions.
+#   The smallest box has a face against a face of the hull, and an edge of that face along an edge of the outline of
+#   the hull seen along the normal; that outline consists of the edges between faces that point either way, and only
+#   the points on the outline determine the extents across the normal. Without a hull, a fixed set of normals is
+#   tried with a fixed set of rotations around each.
+def _getOrientations(points: numpy.ndarray) -> Iterator[Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]]:
+    hull_faces = _getHullFaces(points)
+    if hull_faces is None:
+        angles = numpy.arange(_SampledAngleCount) * (numpy.pi / 2 / _SampledAngleCount)
+        for normal in _getDirections(_SampledNormalCount):
+            u, v = _getPerpendicularAxes(normal)
+            yield normal, numpy.outer(numpy.cos(angles), u) + numpy.outer(numpy.sin(angles), v), points
+        return
+
+    face_normals, starts, ends, faces, others = hull_faces
+    for normal in _getUniqueDirections(face_normals):
+        sides = face_normals.dot(normal)
+        outline = sides[faces] * sides[others] <= 1e-12
+        outline_points = numpy.concatenate([points[starts[outline]], points[ends[outline]]])
+        edges = points[ends[outline]] - points[starts[outline]]
+        directions = edges - numpy.outer(edges.dot(normal), normal)
+        lengths = numpy.linalg.norm(directions, axis=1)
+        directions = directions[lengths > 1e-12] / lengths[lengths > 1e-12, numpy.newaxis]
+        if len(directions) == 0:
+            directions = numpy.array(_getPerpendicularAxes(normal)[:1])
+            outline_points = points
+        yield normal, directions, outline_points
+
+
+##  Get two unit vectors that are perpendicular to a unit vector and to each other.
+def _getPerpendicularAxes(normal: numpy.ndarray) -> Tuple[numpy.ndarray, numpy.ndarray]:
+    helper = numpy.eye(3)[int(numpy.argmin(numpy.abs(normal)))]
+    u = numpy.cross(normal, helper)
+    u /= numpy.linalg.norm(u)
+    return u, numpy.cross(normal, u)
+
+
+def _getExtents(points: numpy.ndarray, axes: numpy.ndarray) -> numpy.ndarray:
+    projections = points.dot(axes.T)
+    return projections.max(axis=0) - projections.min(axis=0)
+
+
+##  Measure a set of points, which should be the vertices of a convex hull.
+#   Hulls with many vertices are first searched with a reduced set of their extreme points; the best candidates of
+#   that search are then evaluated again with all vertices, so the box always contains all of them.
+def _measurePoints(points: numpy.ndarray, is_cancelled: Optional[Callable[[], bool]]) -> Optional[CaliperMeasurement]:
+    reduced = points if len(points) <= _ReducedPointCount else _getSupportPoints(points, _ReducedPointCount)
+
+    # Smallest box: the volume of the best box per orientation, keeping the best few to refine
+    candidates = []  # type: List[Tuple[float, numpy.ndarray, numpy.ndarray]]
+    normals = []  # type: List[numpy.ndarray]
+    for count, (normal, directions, outline_points) in enumerate(_getOrientations(reduced)):
+        if count % _CancelInterval == 0 and is_cancelled is not None and is_cancelled():
+            return None
+        normals.append(normal)
+        areas = _getExtents(outline_points, directions) * _getExtents(outline_points, numpy.cross(normal, directions))
+        best = int(numpy.argmin(areas))
+        height = float(numpy.ptp(reduced.dot(normal)))
+        candidates.append((float(areas[best]) * height, normal, directions[best]))
+    candidates.sort(key=lambda candidate: candidate[0])
+
+    best_box = None  # type: Optional[Tuple[float, numpy.ndarray, numpy.ndarray, numpy.ndarray]]
+    for _, normal, direction in candidates[:_RefinedCandidateCount]:
+        axes = numpy.array([direction, numpy.cross(normal, direction), normal])
+        projections = points.dot(axes.T)
+        minimum = projections.min(axis=0)
+        maximum = projections.max(axis=0)
+        volume = float(numpy.prod(maximum - minimum))
+        if best_box is None or volume < best_box[0]:
+            best_box = (volume, axes, minimum, maximum)
+    if best_box is None:
+        return None
+
+    # The best orientation is rotated a little further where that makes the box smaller, because the smallest box
+    # does not always have a face against the hull, and the orientations without a hull are only a coarse sample
+    axes = _refineAxes(reduced, best_box[1])
+    projections = points.dot(axes.T)
+    minimum = projections.min(axis=0)
+    maximum = projections.max(axis=0)
+    if float(numpy.prod(maximum - minimum)) < best_box[0]:
+        best_box = (float(numpy.prod(maximum - minimum)), axes, minimum, maximum)
+    _, axes, minimum, maximum = best_box
+    extents = maximum - minimum
+    order = numpy.argsort(-extents, kind="stable")
+    center = ((minimum + maximum) / 2).dot(axes)
+    axes = axes[order]
+    extents = extents[order]
+
+    # Smallest width: the distance between the two planes against the hull, along the normal of one of its faces or
+    # across a pair of its edges
+    edge_pair_directions = _getEdgePairDirections(reduced, is_cancelled)
+    if edge_pair_directions is None:
+        return None
+    normals_array = numpy.concatenate([numpy.array(normals).reshape(-1, 3), axes, edge_pair_directions])
+    widths = _getExtents(reduced, normals_array)
+    minimum_width = numpy.inf
+    minimum_width_direction = axes[2]
+    for index in numpy.argsort(widths)[:_RefinedCandidateCount * 2]:
+        width = float(numpy.ptp(points.dot(normals_array[index])))
+        if width < minimum_width:
+            minimum_width = width
+            minimum_width_direction = normals_array[index]
+
+    return CaliperMeasurement(
+        center, axes, extents, minimum_width, minimum_width_direction, _getDiameterPoints(points, reduced)
+    )
+
+
+##  Get the directions across the pairs of edges of the convex hull of points that the hull lies between two parallel
+#   planes through both edges of.
+#   The two planes that are closest together and enclose the hull either touch a face of the hull, or touch two edges
+#   of the hull that are antipodal: the direction across both edges lies between the normals of the faces at one edge,
+#   and the opposite direction between the normals of the faces at the other edge.
+#   \return The directions, as an array of shape (directions, 3), or None if finding them was cancelled.
+def _getEdgePairDirections(points: numpy.ndarray, is_cancelled: Optional[Callable[[], bool]]) -> Optional[numpy.ndarray]:
+    hull_faces = _getHullFaces(points)
+    if hull_faces is None:
+        return numpy.zeros((0, 3))
+    face_normals, starts, ends, faces, others = hull_faces
+
+    # A direction across an edge is between the normals of its faces if it is on the inner side of both, in the plane
+    # across the edge. Edges between faces in the same plane have no directions of their own.
+    edges = points[ends] - points[starts]
+    first_normals = face_normals[faces]
+    second_normals = face_normals[others]
+    turns = numpy.einsum("ij,ij->i", numpy.cross(first_normals, second_normals), edges)
+    keep = numpy.abs(turns) > 1e-9 * numpy.linalg.norm(edges, axis=1)
+    signs = numpy.sign(turns[keep])[:, numpy.newaxis]
+    edges = edges[keep]
+    first_normals = first_normals[keep]
+    second_normals = second_normals[keep]
+    first_sides = numpy.cross(edges, first_normals) * signs
+    second_sides = numpy.cross(second_normals, edges) * signs
+    first_sides /= numpy.linalg.norm(first_sides, axis=1)[:, numpy.newaxis]
+    second_sides /= numpy.linalg.norm(second_sides, axis=1)[:, numpy.newaxis]
+
+    # Two edges can only be antipodal if the cones around the normals of their faces point in nearly opposite directions
+    centers = first_normals + second_normals
+    centers /= numpy.maximum(numpy.linalg.norm(centers, axis=1), 1e-12)[:, numpy.newaxis]
+    radii = numpy.arccos(numpy.clip(numpy.einsum("ij,ij->i", centers, first_normals), -1, 1)) + 1e-6
+    radius_cosines = numpy.cos(radii)
+    radius_sines = numpy.sin(radii)
+
+    directions = []  # type: List[numpy.ndarray]
+    chunk_size = max(1, _EdgePairChunkSize // max(1, len(edges)))
+    for start in range(0, len(edges), chunk_size):
+        if is_cancelled is not None and is_cancelled():
+            return None
+        # The angle between the centers is at most the sum of the radii, which are at most a quarter turn each
+        chunk = slice(start, start + chunk_size)
+        limits = numpy.outer(radius_cosines[chunk], radius_cosines) - numpy.outer(radius_sines[chunk], radius_sines)
+        rows, columns = numpy.nonzero(-centers[chunk].dot(centers.T) >= limits)
+        rows += start
+        pairs = rows < columns
+        rows, columns = rows[pairs], columns[pairs]
+
+        crossed = numpy.cross(edges[rows], edges[columns])
+        lengths = numpy.linalg.norm(crossed, axis=1)
+        valid = lengths > 1e-9 * numpy.linalg.norm(edges[rows], axis=1) * numpy.linalg.norm(edges[columns], axis=1)
+        crossed = crossed[valid] / lengths[valid, numpy.newaxis]
+        rows, columns = rows[valid], columns[valid]
+
+        # The direction is between the normals at the first edge and the opposite direction between those at the
+        # second edge, or the other way around
+        first_a = numpy.einsum("ij,ij->i", crossed, first_sides[rows])
+        first_b = numpy.einsum("ij,ij->i", crossed, second_sides[rows])
+        second_a = numpy.einsum("ij,ij->i", crossed, first_sides[columns])
+        second_b = numpy.einsum("ij,ij->i", crossed, second_sides[columns])
+        tolerance = 1e-9
+        forward = (first_a >= -tolerance) & (first_b >= -tolerance) & (second_a <= tolerance) & (second_b <= tolerance)
+        backward = (first_a <= tolerance) & (first_b <= tolerance) & (second_a >= -tolerance) & (second_b >= -tolerance)
+        directions.append(crossed[forward | backward])
+
+    if not directions:
+        return numpy.zeros((0, 3))
+    return numpy.concatenate(directions)
+
+
+##  Rotate the axes of a box around each of them in turn, in steps of decreasing size, as long as that makes the box
+#   around the points smaller.
+def _refineAxes(points: numpy.ndarray, axes: numpy.ndarray) -> numpy.ndarray:
+    volume = float(numpy.prod(_getExtents(points, axes)))
+    step = numpy.radians(_RefineStartAngle)
+    while step > numpy.radians(_RefineEndAngle):
+        improved = False
+        for axis in range(3):
+            for angle in (step, -step):
+                cosine = numpy.cos(angle)
+                sine = numpy.sin(angle)
+                first = (axis + 1) % 3
+                second = (axis + 2) % 3
+                rotated = axes.copy()
+                rotated[first] = cosine * axes[first] + sine * axes[second]
+                rotated[second] = cosine * axes[second] - sine * axes[first]
+                rotated_volume = float(numpy.prod(_getExtents(points, rotated)))
+                if rotated_volume < volume:
+                    axes = rotated
+                    volume = rotated_volume
+                    improved = True
+                    break
+        if not improved:
+            step /= 2
+    return axes
+
+
+##  Get the two points that are farthest apart.
+#   The farthest pair of the reduced points is found exhaustively, and then improved by alternately moving either
+#   point to the point of all points that is farthest from the other.
+def _getDiameterPoints(points: numpy.ndarray, reduced: numpy.ndarray) -> numpy.ndarray:
+    squared_norms = (reduced * reduced).sum(axis=1)
+    distances = squared_norms[:, numpy.newaxis] + squared_norms[numpy.newaxis, :] - 2 * reduced.dot(reduced.T)
+    first, second = numpy.unravel_index(int(numpy.argmax(distances)), distances.shape)
+    pair = numpy.array([reduced[first], reduced[second]])
+    best = float(numpy.linalg.norm(pair[1] - pair[0]))
+
+    for _ in range(4):
+        farthest = points[int(numpy.argmax(numpy.linalg.norm(points - pair[0], axis=1)))]
+        distance = float(numpy.linalg.norm(farthest - pair[0]))
+        if distance <= best * (1 + 1e-12):
+            break
+        best = distance
+        pair = numpy.array([farthest, pair[0]])
+    return pair
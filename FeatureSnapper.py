@@ -0,0 +1,74 @@
+# Copyright (c) 2023 Aldo Hoeben / fieldOfView
+# MeasureTool is released under the terms of the AGPLv3 or higher.
+
+from .GeometryCache import GeometryCache, NodeGeometry
+from .MeshFeatures import MeshFeatures
+from .VertexIndex import VertexIndex
+
+import numpy
+
+from typing import Iterable, List, Optional
+
+
+##  Snaps positions that are picked on a model to the nearest feature of that model.
+#
+#   Only the node that was hit is snapped to, so a picked position never jumps to a neighbouring model. Vertices are
+#   the corners of the triangle that was hit. The other features are looked up within a distance of the position, and
+#   those behind the plane of the triangle that was hit are left out, so features on the far side of a thin wall are
+#   not snapped to.
+#
+#   The feature points and their VertexIndex are in the local space of each mesh and kept with the mesh geometry, so
+#   they are built once per mesh (in the background, by the IndexBuilder) and survive changes of the transformation of
+#   a node. The picked position is transformed to the local space of the mesh to query the index.
+class FeatureSnapper:
+    PlaneTolerance = 0.01  # distance in mm that a feature may be behind the plane of the triangle that was hit
+
+    def __init__(self, geometry_cache: Optional[GeometryCache] = None) -> None:
+        self._geometry_cache = geometry_cache if geometry_cache is not None else GeometryCache()
+
+    ##  Get the index of the local space feature points of the mesh of a node.
+    def getIndex(self, node_geometry: NodeGeometry, feature: str = MeshFeatures.Vertices) -> VertexIndex:
+        return node_geometry.mesh_geometry.getFeatureIndex(feature)
+
+    ##  Find the world space feature points of a node within a distance of a world space position.
+    def queryRadius(self, node_geometry: NodeGeometry, feature: str, position: numpy.ndarray, radius: float) -> numpy.ndarray:
+        # A distance in world space is at least the smallest scale of the transformation times that in local space
+        minimum_scale = node_geometry.getDerived(
+            "minimum_scale", lambda: float(numpy.linalg.svd(node_geometry.transformation[:3, :3], compute_uv=False).min())
+        )
+        local_position = node_geometry.inverseTransformPoints(position[numpy.newaxis])[0]
+        points = self.getIndex(node_geometry, feature).queryRadius(local_position, radius / max(minimum_scale, 1e-12))
+        points = node_geometry.transformPoints(points)
+        return points[numpy.linalg.norm(points - position, axis=1) <= radius]
+
+    ##  Find the feature point to snap a picked position to.
+    #   \param node_geometry The geometry of the node that was hit.
+    #   \param triangle_id The index of the triangle that was hit, in the mesh data of the node.
+    #   \param position The world space position that was hit.
+    #   \param view_position The world space position the model is looked at from, to tell the front of the triangle.
+    #   \param max_distance The distance from the position within which features other than vertices are snapped to.
+    #   \param features The types of features to snap to.
+    #   \return The world space position of the nearest feature point, or None if there is none.
+    def snap(self, node_geometry: NodeGeometry, triangle_id: int, position: numpy.ndarray, view_position: numpy.ndarray, max_distance: float, features: Iterable[str] = (MeshFeatures.Vertices, )) -> Optional[numpy.ndarray]:
+        position = numpy.asarray(position, dtype=numpy.float64)
+
+        corners = node_geometry.transformPoints(node_geometry.mesh_geometry.getTriangles(numpy.array([triangle_id]))[0])
+        normal = numpy.cross(corners[1] - corners[0], corners[2] - corners[0])
+        if numpy.dot(normal, numpy.asarray(view_position) - position) < 0:
+            normal = -normal
+        normal /= max(float(numpy.linalg.norm(normal)), 1e-12)
+
+        candidates = []  # type: List[numpy.ndarray]
+        for feature in features:
+            if feature == MeshFeatures.Vertices:
+                candidates.append(corners)
+                continue
+            points = self.queryRadius(node_geometry, feature, position, max_distance)
+            candidates.append(points[(points - position).dot(normal) >= -FeatureSnapper.PlaneTolerance])
+
+        if not candidates:
+            return None
+        points = numpy.concatenate(candidates)
+        if len(points) == 0:
+            return None
+        return points[numpy.argmin(numpy.linalg.norm(points - position, axis=1))]
@@ -0,0 +1,799 @@
+# Copyright (c) 2023 Aldo Hoeben / fieldOfView
+# MeasureTool is released under the terms of the AGPLv3 or higher.
+
+from .GeometryCache import MeshGeometry, NodeGeometry
+
+import heapq
+import math
+import numpy
+import threading
+
+try:
+    from scipy.sparse import csr_matrix
+    from scipy.sparse.csgraph import dijkstra
+except ImportError:
+    dijkstra = None
+
+from typing import Callable, List, Optional, Tuple
+
+
+##  The shortest path over the surface of a mesh between two points.
+class SurfacePath:
+    def __init__(self, distance: float, points: numpy.ndarray) -> None:
+        self.distance = distance  # length of the path in world space, in mm
+        self.points = points  # the points along the path, in the local space of the mesh, starting at the source
+
+
+##  A graph of paths over the surface of a mesh, for finding the shortest path between two points on the surface.
+#
+#   The vertices of the graph are the unique vertices of the mesh. Besides the edges of the mesh, the graph has an
+#   edge between the opposite corners of every pair of triangles that share an edge, if the straight line between
+#   them crosses the shared edge when the triangles are unfolded into a plane. Those edges let paths cut across
+#   faces instead of following the zigzag of the triangle edges, but paths over the graph are still several percent
+#   longer than the true geodesic distance.
+#
+#   So the path over the graph is only used to find a corridor of triangles around the shortest path: the triangles
+#   at the vertices through which a path is at most CorridorFactor times as long. A finer graph is built on the
+#   corridor, with extra points on each edge and an edge between every two points on different edges of the same
+#   triangle; small corridors get more points per edge than large ones. The path over the finer graph is then
+#   straightened: the triangles it crosses are unfolded into a plane, where the shortest path through them is found,
+#   and where that path bends around a vertex while the other side of the vertex is shorter, it is moved to the other
+#   side and straightened again. The result is usually within a fraction of a percent of the true geodesic distance,
+#   and never shorter than it, because every segment of the path runs across a single triangle.
+#
+#   The edge lengths are world space lengths, so a graph is valid for all nodes with the same mesh and scale; it does
+#   not depend on the position or rotation of a node. Finding paths is guarded by a lock, so a graph can be used by
+#   background jobs.
+#
+#   The shortest paths are found with Dijkstra's algorithm, limited to a distance from the source that is increased
+#   until the target is found. The distances from the last source are kept. Finding the corridor also needs the
+#   distances from the target, so when only the target moves (such as when dragging one end of a measurement), paths
+#   can be found without refining them: the path over the graph then follows from the kept distances, and only the
+#   triangles around it are used as the corridor.
+class SurfaceGraph:
+    InitialLimitFactor = 1.5  # the first search is limited to this factor times the straight distance
+    CorridorFactor = 1.05  # the corridor holds the vertices through which a path is at most this much longer
+    MinimumSteinerPoints = 2  # smallest number of points added on each edge of the corridor
+    MaximumSteinerPoints = 8  # largest number of points added on each edge of the corridor
+    CorridorEdgeBudget = 150000  # the number of points per edge is the largest that keeps the finer graph this small
+    StraightenIterations = 200  # maximum number of passes over the points of the path when it cannot be unfolded
+    StraightenTolerance = 1e-7  # straightening stops when no point moves more than this fraction of the path length
+    FlipRounds = 20  # maximum number of times the path is moved to the other side of vertices and straightened again
+    FlipTolerance = 1e-6  # moving the path stops when it shortens the path by less than this fraction of its length
+    CoarseFlipTolerance = 1e-4  # the same, for paths that are not refined
+    MaximumFanSize = 64  # maximum number of edges at a vertex that a path is moved across
+
+    def __init__(self, mesh_geometry: MeshGeometry, linear_transformation: numpy.ndarray) -> None:
+        self._mesh_geometry = mesh_geometry
+        self._linear_transformation = numpy.array(linear_transformation, dtype=numpy.float64)
+
+        features = mesh_geometry.getFeatures()
+        self._vertices = features.getVertices()
+        self._vertex_map = features.getVertexMap()
+        self._faces = features.getFaces()
+        self._world_vertices = self._vertices.dot(self._linear_transformation.T)
+
+        edges_a, edges_b, lengths = _getSurfaceEdges(self._world_vertices, self._faces)
+
+        # A symmetric adjacency matrix in compressed sparse row format, with an extra vertex at the end that is
+        # connected to the corners of the triangle of the source of a search
+        vertex_count = len(self._vertices)
+        self._source_vertex = vertex_count
+        rows = numpy.concatenate([edges_a, edges_b, numpy.full(3, vertex_count)])
+        columns = numpy.concatenate([edges_b, edges_a, numpy.zeros(3, dtype=numpy.int64)])
+        weights = numpy.concatenate([lengths, lengths, numpy.ones(3)])
+        order = numpy.argsort(rows, kind="stable")
+        self._indptr = numpy.concatenate([[0], numpy.cumsum(numpy.bincount(rows, minlength=vertex_count + 1))])
+        self._indices = columns[order].astype(numpy.int32)
+        self._weights = weights[order]
+        self._matrix = None
+        self._adjacency_lists = None  # type: Optional[Tuple[List[int], List[int], List[float]]]
+
+        # Distances from the last source, which are exact up to the limit
+        self._tree_source = None  # type: Optional[Tuple[int, float, float]]
+        self._tree = None  # type: Optional[Tuple[numpy.ndarray, numpy.ndarray, float]]
+
+        self._lock = threading.Lock()
+
+    def getEdgeCount(self) -> int:
+        return (len(self._indices) - 3) // 2
+
+    ##  Find the shortest path over the surface between two points.
+    #   \param source, target The points, as a tuple of the index of the triangle in the mesh data that they are on
+    #   and their barycentric coordinates (u, v) within that triangle.
+    #   \param is_cancelled A function that is called between the stages of the search, to stop searching.
+    #   \param refine Whether to search the whole corridor of paths that are not much longer than the path over the
+    #   graph. Otherwise only the faces around the path over the graph are searched, which is much faster but can miss
+    #   a shorter path, for example while one of the points is dragged.
+    #   \return The path, or None if there is no path between the points over the surface or the search was cancelled.
+    def findPath(self, source: Tuple[int, Tuple[float, float]], target: Tuple[int, Tuple[float, float]], is_cancelled: Optional[Callable[[], bool]] = None, refine: bool = True) -> Optional[SurfacePath]:
+        with self._lock:
+            source_corners, source_point = self._getTrianglePoint(*source)
+            target_corners, target_point = self._getTrianglePoint(*target)
+            if source[0] == target[0]:
+                distance = self._getDistances(source_point, target_point[numpy.newaxis])[0]
+                return SurfacePath(distance, numpy.array([source_point, target_point]))
+
+            source_key = (int(source[0]), float(source[1][0]), float(source[1][1]))
+            graph_distance = self._searchSource(source_key, source_corners, source_point, target_corners, target_point)
+            if graph_distance is None or (is_cancelled is not None and is_cancelled()):
+                return None
+
+            vertex_count = len(self._vertices)
+            if refine:
+                # The vertices through which a path is not much longer than the path over the graph
+                limit = SurfaceGraph.CorridorFactor * graph_distance
+                if self._tree[2] < limit:
+                    self._tree = self._search(source_corners, self._getDistances(source_point, self._vertices[source_corners]), limit)
+                target_distances = self._search(target_corners, self._getDistances(target_point, self._vertices[target_corners]), limit)[0]
+                if is_cancelled is not None and is_cancelled():
+                    return None
+                corridor = self._tree[0][:vertex_count] + target_distances[:vertex_count] <= limit
+            else:
+                # The vertices of the path over the graph, which is known from the distances from the source
+                corridor = numpy.zeros(vertex_count, dtype=bool)
+                corridor[self._getTreePath(target_corners, target_point)] = True
+            corridor[source_corners] = True
+            corridor[target_corners] = True
+
+            return self._findCorridorPath(
+                self._faces[corridor[self._faces].any(axis=1)], source_corners, source_point, target_corners, target_point, is_cancelled,
+                SurfaceGraph.FlipTolerance if refine else SurfaceGraph.CoarseFlipTolerance
+            )
+
+    ##  Find the distances from the source over the graph, far enough to reach the target.
+    #   \return The distance from the source to the target over the graph, or None if they are not connected.
+    def _searchSource(self, source_key: Tuple[int, float, float], source_corners: numpy.ndarray, source_point: numpy.ndarray, target_corners: numpy.ndarray, target_point: numpy.ndarray) -> Optional[float]:
+        straight_distance = self._getDistances(source_point, target_point[numpy.newaxis])[0]
+        target_offsets = self._getDistances(target_point, self._vertices[target_corners])
+        limit = 0.0
+        if self._tree_source == source_key and self._tree is not None:
+            limit = self._tree[2]
+        else:
+            self._tree = None
+
+        while True:
+            if self._tree is not None:
+                distances, _, limit = self._tree
+                distance = float(numpy.min(distances[target_corners] + target_offsets))
+                if distance <= limit:
+                    return distance
+                if limit == numpy.inf:
+                    return None  # the points are on parts of the mesh that are not connected
+
+            # Search again, further from the source than before
+            limit = max(2 * limit, SurfaceGraph.InitialLimitFactor * straight_distance, 1e-3)
+            if limit > 2 * self._weights.sum():
+                limit = numpy.inf
+            self._tree = self._search(source_corners, self._getDistances(source_point, self._vertices[source_corners]), limit)
+            self._tree_source = source_key
+
+    ##  Get the vertices of the path over the graph from the source to the corner of the target triangle it reaches the
+    #   target through, using the distances from the source.
+    def _getTreePath(self, target_corners: numpy.ndarray, target_point: numpy.ndarray) -> List[int]:
+        distances, predecessors, _ = self._tree
+        vertex = int(target_corners[numpy.argmin(distances[target_corners] + self._getDistances(target_point, self._vertices[target_corners]))])
+        vertices = []  # type: List[int]
+        while 0 <= vertex < self._source_vertex:
+            vertices.append(vertex)
+            vertex = int(predecessors[vertex])
+        return vertices
+
+    ##  Find the shortest path between two points over a graph of points on the edges of a corridor of faces, and
+    #   straighten it.
+    #   \param flip_tolerance The fraction of its length by which moving the path around vertices has to shorten it.
+    def _findCorridorPath(self, faces: numpy.ndarray, source_corners: numpy.ndarray, source_point: numpy.ndarray, target_corners: numpy.ndarray, target_point: numpy.ndarray, is_cancelled: Optional[Callable[[], bool]], flip_tolerance: float) -> Optional[SurfacePath]:
+        # Number the points on the edges of the corridor, followed by the source and the target. The vertices are left
+        # out, so every point of the path between the source and the target is on an edge, and can be moved along it;
+        # a path through a vertex ends up with a point at the end of an edge.
+        steiner_count = SurfaceGraph.MinimumSteinerPoints
+        while steiner_count < SurfaceGraph.MaximumSteinerPoints and len(faces) * _getFaceEdgeCount(steiner_count + 1) <= SurfaceGraph.CorridorEdgeBudget:
+            steiner_count += 1
+        vertex_count = len(self._vertices)
+        edge_keys = numpy.sort(numpy.stack([faces, numpy.roll(faces, -1, axis=1)], axis=2), axis=2)
+        edge_keys = edge_keys[..., 0] * vertex_count + edge_keys[..., 1]
+        unique_edge_keys, face_edges = numpy.unique(edge_keys, return_inverse=True)
+        face_edges = face_edges.reshape(-1, 3)
+        edges = numpy.stack([unique_edge_keys // vertex_count, unique_edge_keys % vertex_count], axis=1)
+        source_node = len(edges) * steiner_count
+        target_node = source_node + 1
+
+        # The points on the edges, as the edge they are on and the fraction of the way along it
+        fractions = numpy.arange(1, steiner_count + 1) / (steiner_count + 1)
+        point_edges = numpy.repeat(numpy.arange(len(edges)), steiner_count)
+        point_fractions = numpy.tile(fractions, len(edges))
+        world_points = numpy.concatenate([
+            self._world_vertices[edges[point_edges, 0]] * (1 - point_fractions)[:, numpy.newaxis]
+            + self._world_vertices[edges[point_edges, 1]] * point_fractions[:, numpy.newaxis],
+            [source_point.dot(self._linear_transformation.T), target_point.dot(self._linear_transformation.T)]
+        ])
+
+        # Connect every two points on different edges of the same face, the points along each edge, and the source and
+        # the target to the points on their faces. No two points are connected twice, so there are no duplicate edges.
+        valid_faces = (face_edges[:, 0] != face_edges[:, 1]) & (face_edges[:, 1] != face_edges[:, 2]) & (face_edges[:, 2] != face_edges[:, 0])
+        face_nodes = (face_edges[valid_faces, :, numpy.newaxis] * steiner_count + numpy.arange(steiner_count)).reshape(-1, 3 * steiner_count)
+        firsts, seconds = numpy.triu_indices(face_nodes.shape[1], 1)
+        different_edges = firsts // steiner_count != seconds // steiner_count
+        firsts, seconds = firsts[different_edges], seconds[different_edges]
+        edge_nodes = numpy.arange(len(edges) * steiner_count).reshape(-1, steiner_count)
+        starts = [face_nodes[:, firsts].ravel(), edge_nodes[:, :-1].ravel()]
+        ends = [face_nodes[:, seconds].ravel(), edge_nodes[:, 1:].ravel()]
+        for node, corners in ((source_node, source_corners), (target_node, target_corners)):
+            corner_keys = numpy.sort(numpy.stack([corners, numpy.roll(corners, -1)], axis=1), axis=1)
+            corner_edges = numpy.searchsorted(unique_edge_keys, corner_keys[:, 0] * vertex_count + corner_keys[:, 1])
+            nodes = (corner_edges[:, numpy.newaxis] * steiner_count + numpy.arange(steiner_count)).ravel()
+            starts.append(nodes)
+            ends.append(numpy.full(len(nodes), node))
+        starts = numpy.concatenate(starts)
+        ends = numpy.concatenate(ends)
+        node_count = target_node + 1
+        lengths = numpy.maximum(numpy.linalg.norm(world_points[ends] - world_points[starts], axis=1), 1e-12)
+        if is_cancelled is not None and is_cancelled():
+            return None
+
+        if dijkstra is not None:
+            matrix = csr_matrix((lengths, (starts, ends)), shape=(node_count, node_count))
+            distances, predecessors = dijkstra(matrix, directed=False, indices=source_node, return_predecessors=True)
+        else:
+            rows = numpy.concatenate([starts, ends])
+            columns = numpy.concatenate([ends, starts])
+            weights = numpy.concatenate([lengths, lengths])
+            order = numpy.argsort(rows, kind="stable")
+            indptr = numpy.concatenate([[0], numpy.cumsum(numpy.bincount(rows, minlength=node_count))])
+            distances, predecessors = _dijkstra(indptr.tolist(), columns[order].tolist(), weights[order].tolist(), source_node, numpy.inf)
+        if distances[target_node] == numpy.inf:
+            return None
+
+        nodes = [target_node]
+        while nodes[-1] != source_node:
+            nodes.append(int(predecessors[nodes[-1]]))
+        nodes = numpy.array(nodes[::-1])
+        if is_cancelled is not None and is_cancelled():
+            return None
+
+        # Straighten the path, given as the edge that each point between the source and the target is on and the
+        # distance of the point from the first vertex of that edge
+        corridor = _Corridor(faces, face_edges, unique_edge_keys, vertex_count)
+        path_edges = edges[point_edges[nodes[1:-1]]]
+        along = point_fractions[nodes[1:-1]] * numpy.linalg.norm(
+            self._world_vertices[path_edges[:, 1]] - self._world_vertices[path_edges[:, 0]], axis=1
+        )
+        path_edges, along = _straightenPath(
+            self._world_vertices, corridor, world_points[source_node], corridor.getTriangleFace(source_corners),
+            world_points[target_node], corridor.getTriangleFace(target_corners), path_edges, along,
+            SurfaceGraph.StraightenTolerance * max(float(distances[target_node]), 1e-12), flip_tolerance
+        )
+
+        # The distance along the edges as a fraction, which is the same in the local space of the mesh
+        fractions = along / numpy.maximum(numpy.linalg.norm(
+            self._world_vertices[path_edges[:, 1]] - self._world_vertices[path_edges[:, 0]], axis=1
+        ), 1e-12)
+        world_path = numpy.concatenate([
+            [world_points[source_node]],
+            self._world_vertices[path_edges[:, 0]] * (1 - fractions)[:, numpy.newaxis]
+            + self._world_vertices[path_edges[:, 1]] * fractions[:, numpy.newaxis],
+            [world_points[target_node]]
+        ])
+        local_path = numpy.concatenate([
+            [source_point],
+            self._vertices[path_edges[:, 0]] * (1 - fractions)[:, numpy.newaxis]
+            + self._vertices[path_edges[:, 1]] * fractions[:, numpy.newaxis],
+            [target_point]
+        ])
+
+        # Points that ended up at the same place, such as at a vertex, are not needed
+        segment_lengths = numpy.linalg.norm(numpy.diff(world_path, axis=0), axis=1)
+        keep = numpy.concatenate([[True], segment_lengths > 1e-9])
+        return SurfacePath(float(segment_lengths.sum()), local_path[keep])
+
+    ##  Get the indices of the unique vertices at the corners of a triangle, and the local position of a point in it.
+    def _getTrianglePoint(self, triangle_id: int, barycentric: Tuple[float, float]) -> Tuple[numpy.ndarray, numpy.ndarray]:
+        corners = self._vertex_map[self._mesh_geometry.getTriangleCorners(numpy.array([triangle_id]))[0]]
+        u, v = barycentric
+        point = (1 - u - v) * self._vertices[corners[0]] + u * self._vertices[corners[1]] + v * self._vertices[corners[2]]
+        return corners, point
+
+    ##  Get the world space distances from a local point to other local points.
+    def _getDistances(self, point: numpy.ndarray, points: numpy.ndarray) -> numpy.ndarray:
+        return numpy.linalg.norm((points - point).dot(self._linear_transformation.T), axis=1)
+
+    ##  Find the distances from the source to the vertices of the graph, up to a limit.
+    #   \return The distances (inf beyond the limit), the predecessor of each vertex on its shortest path and the limit.
+    def _search(self, source_corners: numpy.ndarray, source_offsets: numpy.ndarray, limit: float) -> Tuple[numpy.ndarray, numpy.ndarray, float]:
+        # Connect the extra vertex to the corners of the triangle of the source
+        self._indices[-3:] = source_corners
+        self._weights[-3:] = numpy.maximum(source_offsets, 1e-12)  # zero weights would not be seen as edges
+
+        if dijkstra is not None:
+            if self._matrix is None:
+                vertex_count = len(self._indptr) - 1
+                self._matrix = csr_matrix((self._weights, self._indices, self._indptr), shape=(vertex_count, vertex_count))
+            else:
+                self._matrix.indices[-3:] = self._indices[-3:]
+                self._matrix.data[-3:] = self._weights[-3:]
+            distances, predecessors = dijkstra(
+                self._matrix, directed=True, indices=self._source_vertex, return_predecessors=True, limit=limit
+            )
+            return distances, predecessors, limit
+
+        return self._searchPython(limit)
+
+    ##  Dijkstra's algorithm in Python, for when scipy is not available.
+    def _searchPython(self, limit: float) -> Tuple[numpy.ndarray, numpy.ndarray, float]:
+        if self._adjacency_lists is None:
+            self._adjacency_lists = (self._indptr.tolist(), self._indices.tolist(), self._weights.tolist())
+        indptr, indices, weights = self._adjacency_lists
+        indices[-3:] = self._indices[-3:].tolist()
+        weights[-3:] = self._weights[-3:].tolist()
+
+        distances, predecessors = _dijkstra(indptr, indices, weights, self._source_vertex, limit)
+        return distances, predecessors, limit
+
+
+##  Dijkstra's algorithm in Python, for when scipy is not available.
+#   \param indptr, indices, weights The graph, as lists of the arrays of a matrix in compressed sparse row format.
+#   \return The distances from the source (inf beyond the limit) and the predecessor of each vertex on its shortest
+#   path, like scipy.sparse.csgraph.dijkstra() returns them.
+def _dijkstra(indptr: List[int], indices: List[int], weights: List[float], source: int, limit: float) -> Tuple[numpy.ndarray, numpy.ndarray]:
+    vertex_count = len(indptr) - 1
+    distances = [numpy.inf] * vertex_count
+    predecessors = [-9999] * vertex_count
+    distances[source] = 0.0
+    queue = [(0.0, source)]
+    while queue:
+        distance, vertex = heapq.heappop(queue)
+        if distance > distances[vertex]:
+            continue
+        if distance > limit:
+            break
+        for index in range(indptr[vertex], indptr[vertex + 1]):
+            neighbour = indices[index]
+            neighbour_distance = distance + weights[index]
+            if neighbour_distance < distances[neighbour]:
+                distances[neighbour] = neighbour_distance
+                predecessors[neighbour] = vertex
+                heapq.heappush(queue, (neighbour_distance, neighbour))
+
+    distances_array = numpy.array(distances)
+    distances_array[distances_array > limit] = numpy.inf
+    return distances_array, numpy.array(predecessors)
+
+
+##  Get the number of edges of the finer graph on a face, between every two points on different edges of the face.
+def _getFaceEdgeCount(steiner_count: int) -> int:
+    return 3 * steiner_count * steiner_count
+
+
+##  The faces of a corridor over a mesh, and the faces on either side of each of its edges.
+class _Corridor:
+    def __init__(self, faces: numpy.ndarray, face_edges: numpy.ndarray, edge_keys: numpy.ndarray, vertex_count: int) -> None:
+        self.faces = faces
+        self._edge_keys = edge_keys
+        self._vertex_count = vertex_count
+
+        # Edges that are on more than two faces are treated like edges on the boundary
+        edge_face_order = numpy.argsort(face_edges.ravel(), kind="stable")
+        counts = numpy.bincount(face_edges.ravel(), minlength=len(edge_keys))
+        firsts = numpy.concatenate([[0], numpy.cumsum(counts)[:-1]])
+        self._edge_faces = numpy.full((len(edge_keys), 2), -1, dtype=numpy.int64)
+        self._edge_faces[counts <= 2, 0] = edge_face_order[firsts[counts <= 2]] // 3
+        self._edge_faces[counts == 2, 1] = edge_face_order[firsts[counts == 2] + 1] // 3
+
+    ##  Get the faces on either side of the edge between two vertices, with -1 where there is none.
+    def getEdgeFaces(self, vertex: int, other_vertex: int) -> Tuple[int, int]:
+        key = min(vertex, other_vertex) * self._vertex_count + max(vertex, other_vertex)
+        index = int(numpy.searchsorted(self._edge_keys, key))
+        if index >= len(self._edge_keys) or self._edge_keys[index] != key:
+            return -1, -1
+        return int(self._edge_faces[index, 0]), int(self._edge_faces[index, 1])
+
+    ##  Get the faces on either side of each of a number of edges, given as an array of shape (edges, 2).
+    #   \return An array of shape (edges, 2), with -1 where there is no face.
+    def getEdgeFacesOf(self, edges: numpy.ndarray) -> numpy.ndarray:
+        keys = edges.min(axis=1) * self._vertex_count + edges.max(axis=1)
+        indices = numpy.minimum(numpy.searchsorted(self._edge_keys, keys), len(self._edge_keys) - 1)
+        return numpy.where((self._edge_keys[indices] == keys)[:, numpy.newaxis], self._edge_faces[indices], -1)
+
+    ##  Get the face that two edges are both on, or -1 if there is not exactly one such face.
+    def getCommonFace(self, edge: numpy.ndarray, other_edge: numpy.ndarray) -> int:
+        faces = set(self.getEdgeFaces(*edge)) & set(self.getEdgeFaces(*other_edge))
+        faces.discard(-1)
+        return faces.pop() if len(faces) == 1 else -1
+
+    ##  Get the face with the given corners, or -1 if it is not in the corridor.
+    def getTriangleFace(self, corners: numpy.ndarray) -> int:
+        return self.getCommonFace(corners[[0, 1]], corners[[1, 2]])
+
+
+##  Straighten a path over a corridor, keeping the points between the source and the target on edges.
+#
+#   The faces that the path crosses are unfolded into a plane, where the shortest path through them is found with the
+#   funnel algorithm; that path is straight except where it bends around a vertex. If the angle on the other side of
+#   such a vertex is smaller than the angle the path bends around, and smaller than 180 degrees, the path is shorter on
+#   the other side, so it is moved across the edges on that side of the vertex and straightened again.
+#   \param path_edges The vertices at the ends of the edge of each point, as an array of shape (points, 2).
+#   \param along The distance of each point from the first vertex of its edge.
+#   \param tolerance The distance in mm below which points that are slid along their edges are no longer moved.
+#   \param flip_tolerance The fraction of its length by which a round of moving the path has to shorten it to move
+#   it again.
+#   \return The edges and distances of the points of the straightened path.
+def _straightenPath(world_vertices: numpy.ndarray, corridor: _Corridor, source: numpy.ndarray, source_face: int, target: numpy.ndarray, target_face: int, path_edges: numpy.ndarray, along: numpy.ndarray, tolerance: float, flip_tolerance: float) -> Tuple[numpy.ndarray, numpy.ndarray]:
+    length = numpy.inf
+    for _ in range(SurfaceGraph.FlipRounds):
+        pulled = _pullString(world_vertices, corridor, source, source_face, target, target_face, path_edges)
+        if pulled is not None:
+            path_edges, along = pulled
+        else:
+            # The faces along the path could not be unfolded, for example where the mesh is not manifold
+            along = _slidePoints(world_vertices, source, target, path_edges, along, tolerance)
+
+        # Moving the path around vertices can take many rounds that barely shorten it, such as near a pole
+        previous_length = length
+        length = _getPathLength(world_vertices, source, target, path_edges, along)
+        if previous_length - length < flip_tolerance * length:
+            break
+        flipped = _flipAroundVertices(world_vertices, corridor, source, source_face, target, target_face, path_edges, along)
+        if flipped is None:
+            break
+        path_edges, along = flipped
+    return path_edges, along
+
+
+##  The length of a path, given as the edges that it crosses and the distance of each crossing along its edge.
+def _getPathLength(world_vertices: numpy.ndarray, source: numpy.ndarray, target: numpy.ndarray, path_edges: numpy.ndarray, along: numpy.ndarray) -> float:
+    edge_starts = world_vertices[path_edges[:, 0]]
+    edge_vectors = world_vertices[path_edges[:, 1]] - edge_starts
+    edge_lengths = numpy.maximum(numpy.linalg.norm(edge_vectors, axis=1), 1e-12)
+    world_path = numpy.concatenate([[source], edge_starts + (along / edge_lengths)[:, numpy.newaxis] * edge_vectors, [target]])
+    return float(numpy.linalg.norm(numpy.diff(world_path, axis=0), axis=1).sum())
+
+
+##  Find the shortest path through the faces that a path crosses, by unfolding those faces into a plane.
+#   \return The edges that the shortest path crosses and the distance of each crossing from the first vertex of its
+#   edge, or None if the faces that the path crosses do not form a sleeve from the source face to the target face.
+def _pullString(world_vertices: numpy.ndarray, corridor: _Corridor, source: numpy.ndarray, source_face: int, target: numpy.ndarray, target_face: int, path_edges: numpy.ndarray) -> Optional[Tuple[numpy.ndarray, numpy.ndarray]]:
+    # The edges (portals) that the path crosses, and the faces between them; crossing an edge back is left out. The
+    # faces are walked one at a time, so plain Python numbers are used instead of small arrays
+    portals = []  # type: List[Tuple[int, int]]
+    faces = [source_face]
+    for edge, edge_faces in zip(path_edges.tolist(), corridor.getEdgeFacesOf(path_edges).tolist()):
+        if portals and set(portals[-1]) == set(edge):
+            portals.pop()
+            faces.pop()
+            continue
+        if faces[-1] not in edge_faces:
+            return None
+        next_face = edge_faces[1] if edge_faces[0] == faces[-1] else edge_faces[0]
+        if next_face < 0:
+            return None
+        portals.append((edge[0], edge[1]))
+        faces.append(next_face)
+    if faces[-1] != target_face:
+        return None
+    if not portals:
+        return numpy.zeros((0, 2), dtype=numpy.int64), numpy.zeros(0)
+
+    sleeve_faces = corridor.faces[faces].tolist()
+    sleeve_vertices = numpy.unique(corridor.faces[faces])
+    world_points = dict(zip(sleeve_vertices.tolist(), world_vertices[sleeve_vertices].tolist()))
+
+    # Unfold the faces into a plane, starting with the first edge along the first axis and the source face above it
+    def getThirdVertex(face_index: int, edge: Tuple[int, int]) -> int:
+        return next(corner for corner in sleeve_faces[face_index] if corner != edge[0] and corner != edge[1])
+
+    def unfold(point: List[float], edge: Tuple[int, int], behind: Tuple[float, float]) -> Tuple[float, float]:
+        start, end = positions[edge[0]], positions[edge[1]]
+        length = max(math.hypot(end[0] - start[0], end[1] - start[1]), 1e-12)
+        direction = ((end[0] - start[0]) / length, (end[1] - start[1]) / length)
+        world_start, world_end = world_points[edge[0]], world_points[edge[1]]
+        world_length = max(math.dist(world_start, world_end), 1e-12)
+        world_direction = [(b - a) / world_length for a, b in zip(world_start, world_end)]
+        offset = [b - a for a, b in zip(world_start, point)]
+        along = sum(a * b for a, b in zip(offset, world_direction))
+        height = math.hypot(*(a - along * b for a, b in zip(offset, world_direction)))
+        if (behind[1] - start[1]) * direction[0] - (behind[0] - start[0]) * direction[1] > 0:
+            height = -height
+        return start[0] + along * direction[0] - height * direction[1], start[1] + along * direction[1] + height * direction[0]
+
+    first = portals[0]
+    positions = {
+        first[0]: (0.0, 0.0),
+        first[1]: (math.dist(world_points[first[0]], world_points[first[1]]), 0.0)
+    }
+    below = (0.0, -1.0)
+    third = getThirdVertex(0, first)
+    positions[third] = unfold(world_points[third], first, below)
+    source_point = unfold(source.tolist(), first, below)
+    portal_points = [(source_point, source_point)]  # the ends of each edge, on the same side in the direction of travel
+    for index, portal in enumerate(portals):
+        behind = positions[getThirdVertex(index, portal)]
+        start, end = positions[portal[0]], positions[portal[1]]
+        if (end[0] - start[0]) * (behind[1] - start[1]) - (end[1] - start[1]) * (behind[0] - start[0]) > 0:
+            portal_points.append((end, start))
+        else:
+            portal_points.append((start, end))
+        if index + 1 < len(portals):
+            third = getThirdVertex(index + 1, portal)
+            positions[third] = unfold(world_points[third], portal, behind)
+    target_point = unfold(target.tolist(), portals[-1], positions[getThirdVertex(len(portals) - 1, portals[-1])])
+    portal_points.append((target_point, target_point))
+
+    # The funnel algorithm, with the source and the target as edges of zero length
+    apexes = [(0, source_point)]  # the index of the edge and the position of each point where the path bends
+    apex, apex_index = source_point, 0
+    funnel_left, funnel_right = apex, apex
+    left_index, right_index = 0, 0
+    index = 1
+    while index < len(portal_points):
+        left, right = portal_points[index]
+        if _getSignedArea(apex, funnel_right, right) <= 0:
+            if apex == funnel_right or _getSignedArea(apex, funnel_left, right) > 0:
+                funnel_right, right_index = right, index
+            else:
+                apex, apex_index = funnel_left, left_index
+                apexes.append((apex_index, apex))
+                funnel_left, funnel_right, left_index, right_index = apex, apex, apex_index, apex_index
+                index = apex_index + 1
+                continue
+        if _getSignedArea(apex, funnel_left, left) >= 0:
+            if apex == funnel_left or _getSignedArea(apex, funnel_right, left) < 0:
+                funnel_left, left_index = left, index
+            else:
+                apex, apex_index = funnel_right, right_index
+                apexes.append((apex_index, apex))
+                funnel_left, funnel_right, left_index, right_index = apex, apex, apex_index, apex_index
+                index = apex_index + 1
+                continue
+        index += 1
+    apexes.append((len(portal_points) - 1, target_point))
+
+    # Where the straight parts of the path between the points where it bends cross the edges
+    fractions = numpy.zeros(len(portals))
+    for (start_index, start_point), (end_index, end_point) in zip(apexes[:-1], apexes[1:]):
+        segment = (end_point[0] - start_point[0], end_point[1] - start_point[1])
+        for index in range(start_index + 1, min(end_index, len(portals)) + 1):
+            start, end = positions[portals[index - 1][0]], positions[portals[index - 1][1]]
+            denominator = segment[0] * (end[1] - start[1]) - segment[1] * (end[0] - start[0])
+            if abs(denominator) > 1e-12:
+                fraction = (segment[0] * (start_point[1] - start[1]) - segment[1] * (start_point[0] - start[0])) / denominator
+            else:
+                fraction = 0.0 if math.dist(start_point, start) < math.dist(start_point, end) else 1.0
+            fractions[index - 1] = min(max(fraction, 0.0), 1.0)
+    portal_array = numpy.array(portals, dtype=numpy.int64)
+    return portal_array, fractions * numpy.linalg.norm(world_vertices[portal_array[:, 1]] - world_vertices[portal_array[:, 0]], axis=1)
+
+
+##  Get twice the signed area of a triangle in the plane, as the funnel algorithm uses it.
+def _getSignedArea(a: Tuple[float, float], b: Tuple[float, float], c: Tuple[float, float]) -> float:
+    return (c[0] - a[0]) * (b[1] - a[1]) - (b[0] - a[0]) * (c[1] - a[1])
+
+
+##  Move the points of a path along their edges until the path crosses every edge in a straight line.
+#   The points at even and odd positions along the path are moved in turns, so the neighbours of the points that are
+#   moved stay in place.
+def _slidePoints(world_vertices: numpy.ndarray, source: numpy.ndarray, target: numpy.ndarray, path_edges: numpy.ndarray, along: numpy.ndarray, tolerance: float) -> numpy.ndarray:
+    if len(path_edges) == 0:
+        return along
+    along = along.copy()
+    edge_starts = world_vertices[path_edges[:, 0]]
+    edge_vectors = world_vertices[path_edges[:, 1]] - edge_starts
+    edge_lengths = numpy.maximum(numpy.linalg.norm(edge_vectors, axis=1), 1e-12)
+    edge_directions = edge_vectors / edge_lengths[:, numpy.newaxis]
+    world_path = numpy.concatenate([[source], edge_starts + along[:, numpy.newaxis] * edge_directions, [target]])
+
+    points = numpy.arange(len(path_edges))
+    for _ in range(SurfaceGraph.StraightenIterations):
+        largest_move = 0.0
+        for parity in (0, 1):
+            selected = points[points % 2 == parity]
+            if len(selected) == 0:
+                continue
+            new_along = _getStraightCrossings(
+                world_path[selected], world_path[selected + 2],
+                edge_starts[selected], edge_directions[selected], edge_lengths[selected], along[selected]
+            )
+            largest_move = max(largest_move, float(numpy.abs(new_along - along[selected]).max()))
+            along[selected] = new_along
+            world_path[selected + 1] = edge_starts[selected] + new_along[:, numpy.newaxis] * edge_directions[selected]
+        if largest_move < tolerance:
+            break
+    return along
+
+
+##  Move the path to the other side of the vertices it bends around, where that is shorter.
+#   \return The edges and distances of the points of the new path, or None if the path was not changed.
+def _flipAroundVertices(world_vertices: numpy.ndarray, corridor: _Corridor, source: numpy.ndarray, source_face: int, target: numpy.ndarray, target_face: int, path_edges: numpy.ndarray, along: numpy.ndarray) -> Optional[Tuple[numpy.ndarray, numpy.ndarray]]:
+    edge_lengths = numpy.linalg.norm(world_vertices[path_edges[:, 1]] - world_vertices[path_edges[:, 0]], axis=1)
+    at_vertex = numpy.where(
+        along <= 1e-9 * edge_lengths, path_edges[:, 0], numpy.where(along >= (1 - 1e-9) * edge_lengths, path_edges[:, 1], -1)
+    )
+
+    new_edges = []  # type: List[numpy.ndarray]
+    new_along = []  # type: List[float]
+    flipped = False
+    last_flipped = -2
+    start = 0
+    while start < len(path_edges):
+        # A run of points at the same vertex
+        vertex = int(at_vertex[start])
+        end = start + 1
+        while vertex >= 0 and end < len(path_edges) and at_vertex[end] == vertex:
+            end += 1
+
+        replacement = None
+        if vertex >= 0 and start != last_flipped + 1:  # the point before the run must not have been moved already
+            previous = source if start == 0 else world_vertices[path_edges[start - 1, 0]] + (
+                world_vertices[path_edges[start - 1, 1]] - world_vertices[path_edges[start - 1, 0]]
+            ) * along[start - 1] / max(float(edge_lengths[start - 1]), 1e-12)
+            following = target if end == len(path_edges) else world_vertices[path_edges[end, 0]] + (
+                world_vertices[path_edges[end, 1]] - world_vertices[path_edges[end, 0]]
+            ) * along[end] / max(float(edge_lengths[end]), 1e-12)
+            entry_face = source_face if start == 0 else corridor.getCommonFace(path_edges[start - 1], path_edges[start])
+            exit_face = target_face if end == len(path_edges) else corridor.getCommonFace(path_edges[end - 1], path_edges[end])
+            if entry_face >= 0 and exit_face >= 0:
+                others = [int(edge[1] if edge[0] == vertex else edge[0]) for edge in path_edges[start:end]]
+                replacement = _flipAroundVertex(world_vertices, corridor, vertex, others, previous, entry_face, following, exit_face)
+
+        if replacement is None:
+            new_edges.extend(path_edges[start:end])
+            new_along.extend(along[start:end])
+        else:
+            new_edges.extend(replacement[0])
+            new_along.extend(replacement[1])
+            flipped = True
+            last_flipped = end - 1
+        start = end
+
+    if not flipped:
+        return None
+    return numpy.array(new_edges, dtype=numpy.int64).reshape(-1, 2), numpy.array(new_along, dtype=numpy.float64)
+
+
+##  Move a part of a path that bends around a vertex to the other side of the vertex, if that is shorter.
+#   \param others The other vertices of the edges that the path crosses at the vertex, in order.
+#   \param previous, following The points of the path before and after the vertex, on the entry and exit face.
+#   \return The edges and distances of the points on the other side, or None if the path is not shorter there.
+def _flipAroundVertex(world_vertices: numpy.ndarray, corridor: _Corridor, vertex: int, others: List[int], previous: numpy.ndarray, entry_face: int, following: numpy.ndarray, exit_face: int) -> Optional[Tuple[List[numpy.ndarray], List[float]]]:
+    center = world_vertices[vertex]
+    if numpy.linalg.norm(previous - center) < 1e-9 or numpy.linalg.norm(following - center) < 1e-9:
+        return None  # the path starts or ends at the vertex
+
+    # The faces around the vertex on the other side, from the entry face to the exit face
+    other_side = []  # type: List[int]
+    face = entry_face
+    crossed = others[0]
+    while face != exit_face:
+        corners = [int(corner) for corner in corridor.faces[face] if corner != vertex and corner != crossed]
+        if len(corners) != 1 or len(other_side) > SurfaceGraph.MaximumFanSize:
+            return None
+        crossed = corners[0]
+        other_side.append(crossed)
+        faces = corridor.getEdgeFaces(vertex, crossed)
+        face = faces[1] if faces[0] == face else faces[0]
+        if face < 0:
+            return None  # the vertex is on the boundary of the mesh or of the corridor
+
+    current_angle = _getFanAngle(world_vertices, center, previous, others, following)
+    other_angle = _getFanAngle(world_vertices, center, previous, other_side, following)
+    if other_angle >= min(numpy.pi, current_angle) - 1e-9:
+        return None
+
+    # Unfold the faces on the other side into a plane around the vertex, and cross the edges in a straight line
+    directions = [previous - center] + [world_vertices[other] - center for other in other_side] + [following - center]
+    angles = numpy.cumsum([0.0] + [_getAngle(directions[index], directions[index + 1]) for index in range(len(directions) - 1)])
+    start = numpy.linalg.norm(previous - center) * numpy.array([1.0, 0.0])
+    end = numpy.linalg.norm(following - center) * numpy.array([numpy.cos(angles[-1]), numpy.sin(angles[-1])])
+    edges = []  # type: List[numpy.ndarray]
+    distances = []  # type: List[float]
+    for other, angle in zip(other_side, angles[1:-1]):
+        ray = numpy.array([numpy.cos(angle), numpy.sin(angle)])
+        cross_start = ray[0] * start[1] - ray[1] * start[0]
+        cross_delta = ray[0] * (end - start)[1] - ray[1] * (end - start)[0]
+        crossing = start + (end - start) * (-cross_start / cross_delta if abs(cross_delta) > 1e-12 else 0.0)
+        edges.append(numpy.array([vertex, other]))
+        distances.append(float(numpy.clip(crossing.dot(ray), 0, numpy.linalg.norm(world_vertices[other] - center))))
+    return edges, distances
+
+
+##  Get the angle at a vertex of a path that goes around it across the edges to the other vertices.
+def _getFanAngle(world_vertices: numpy.ndarray, center: numpy.ndarray, previous: numpy.ndarray, others: List[int], following: numpy.ndarray) -> float:
+    directions = [previous - center] + [world_vertices[other] - center for other in others] + [following - center]
+    return sum(_getAngle(directions[index], directions[index + 1]) for index in range(len(directions) - 1))
+
+
+def _getAngle(direction: numpy.ndarray, other_direction: numpy.ndarray) -> float:
+    return float(numpy.arctan2(numpy.linalg.norm(numpy.cross(direction, other_direction)), numpy.dot(direction, other_direction)))
+
+
+##  Get where a path from one point to another crosses an edge, if it is a straight line when the two triangles on
+#   either side of the edge are unfolded into a plane.
+#   \param previous, following The points before and after the crossing, each on a triangle next to the edge.
+#   \param along The current distance of the crossings from the start of the edge, kept if the points are on the
+#   line through the edge.
+#   \return The distance of the crossings from the start of the edge, from 0 to the length of the edge.
+def _getStraightCrossings(previous: numpy.ndarray, following: numpy.ndarray, edge_starts: numpy.ndarray, edge_directions: numpy.ndarray, edge_lengths: numpy.ndarray, along: numpy.ndarray) -> numpy.ndarray:
+    previous_along = numpy.einsum("ij,ij->i", previous - edge_starts, edge_directions)
+    following_along = numpy.einsum("ij,ij->i", following - edge_starts, edge_directions)
+    previous_height = numpy.linalg.norm(previous - edge_starts - previous_along[:, numpy.newaxis] * edge_directions, axis=1)
+    following_height = numpy.linalg.norm(following - edge_starts - following_along[:, numpy.newaxis] * edge_directions, axis=1)
+
+    heights = previous_height + following_height
+    crossings = numpy.where(
+        heights > 1e-12,
+        previous_along + (following_along - previous_along) * previous_height / numpy.maximum(heights, 1e-12),
+        numpy.clip(along, numpy.minimum(previous_along, following_along), numpy.maximum(previous_along, following_along))
+    )
+    return numpy.clip(crossings, 0, edge_lengths)
+
+
+##  Get the graph of the surface of the mesh of a node at its scale, building it the first time it is requested.
+#   The graph is built once, also when it is requested from more than one thread at the same time.
+def getSurfaceGraph(node_geometry: NodeGeometry) -> SurfaceGraph:
+    graph = getCachedSurfaceGraph(node_geometry)
+    if graph is None:
+        with _graph_lock:
+            graph = getCachedSurfaceGraph(node_geometry)
+            if graph is None:
+                graph = SurfaceGraph(node_geometry.mesh_geometry, node_geometry.transformation[:3, :3])
+                node_geometry.mesh_geometry.setDerived(("surface_graph", node_geometry.getMetricKey()), graph)
+    return graph
+
+
+##  Get the graph of the surface of the mesh of a node if it has been built, without building it.
+def getCachedSurfaceGraph(node_geometry: NodeGeometry) -> Optional[SurfaceGraph]:
+    return node_geometry.mesh_geometry.getCachedDerived(("surface_graph", node_geometry.getMetricKey()))
+
+
+_graph_lock = threading.Lock()
+
+
+##  Get the edges of a mesh, and the edges across pairs of triangles that share an edge.
+#   \param vertices The vertices, in a space where distances are world space distances.
+#   \return The two vertices of each edge, with the lowest index first, and the length of the edges.
+def _getSurfaceEdges(vertices: numpy.ndarray, faces: numpy.ndarray) -> Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]:
+    starts = faces.ravel()
+    ends = numpy.roll(faces, -1, axis=1).ravel()
+    opposites = numpy.roll(faces, -2, axis=1).ravel()
+
+    vertex_count = len(vertices)
+    keys = numpy.minimum(starts, ends) * vertex_count + numpy.maximum(starts, ends)
+    order = numpy.argsort(keys, kind="stable")
+    _, first_half_edges, counts = numpy.unique(keys[order], return_index=True, return_counts=True)
+
+    # The edges of the mesh
+    half_edges = order[first_half_edges]
+    edges_a = numpy.minimum(starts[half_edges], ends[half_edges])
+    edges_b = numpy.maximum(starts[half_edges], ends[half_edges])
+
+    # Unfold the two triangles on either side of each manifold edge into a plane, with the shared edge from p to q
+    # along the first axis, and the opposite corners r and s on either side of it
+    manifold = first_half_edges[counts == 2]
+    p = vertices[starts[order[manifold]]]
+    q = vertices[ends[order[manifold]]]
+    r = opposites[order[manifold]]
+    s = opposites[order[manifold + 1]]
+    edge_lengths = numpy.linalg.norm(q - p, axis=1)
+    directions = (q - p) / numpy.maximum(edge_lengths, 1e-12)[:, numpy.newaxis]
+    along_r = numpy.einsum("ij,ij->i", vertices[r] - p, directions)
+    along_s = numpy.einsum("ij,ij->i", vertices[s] - p, directions)
+    height_r = numpy.linalg.norm(vertices[r] - p - along_r[:, numpy.newaxis] * directions, axis=1)
+    height_s = numpy.linalg.norm(vertices[s] - p - along_s[:, numpy.newaxis] * directions, axis=1)
+
+    # The straight line between r and s must cross the shared edge, or it would leave the two triangles
+    heights = height_r + height_s
+    crossing = along_r + (along_s - along_r) * height_r / numpy.maximum(heights, 1e-12)
+    across = (r != s) & (heights > 1e-12) & (crossing > 0) & (crossing < edge_lengths)
+
+    edges_a = numpy.concatenate([edges_a, numpy.minimum(r, s)[across]])
+    edges_b = numpy.concatenate([edges_b, numpy.maximum(r, s)[across]])
+    lengths = numpy.concatenate([
+        numpy.linalg.norm(vertices[edges_b[:len(half_edges)]] - vertices[edges_a[:len(half_edges)]], axis=1),
+        numpy.hypot(along_r - along_s, heights)[across]
+    ])
+
+    # An edge across triangles may connect the same vertices as another edge; keep only the shortest
+    keys = edges_a * vertex_count + edges_b
+    order = numpy.lexsort((lengths, keys))
+    unique = numpy.concatenate([[True], keys[order][1:] != keys[order][:-1]]) if len(keys) else numpy.zeros(0, dtype=bool)
+    order = order[unique]
+    return edges_a[order], edges_b[order], lengths[order]
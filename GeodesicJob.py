@@ -0,0 +1,92 @@
+# Copyright (c) 2023 Aldo Hoeben / fieldOfView
+# MeasureTool is released under the terms of the AGPLv3 or higher.
+
+from UM.Job import Job
+
+from .Geodesic import SurfacePath, getCachedSurfaceGraph, getSurfaceGraph
+from .GeometryCache import NodeGeometry
+from .RayCastPicker import RayCastPicker
+
+import numpy
+
+from typing import List, Optional, Tuple
+
+
+##  Finds the shortest path over the surface of a model between two points in a background thread.
+#
+#   The points are looked up on the models with short rays from the view position, which builds the hierarchies of
+#   the meshes the first time. The graph of the surface is built the first time a path is searched on a mesh at a
+#   scale, and kept with the mesh. The result is a tuple of the geometry of the model and the path in the local space
+#   of its mesh, or None if there is no path or the job was cancelled; getError() tells why there is no path. Paths
+#   that are not refined are only searched for near the path over the graph of the surface, which is much faster.
+class GeodesicJob(Job):
+    # Reasons why there is no path
+    NotOnSameModel = "not_on_same_model"
+    NotConnected = "not_connected"
+
+    def __init__(self, picker: RayCastPicker, geometries: List[NodeGeometry], source: numpy.ndarray, target: numpy.ndarray, view_position: Optional[numpy.ndarray], anchor_distance: float, refine: bool = True) -> None:
+        super().__init__()
+        self._picker = picker
+        self._geometries = geometries
+        self._source = source
+        self._target = target
+        self._view_position = view_position
+        self._anchor_distance = anchor_distance
+        self._refine = refine
+        self._anchors = None  # type: Optional[Tuple[NodeGeometry, Tuple[int, Tuple[float, float]], Tuple[int, Tuple[float, float]]]]
+        self._anchors_found = False
+        self._error = None  # type: Optional[str]
+        self._cancelled = False
+
+    ##  Check whether the hierarchies of the meshes and the graph of the surface the path is on have been built, so
+    #   the job only has to search the graph.
+    def isPrepared(self) -> bool:
+        if not all(geometry.mesh_geometry.hasBVH() for geometry in self._geometries):
+            return False
+        anchors = self._getAnchors()
+        return anchors is None or getCachedSurfaceGraph(anchors[0]) is not None
+
+    def getError(self) -> Optional[str]:
+        return self._error
+
+    def cancel(self) -> None:
+        self._cancelled = True
+        super().cancel()
+
+    def isCancelled(self) -> bool:
+        return self._cancelled
+
+    def run(self) -> None:
+        anchors = self._getAnchors()
+        if anchors is None:
+            self._error = GeodesicJob.NotOnSameModel
+            self.setResult(None)
+            return
+        if self._cancelled:
+            self.setResult(None)
+            return
+
+        node_geometry, source, target = anchors
+        path = getSurfaceGraph(node_geometry).findPath(source, target, self.isCancelled, self._refine)  # type: Optional[SurfacePath]
+        if path is None:
+            if not self._cancelled:
+                self._error = GeodesicJob.NotConnected
+            self.setResult(None)
+            return
+        self.setResult((node_geometry, path))
+
+    ##  Find the model that both points are on, and the triangle and barycentric coordinates of each point.
+    #   \return The geometry of the model and the two points, or None if the points are not on the same model.
+    def _getAnchors(self) -> Optional[Tuple[NodeGeometry, Tuple[int, Tuple[float, float]], Tuple[int, Tuple[float, float]]]]:
+        if self._anchors_found:
+            return self._anchors
+        self._anchors_found = True
+        if self._view_position is None or not self._geometries:
+            return None
+
+        hits = [self._picker.pickSurface(self._geometries, point, self._view_position, self._anchor_distance) for point in (self._source, self._target)]
+        if hits[0] is None or hits[1] is None or hits[0].node is not hits[1].node:
+            return None
+        node_geometry = next(geometry for geometry in self._geometries if geometry.getNode() is hits[0].node)
+        self._anchors = (node_geometry, (hits[0].triangle_id, hits[0].barycentric), (hits[1].triangle_id, hits[1].barycentric))
+        return self._anchors
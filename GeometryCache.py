@@ -0,0 +1,272 @@
+# Copyright (c) 2023 Aldo Hoeben / fieldOfView
+# MeasureTool is released under the terms of the AGPLv3 or higher.
+
+from .MeshBVH import MeshBVH
+from .MeshFeatures import MeshFeatures
+from .VertexIndex import VertexIndex
+
+import numpy
+import threading
+import weakref
+
+from typing import Any, Callable, Dict, Hashable, Iterable, Iterator, List, Optional, Tuple
+
+
+##  Geometry derived from the mesh data of a node, in the local coordinate space of the mesh.
+#   Shared by all nodes that use the same mesh data, and valid for as long as the mesh data exists.
+#   The hierarchy, the feature tables and the indexes of the feature points may be built in background threads, so
+#   building them is guarded by a lock; code on the main thread that must not wait for them should check hasIndexes()
+#   first.
+class MeshGeometry:
+    def __init__(self, mesh_data: Any) -> None:
+        self._vertices = numpy.asarray(mesh_data.getVertices())
+        self._indices = mesh_data.getIndices()  # type: Optional[numpy.ndarray]
+
+        self._bvh = None  # type: Optional[MeshBVH]
+        self._features = None  # type: Optional[MeshFeatures]
+        self._feature_indexes = {}  # type: Dict[str, VertexIndex]
+        self._derived = {}  # type: Dict[Hashable, Any]
+        self._lock = threading.RLock()
+
+    def getVertices(self) -> numpy.ndarray:
+        return self._vertices
+
+    def getIndices(self) -> Optional[numpy.ndarray]:
+        return self._indices
+
+    def getTriangleCount(self) -> int:
+        if self._indices is not None:
+            return len(self._indices)
+        return len(self._vertices) // 3
+
+    ##  Get the indices of the vertices of triangles in the mesh data, by the index of the triangles.
+    #   \return An array of shape (triangles, 3 corners).
+    def getTriangleCorners(self, triangle_ids: numpy.ndarray) -> numpy.ndarray:
+        triangle_ids = numpy.asarray(triangle_ids, dtype=numpy.int64)
+        if self._indices is not None:
+            return numpy.asarray(self._indices, dtype=numpy.int64)[triangle_ids]
+        return triangle_ids[:, numpy.newaxis] * 3 + numpy.arange(3)
+
+    ##  Get the corners of triangles by their index in the mesh data, without building the hierarchy.
+    #   \return An array of shape (triangles, 3 corners, 3 axes).
+    def getTriangles(self, triangle_ids: numpy.ndarray) -> numpy.ndarray:
+        return self._vertices[self.getTriangleCorners(triangle_ids)].astype(numpy.float64)
+
+    def getBVH(self) -> MeshBVH:
+        if self._bvh is None:
+            with self._lock:
+                if self._bvh is None:
+                    self._bvh = MeshBVH(self._vertices, self._indices)
+        return self._bvh
+
+    def hasBVH(self) -> bool:
+        return self._bvh is not None
+
+    def getFeatures(self) -> MeshFeatures:
+        if self._features is None:
+            with self._lock:
+                if self._features is None:
+                    self._features = MeshFeatures(self._vertices, self._indices)
+        return self._features
+
+    ##  Get the index of the local space points of a type of feature.
+    def getFeatureIndex(self, feature: str) -> VertexIndex:
+        index = self._feature_indexes.get(feature)
+        if index is None:
+            with self._lock:
+                index = self._feature_indexes.get(feature)
+                if index is None:
+                    index = VertexIndex(self.getFeatures().getPoints(feature))
+                    self._feature_indexes[feature] = index
+        return index
+
+    ##  Check whether the indexes used for picking and snapping have been built.
+    #   \param bvh Whether the bounding volume hierarchy is needed.
+    #   \param features The types of features that are snapped to. Vertices need no index of their own; they are
+    #   snapped to the corners of the triangle under the cursor, which is found with the hierarchy.
+    def hasIndexes(self, bvh: bool, features: Iterable[str] = ()) -> bool:
+        if bvh and self._bvh is None:
+            return False
+        return all(feature == MeshFeatures.Vertices or feature in self._feature_indexes for feature in features)
+
+    ##  Build the indexes used for picking and snapping, if they have not been built yet.
+    #   \param is_cancelled A function that is called between the indexes, to stop building them.
+    def buildIndexes(self, bvh: bool, features: Iterable[str] = (), is_cancelled: Optional[Callable[[], bool]] = None) -> None:
+        if bvh:
+            self.getBVH()
+        for feature in features:
+            if is_cancelled is not None and is_cancelled():
+                return
+            if feature != MeshFeatures.Vertices:
+                self.getFeatureIndex(feature)
+
+    ##  Get a value derived from this mesh, computing it with factory the first time it is requested.
+    def getDerived(self, key: Hashable, factory: Callable[[], Any]) -> Any:
+        value = self._derived.get(key)
+        if value is None:
+            with self._lock:
+                value = self._derived.get(key)
+                if value is None:
+                    value = factory()
+                    self._derived[key] = value
+        return value
+
+    ##  Get a value derived from this mesh if it has been computed before, or None.
+    def getCachedDerived(self, key: Hashable) -> Any:
+        return self._derived.get(key)
+
+    ##  Store a value derived from this mesh that was computed elsewhere, for example in a background job.
+    def setDerived(self, key: Hashable, value: Any) -> None:
+        self._derived[key] = value
+
+
+##  Geometry of a node in world space: the mesh geometry combined with the world transformation of the node.
+#   An instance is only valid for one combination of mesh data and transformation; the GeometryCache replaces it when
+#   either of those changes.
+class NodeGeometry:
+    def __init__(self, node: Any, mesh_geometry: MeshGeometry, mesh_data: Any, transformation: numpy.ndarray) -> None:
+        # The node is referenced weakly, because the cache is keyed by the node itself
+        self._node = weakref.ref(node)
+        self.mesh_data = mesh_data
+        self.mesh_geometry = mesh_geometry
+        self.transformation = numpy.array(transformation, dtype=numpy.float64)
+
+        self._inverse_transformation = None  # type: Optional[numpy.ndarray]
+        self._world_vertices = None  # type: Optional[numpy.ndarray]
+        self._world_bounds = None  # type: Optional[Tuple[numpy.ndarray, numpy.ndarray]]
+        self._derived = {}  # type: Dict[Hashable, Any]
+        self._lock = threading.RLock()
+
+    def getNode(self) -> Any:
+        return self._node()
+
+    def matches(self, mesh_data: Any, transformation: numpy.ndarray) -> bool:
+        return self.mesh_data is mesh_data and numpy.array_equal(self.transformation, transformation)
+
+    def getInverseTransformation(self) -> numpy.ndarray:
+        if self._inverse_transformation is None:
+            self._inverse_transformation = numpy.linalg.inv(self.transformation)
+        return self._inverse_transformation
+
+    ##  Get a key that is the same for all transformations that only differ in translation and rotation, for caching
+    #   values that depend on distances measured in world space, but not on the position or orientation of the node.
+    def getMetricKey(self) -> bytes:
+        linear_transformation = self.transformation[:3, :3]
+        metric = numpy.round(linear_transformation.T.dot(linear_transformation), 9) + 0.0  # without negative zeros
+        return metric.tobytes()
+
+    ##  Transform points from the local space of the mesh to world space.
+    def transformPoints(self, points: numpy.ndarray) -> numpy.ndarray:
+        return numpy.asarray(points, dtype=numpy.float64).dot(self.transformation[:3, :3].T) + self.transformation[:3, 3]
+
+    ##  Transform points from world space to the local space of the mesh.
+    def inverseTransformPoints(self, points: numpy.ndarray) -> numpy.ndarray:
+        inverse = self.getInverseTransformation()
+        return numpy.asarray(points, dtype=numpy.float64).dot(inverse[:3, :3].T) + inverse[:3, 3]
+
+    ##  Get the unique vertices of the mesh in world space.
+    def getWorldVertices(self) -> numpy.ndarray:
+        if self._world_vertices is None:
+            self._world_vertices = self.transformPoints(self.mesh_geometry.getFeatures().getVertices())
+        return self._world_vertices
+
+    ##  Get the axis aligned bounds of the node in world space, as a tuple of minimum and maximum corner.
+    def getWorldBounds(self) -> Tuple[numpy.ndarray, numpy.ndarray]:
+        if self._world_bounds is None:
+            vertices = self.mesh_geometry.getVertices()
+            if len(vertices) == 0:
+                self._world_bounds = (numpy.zeros(3), numpy.zeros(3))
+            else:
+                # Transform the corners of the local bounds rather than all vertices; this is slightly conservative
+                minimum = vertices.min(axis=0)
+                maximum = vertices.max(axis=0)
+                corners = numpy.array([
+                    [x, y, z] for x in (minimum[0], maximum[0]) for y in (minimum[1], maximum[1]) for z in (minimum[2], maximum[2])
+                ])
+                corners = self.transformPoints(corners)
+                self._world_bounds = (corners.min(axis=0), corners.max(axis=0))
+        return self._world_bounds
+
+    ##  Get the distance from a world space point to the world bounds of the node.
+    def getBoundsDistance(self, point: numpy.ndarray) -> float:
+        minimum, maximum = self.getWorldBounds()
+        return float(numpy.linalg.norm(numpy.maximum(0, numpy.maximum(minimum - point, point - maximum))))
+
+    ##  Get a value derived from the world space geometry of this node, computing it with factory the first time it
+    #   is requested. Derived values are discarded along with this instance when the mesh or transformation changes.
+    #   Background jobs may request the same value, so computing it is guarded by a lock like the mesh geometry is.
+    def getDerived(self, key: Hashable, factory: Callable[[], Any]) -> Any:
+        value = self._derived.get(key)
+        if value is None:
+            with self._lock:
+                value = self._derived.get(key)
+                if value is None:
+                    value = factory()
+                    self._derived[key] = value
+        return value
+
+    ##  Get a derived value that has already been computed, or None if it has not.
+    def getCachedDerived(self, key: Hashable) -> Any:
+        return self._derived.get(key)
+
+    ##  Store a derived value that was computed elsewhere, for example in a background job.
+    def setDerived(self, key: Hashable, value: Any) -> None:
+        self._derived[key] = value
+
+
+##  A cache of the geometry of the nodes in a scene, keyed by node.
+#
+#   Geometry in the local space of a mesh (such as a bounding volume hierarchy or feature tables) is kept per mesh
+#   data, and shared between nodes that use the same mesh data. Geometry in world space (such as transformed
+#   vertices and spatial indexes of those) is kept per node, and is only recomputed for nodes of which the mesh data
+#   or the world transformation has actually changed. Entries are dropped automatically when nodes or mesh data are
+#   garbage collected.
+class GeometryCache:
+    def __init__(self) -> None:
+        self._meshes = weakref.WeakKeyDictionary()  # type: weakref.WeakKeyDictionary
+        self._nodes = weakref.WeakKeyDictionary()  # type: weakref.WeakKeyDictionary
+
+    def getMeshGeometry(self, mesh_data: Any) -> MeshGeometry:
+        mesh_geometry = self._meshes.get(mesh_data)
+        if mesh_geometry is None:
+            mesh_geometry = MeshGeometry(mesh_data)
+            self._meshes[mesh_data] = mesh_geometry
+        return mesh_geometry
+
+    ##  Get the geometry of a node, for its current mesh data and world transformation.
+    #   \param node The node; any object that can be weakly referenced can be used as a key.
+    #   \param transformation The 4x4 world transformation matrix of the node.
+    def getNodeGeometry(self, node: Any, transformation: numpy.ndarray, mesh_data: Any) -> NodeGeometry:
+        node_geometry = self._nodes.get(node)
+        if node_geometry is None or not node_geometry.matches(mesh_data, transformation):
+            node_geometry = NodeGeometry(node, self.getMeshGeometry(mesh_data), mesh_data, transformation)
+            self._nodes[node] = node_geometry
+        return node_geometry
+
+    ##  Get the geometry of a collection of nodes.
+    #   \param items Tuples of a node, its 4x4 world transformation matrix and its mesh data.
+    def getNodeGeometries(self, items: Iterable[Tuple[Any, numpy.ndarray, Any]]) -> List[NodeGeometry]:
+        return [self.getNodeGeometry(node, transformation, mesh_data) for node, transformation, mesh_data in items]
+
+    ##  Bring the cache up to date with a collection of nodes.
+    #   \param items Tuples of a node, its 4x4 world transformation matrix and its mesh data.
+    #   \return The nodes of which the mesh data or world transformation changed since they were last seen, and the
+    #   nodes that were seen before but are no longer part of the collection.
+    def update(self, items: Iterable[Tuple[Any, numpy.ndarray, Any]]) -> Tuple[List[Any], List[Any]]:
+        changed = []  # type: List[Any]
+        seen = set()
+        for node, transformation, mesh_data in items:
+            seen.add(id(node))
+            node_geometry = self._nodes.get(node)
+            if node_geometry is None or not node_geometry.matches(mesh_data, transformation):
+                changed.append(node)
+                self.getNodeGeometry(node, transformation, mesh_data)
+
+        removed = [node for node in list(self._nodes.keys()) if id(node) not in seen]
+        for node in removed:
+            del self._nodes[node]
+
+        return changed, removed
+
+    def __iter__(self) -> Iterator[NodeGeometry]:
+        return iter(list(self._nodes.values()))
@@ -0,0 +1,127 @@
+# Copyright (c) 2023 Aldo Hoeben / fieldOfView
+# MeasureTool is released under the terms of the AGPLv3 or higher.
+
+from UM.Logger import Logger
+
+from .GeometryCache import MeshGeometry
+
+from concurrent.futures import Future, ThreadPoolExecutor
+import heapq
+import os
+import threading
+
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+
+##  A request to build the indexes of a mesh, which can be cancelled until a worker starts on its last index.
+class _BuildTask:
+    def __init__(self, mesh_geometry: MeshGeometry, bvh: bool, features: List[str]) -> None:
+        self.mesh_geometry = mesh_geometry
+        self.bvh = bvh
+        self.features = features
+        self.cancelled = False
+
+
+##  Builds the indexes that are used for picking and snapping (the bounding volume hierarchy and the feature tables of
+#   meshes) in a pool of worker threads, so they are ready before the first click on a mesh that was just loaded.
+#
+#   Builds are queued by priority, so the meshes in view are built first. Scheduling replaces the queue: builds of
+#   meshes that are no longer in the scene are cancelled. A build that is already running stops between indexes.
+#   Other background work on meshes, such as the batches of the wall thickness, can be submitted to the same workers.
+class IndexBuilder:
+    def __init__(self, worker_count: Optional[int] = None) -> None:
+        if worker_count is None:
+            worker_count = max(1, min(4, (os.cpu_count() or 1) - 1))
+        self._worker_count = worker_count
+        self._executor = ThreadPoolExecutor(max_workers=worker_count, thread_name_prefix="MeasureToolIndexBuilder")
+
+        self._lock = threading.Lock()
+        self._queue = []  # type: List[Tuple[Any, int, _BuildTask]]  # heap of priority, sequence number and task
+        self._sequence = 0
+        self._pending = {}  # type: Dict[MeshGeometry, _BuildTask]
+        self._running = {}  # type: Dict[MeshGeometry, _BuildTask]
+        self._shut_down = False
+
+    ##  Replace the queued builds.
+    #   \param requests Tuples of a mesh geometry and its priority; lower values are built first. A mesh that is
+    #   requested more than once is built with its lowest priority.
+    #   \param bvh Whether to build the bounding volume hierarchies.
+    #   \param features The types of features to compute the points of.
+    def schedule(self, requests: Iterable[Tuple[MeshGeometry, Any]], bvh: bool, features: Iterable[str] = ()) -> None:
+        features = list(features)
+        priorities = {}  # type: Dict[MeshGeometry, Any]
+        for mesh_geometry, priority in requests:
+            if mesh_geometry not in priorities or priority < priorities[mesh_geometry]:
+                priorities[mesh_geometry] = priority
+
+        with self._lock:
+            if self._shut_down:
+                return
+            for mesh_geometry, task in list(self._running.items()):
+                if mesh_geometry not in priorities:
+                    task.cancelled = True
+            for task in self._pending.values():
+                task.cancelled = True
+            self._pending = {}
+            self._queue = []
+
+            new_tasks = 0
+            for mesh_geometry, priority in priorities.items():
+                if mesh_geometry.hasIndexes(bvh, features):
+                    continue
+                running = self._running.get(mesh_geometry)
+                if running is not None and not running.cancelled and running.bvh >= bvh and set(features) <= set(running.features):
+                    continue
+
+                task = _BuildTask(mesh_geometry, bvh, features)
+                self._pending[mesh_geometry] = task
+                heapq.heappush(self._queue, (priority, self._sequence, task))
+                self._sequence += 1
+                new_tasks += 1
+
+        # Every submission runs the task with the highest priority at that time, rather than a particular task
+        for _ in range(new_tasks):
+            self._executor.submit(self._runNext)
+
+    def getWorkerCount(self) -> int:
+        return self._worker_count
+
+    ##  Run a function on the worker threads, after the builds that have already been submitted.
+    #   \return The future of the result, or None if the worker threads have been stopped.
+    def submit(self, function: Callable[..., Any], *args: Any) -> Optional[Future]:
+        with self._lock:
+            if self._shut_down:
+                return None
+            return self._executor.submit(function, *args)
+
+    ##  Cancel all builds that have not finished, and stop the worker threads when they are done.
+    def shutdown(self) -> None:
+        with self._lock:
+            self._shut_down = True
+            for task in list(self._pending.values()) + list(self._running.values()):
+                task.cancelled = True
+            self._pending = {}
+            self._queue = []
+        self._executor.shutdown(wait=False)
+
+    def _runNext(self) -> None:
+        with self._lock:
+            task = None  # type: Optional[_BuildTask]
+            while self._queue:
+                _, _, task = heapq.heappop(self._queue)
+                if not task.cancelled:
+                    break
+                task = None
+            if task is None:
+                return
+            del self._pending[task.mesh_geometry]
+            self._running[task.mesh_geometry] = task
+
+        try:
+            task.mesh_geometry.buildIndexes(task.bvh, task.features, lambda: task.cancelled)
+        except Exception:
+            Logger.logException("w", "Unable to build the picking indexes of a mesh")
+        finally:
+            with self._lock:
+                if self._running.get(task.mesh_geometry) is task:
+                    del self._running[task.mesh_geometry]
@@ -12,30 +12,110 @@ from UM.Math.Matrix import Matrix
 from UM.Math.Vector import Vector
 
 from UM.Scene.Iterator.DepthFirstIterator import DepthFirstIterator
+from UM.Version import Version
 
+from .PickProfiler import PickProfiler
+from .PixelReadback import AsyncPixelReadback, PixelReadback
+
+try:
+    from cura.ApplicationMetadata import CuraSDKVersion
+except ImportError:  # Cura <= 3.6
+    CuraSDKVersion = "6.0.0"
+if CuraSDKVersion >= "8.0.0":
+    from PyQt6.QtOpenGL import QOpenGLFramebufferObject, QOpenGLFramebufferObjectFormat
+    CombinedDepthStencil = QOpenGLFramebufferObject.Attachment.CombinedDepthStencil
+else:
+    from PyQt5.QtGui import QOpenGLFramebufferObject, QOpenGLFramebufferObjectFormat
+    CombinedDepthStencil = QOpenGLFramebufferObject.CombinedDepthStencil
+
+import operator
 import os.path
+import numpy
 from math import inf
 
-from typing import Optional, TYPE_CHECKING
+from typing import List, Optional, Tuple, Union, TYPE_CHECKING
 if TYPE_CHECKING:
     from UM.View.GL.ShaderProgram import ShaderProgram
+    from UM.Math.AxisAlignedBox import AxisAlignedBox
+
+GL_RGBA32F = 0x8814
+
+
+##  A framebuffer object for picking, optionally with a 32 bit floating point colour attachment.
+#   Has the same interface as the FrameBufferObject created by Uranium.
+class PickingFrameBufferObject:
+    def __init__(self, width: int, height: int, floating_point: bool = False) -> None:
+        fbo_format = QOpenGLFramebufferObjectFormat()
+        fbo_format.setAttachment(CombinedDepthStencil)
+        if floating_point:
+            fbo_format.setInternalTextureFormat(GL_RGBA32F)
+        self._fbo = QOpenGLFramebufferObject(width, height, fbo_format)
+
+    def getSize(self) -> Tuple[int, int]:
+        return self._fbo.width(), self._fbo.height()
+
+    def isValid(self) -> bool:
+        return self._fbo.isValid()
+
+    def getTextureId(self) -> int:
+        return self._fbo.texture()
+
+    def bind(self) -> None:
+        self._fbo.bind()
+
+    def release(self) -> None:
+        self._fbo.release()
+
+    def getContents(self):
+        return self._fbo.toImage()
+
 
 ##  A RenderPass subclass that renders a the distance of selectable objects from the active camera to a texture.
 #   The texture is used to map a 2d location (eg the mouse location) to a world space position
 #
 #   Note that in order to increase precision, the 24 bit depth value is encoded into all three of the R,G & B channels
+#   When the OpenGL context supports floating point render targets, the pass can instead be created for all axes at
+#   once, rendering the unencoded world space position to a floating point texture in a single render.
+#
+#   Positions are rendered relative to an origin that is chosen per render, such as the position of the camera, so
+#   the range of the 24 bit encoding (about 8 meter either way) and the precision of the floating point texture are
+#   centered on what is being looked at, rather than on the center of the build plate. The origin is added back in
+#   double precision when the pixels are decoded.
 class MeasurePass(RenderPass):
-    def __init__(self, width: int, height: int, axis: int) -> None:
+    AllAxes = -1
+    MaximumPickWindowSize = 9
+    ScissorMargin = 16  # number of pixels around the pick window that are also rendered in a scissored render
+    CullingNodeCount = 32  # minimum number of objects for a scissored render to leave out the objects outside it
+    FrameBufferGranularity = 128  # framebuffers are allocated in multiples of this size, so they can be reused
+
+    ##  Check if the OpenGL version can render all axes in a single pass.
+    #   Whether the framebuffer can actually be created and read back is only known when the pass is first rendered.
+    @staticmethod
+    def getAllAxesSupported() -> bool:
+        # Use a dummy postfix, since an equal version with a postfix is considered smaller normally.
+        return Version(OpenGL.getInstance().getOpenGLVersion()) >= Version("3.0 dummy-postfix")
+
+    def __init__(self, width: int, height: int, axis: int = AllAxes) -> None:
         super().__init__("picking", width, height)
 
         self._axis = axis
+        self._pick_window_size = 1
+        self._async_readback = None  # type: Optional[AsyncPixelReadback]
+        self._rendered_rect = None  # type: Optional[Tuple[int, int, int, int]]
+        self._origin = numpy.zeros(3)  # world space position that the rendered positions are relative to
+        self._bounding_boxes = []  # type: List[Optional[AxisAlignedBox]]
+        self._box_bounds = numpy.zeros((0, 6))  # the minimum and maximum of those bounding boxes
 
         self._renderer = CuraApplication.getInstance().getRenderer()
 
         self._shader = None  # type: Optional[ShaderProgram]
         self._scene = CuraApplication.getInstance().getController().getScene()
 
-    def render(self, snap_vertices) -> None:
+    ##  Render the world space positions of the scene.
+    #   \param pick_position When set, only a small rectangle around this mouse position is rendered, and only the
+    #   objects that can be seen through that rectangle.
+    #   \param origin The world space position to render positions relative to, or None for the world origin.
+    def render(self, pick_position: Optional[Tuple[float, float]] = None, origin: Optional[numpy.ndarray] = None) -> None:
         if not self._shader:
             self._shader = OpenGL.getInstance().createShaderProgram(
                 os.path.join(
@@ -47,19 +127,42 @@ class MeasurePass(RenderPass):
             )
 
         self._shader.setUniformValue("u_axisId", self._axis)
-        self._shader.setUniformValue("u_snapVertices", snap_vertices)
+        self._shader.setUniformValue("u_floatOutput", 1 if self._axis == MeasurePass.AllAxes else 0)
+
+        camera = self._scene.getActiveCamera()
+        width, height = self.getSize()
+
+        scissor_rect = None  # type: Optional[Tuple[int, int, int, int]]
+        if pick_position is not None:
+            scissor_rect = self._getScissorRect(*pick_position)
+
+        self._origin = numpy.array(origin, dtype=numpy.float64) if origin is not None else numpy.zeros(3)
+        self._shader.setUniformValue("u_origin", Vector(*self._origin))
 
         # Create a new batch to be rendered
         batch = RenderBatch(self._shader)
 
         # Fill up the batch with objects that can be sliced. `
-        for node in DepthFirstIterator(self._scene.getRoot()):  # type: ignore #Ignore type error because iter() should get called automatically by Python syntax.
-            if (
-                node.callDecoration("isSliceable")
-                and node.getMeshData()
-                and node.isVisible()
-            ):
-                batch.addItem(node.getWorldTransformation(), node.getMeshData())
+        nodes = [
+            node for node in DepthFirstIterator(self._scene.getRoot())  # type: ignore #Ignore type error because iter() should get called automatically by Python syntax.
+            if node.callDecoration("isSliceable") and node.getMeshData() and node.isVisible()
+        ]
+        # Leave out the objects that cannot be seen through the scissor rectangle, when there are enough of them to
+        # make up for projecting their bounding boxes
+        if scissor_rect is not None and len(nodes) >= MeasurePass.CullingNodeCount:
+            view_projection = numpy.dot(
+                camera.getProjectionMatrix().getData(),
+                numpy.linalg.inv(camera.getWorldTransformation().getData())
+            )
+            # Nodes get a new bounding box when they change, so the bounds are only gathered again when a box changed
+            bounding_boxes = [node.getBoundingBox() for node in nodes]
+            if len(bounding_boxes) != len(self._bounding_boxes) or not all(map(operator.is_, bounding_boxes, self._bounding_boxes)):
+                self._bounding_boxes = bounding_boxes
+                self._box_bounds = _getBoxBounds(bounding_boxes)
+            overlaps = _boundingBoxesOverlapRect(self._box_bounds, view_projection, scissor_rect, width, height)
+            nodes = [node for node, overlap in zip(nodes, overlaps) if overlap]
+        for node in nodes:
+            batch.addItem(node.getWorldTransformation(), node.getMeshData())
 
         z_fight_distance = 0.2  # Distance between buildplate and disallowed area meshes to prevent z-fighting
         buildplate_transform = Matrix()
@@ -68,18 +171,280 @@ class MeasurePass(RenderPass):
         buildplate_mesh = CuraApplication.getInstance().getBuildVolume()._grid_mesh
         batch.addItem(buildplate_transform, buildplate_mesh)
 
-        width, height = self.getSize()
+        profiler = PickProfiler.getInstance()
+        profiler.mark(PickProfiler.Traversal)
 
         self.bind()
         self._gl.glViewport(0, 0, width, height)
-        self._gl.glClearColor(1.0, 1.0, 1.0, 0.0)
+        if scissor_rect is not None:
+            left, top, right, bottom = scissor_rect
+            self._gl.glEnable(self._gl.GL_SCISSOR_TEST)
+            # OpenGL window coordinates start at the bottom of the framebuffer
+            self._gl.glScissor(left, height - 1 - bottom, right - left + 1, bottom - top + 1)
+        if self._axis == MeasurePass.AllAxes:
+            self._gl.glClearColor(0.0, 0.0, 0.0, 0.0)
+        else:
+            self._gl.glClearColor(1.0, 1.0, 1.0, 0.0)
         self._gl.glClear(self._gl.GL_COLOR_BUFFER_BIT | self._gl.GL_DEPTH_BUFFER_BIT)
 
-        batch.render(self._scene.getActiveCamera())
+        batch.render(camera)
+        if scissor_rect is not None:
+            self._gl.glDisable(self._gl.GL_SCISSOR_TEST)
+        if profiler.isEnabled():
+            # Only wait for the GPU when profiling, so the render time does not end up in the readback time
+            self._gl.glFinish()
         self.release()
+        profiler.mark(PickProfiler.Render)
+
+        self._rendered_rect = scissor_rect if scissor_rect is not None else (0, 0, width - 1, height - 1)
+
+    ##  Get the world space position that the positions of the last render are relative to.
+    def getOrigin(self) -> numpy.ndarray:
+        return self._origin
+
+    ##  Check if the pixels that are read back for a mouse position have been rendered by the last render.
+    #   This is always the case unless the last render was limited to a rectangle around a pick position.
+    def isPickRendered(self, x: float, y: float) -> bool:
+        rect = self._getPickWindowRect(x, y)
+        if rect is None:
+            return True  # outside the framebuffer, so there is nothing to render
+        if self._rendered_rect is None:
+            return False
+
+        rendered_left, rendered_top, rendered_right, rendered_bottom = self._rendered_rect
+        left, top, right, bottom = rect[2:]
+        return (
+            rendered_left <= left and rendered_top <= top
+            and right <= rendered_right and bottom <= rendered_bottom
+        )
+
+    ##  Get the rectangle of pixels that is rendered for a pick at a mouse position.
+    #   The rectangle is larger than the window that is read back, so small mouse movements can reuse the render.
+    def _getScissorRect(self, x: float, y: float) -> Tuple[int, int, int, int]:
+        width, height = self.getSize()
+        window_size = self._renderer.getWindowSize()
+
+        px = round((0.5 + x / 2.0) * window_size[0])
+        py = round((0.5 + y / 2.0) * window_size[1])
+
+        half_size = self._pick_window_size // 2 + MeasurePass.ScissorMargin
+        return (
+            min(width - 1, max(0, px - half_size)),
+            min(height - 1, max(0, py - half_size)),
+            max(0, min(width - 1, px + half_size)),
+            max(0, min(height - 1, py + half_size))
+        )
+
+    ##  Resize the pass, keeping the framebuffer if it can hold the new size without wasting too much memory.
+    #   Only the lower left part of a framebuffer that is larger than the pass is rendered to and read from.
+    def setSize(self, width: int, height: int) -> None:
+        if (width, height) == self.getSize():
+            return
+
+        self.cancelPickRequests()
+        self._width = width
+        self._height = height
+        self._rendered_rect = None
+
+        if self._fbo:
+            fbo_width, fbo_height = self._fbo.getSize()
+            allocation_width, allocation_height = self._getFrameBufferAllocationSize()
+            if (
+                fbo_width < width or fbo_height < height
+                or fbo_width * fbo_height > 2 * allocation_width * allocation_height
+            ):
+                self._fbo = None
+
+    ##  Release the framebuffer and the pixel buffers of the pass. They are created again if the pass is used after
+    #   this, so this can be called both when discarding a pass and to free its memory while it is not needed.
+    def destroy(self) -> None:
+        if self._async_readback:
+            self._async_readback.destroy()
+            self._async_readback = None
+        self._fbo = None
+        self._rendered_rect = None
+
+    def bind(self) -> None:
+        if not self._fbo:
+            floating_point = self._axis == MeasurePass.AllAxes
+            if floating_point and not PixelReadback.getInstance().isSupported():
+                raise RuntimeError("Unable to read back pixels from a floating point framebuffer object")
+
+            width, height = self._getFrameBufferAllocationSize()
+            fbo = PickingFrameBufferObject(width, height, floating_point)
+            if not fbo.isValid():
+                raise RuntimeError("Unable to create a %sframebuffer object of %dx%d pixels" % (
+                    "floating point " if floating_point else "", width, height
+                ))
+            self._fbo = fbo
+        super().bind()
+
+    ##  Get the size of the framebuffer to allocate for the current size of the pass.
+    def _getFrameBufferAllocationSize(self) -> Tuple[int, int]:
+        granularity = MeasurePass.FrameBufferGranularity
+        width, height = self.getSize()
+        return -(-width // granularity) * granularity, -(-height // granularity) * granularity
+
+    def isAllAxes(self) -> bool:
+        return self._axis == MeasurePass.AllAxes
+
+    ##  Set the size of the square window of pixels that is read back around the cursor.
+    #   When the pixel under the cursor does not hit anything, the nearest pixel in this window that does is used.
+    def setPickWindowSize(self, size: int) -> None:
+        size = max(1, min(MeasurePass.MaximumPickWindowSize, size | 1))  # force an odd size so the cursor is in the center
+        if size != self._pick_window_size:
+            self.cancelPickRequests()
+            self._pick_window_size = size
+
+    def getPickWindowSize(self) -> int:
+        return self._pick_window_size
 
     ## Get the coordinate along this pass axis in mm.
     def getPickedCoordinate(self, x: int, y: int) -> float:
+        if self._axis == MeasurePass.AllAxes or not self._fbo:
+            return inf
+
+        pixels = self.readPickWindow(x, y, floating_point=False)
+        if pixels is None:
+            return self._getPickedCoordinateFromImage(x, y)
+
+        pixel = _nearestHitPixel(pixels)
+        if pixel is None:
+            return inf
+
+        return float(decodeAxisPixels(pixel, self._origin[self._axis]))
+
+    ## Get the world space position in mm, for a pass that renders all axes at once.
+    def getPickedPosition(self, x: int, y: int) -> Optional[Tuple[float, float, float]]:
+        if self._axis != MeasurePass.AllAxes or not self._fbo:
+            return None
+
+        pixels = self.readPickWindow(x, y, floating_point=True)
+        if pixels is None:
+            return None
+
+        pixel = _nearestHitPixel(pixels)
+        if pixel is None:
+            return None
+
+        return tuple(decodePositionPixels(pixel, self._origin).tolist())
+
+    ##  Check if picked positions can be read back asynchronously from this pass.
+    def getAsyncPickingSupported(self) -> bool:
+        return self._axis == MeasurePass.AllAxes and PixelReadback.getInstance().isAsyncSupported()
+
+    ##  Start reading back the world space position under the mouse, without waiting for the GPU.
+    #   The result can be retrieved with getCompletedPickedPosition() in a later frame.
+    def requestPickedPosition(self, x: int, y: int) -> None:
+        if not self._fbo or not self.getAsyncPickingSupported():
+            return
+
+        rect = self._getPickWindowRect(x, y)
+        if rect is None:
+            return
+
+        if not self._async_readback:
+            self._async_readback = AsyncPixelReadback(floating_point=True)
+
+        left, top, right, bottom = rect[2:]
+        height = self.getSize()[1]
+
+        self._fbo.bind()
+        self._async_readback.request(left, height - 1 - bottom, right - left + 1, bottom - top + 1, tag=(rect, self._origin))
+        self._fbo.release()
+
+    ##  Get the most recent world space position requested by requestPickedPosition() that has been read back.
+    #   \return The position in mm, or None if no request has completed or the completed request did not hit anything.
+    def getCompletedPickedPosition(self) -> Optional[Tuple[float, float, float]]:
+        if not self._async_readback:
+            return None
+
+        completed = self._async_readback.poll()
+        if completed is None:
+            return None
+
+        # The origin of the render that was read back, which may differ from the origin of the latest render
+        pixels, (rect, origin) = completed
+        pixel = _nearestHitPixel(self._padPickWindow(pixels, rect))
+        if pixel is None:
+            return None
+
+        return tuple(decodePositionPixels(pixel, origin).tolist())
+
+    ##  Drop any asynchronous reads that are still in flight.
+    def cancelPickRequests(self) -> None:
+        if self._async_readback:
+            self._async_readback.cancel()
+
+    ##  Get the pixel under the mouse, and the window around it clipped to the framebuffer.
+    #   \return A tuple with the pixel x, y, and the left, top, right, bottom of the window, or None if the mouse is
+    #   outside the framebuffer.
+    def _getPickWindowRect(self, x: int, y: int) -> Optional[Tuple[int, int, int, int, int, int]]:
+        width, height = self.getSize()
+        window_size = self._renderer.getWindowSize()
+
+        px = round((0.5 + x / 2.0) * window_size[0])
+        py = round((0.5 + y / 2.0) * window_size[1])
+
+        if px < 0 or px > (width - 1) or py < 0 or py > (height - 1):
+            return None
+
+        half_size = self._pick_window_size // 2
+        return (
+            px, py,
+            max(0, px - half_size),
+            max(0, py - half_size),
+            min(width - 1, px + half_size),
+            min(height - 1, py + half_size)
+        )
+
+    ##  Read the window of pixels around a mouse position from the framebuffer, with the rows top to bottom and the
+    #   mouse position in the center.
+    #   \return An array with RGBA pixels, or None if the pass has not been rendered yet or the pixels can not be read
+    #   directly from the framebuffer.
+    def readPickWindow(self, x: int, y: int, floating_point: bool) -> Optional[numpy.ndarray]:
+        if not self._fbo:
+            return None
+
+        rect = self._getPickWindowRect(x, y)
+        if rect is None:
+            return numpy.zeros((0, 0, 4))
+
+        readback = PixelReadback.getInstance()
+        if not readback.isSupported():
+            return None
+
+        left, top, right, bottom = rect[2:]
+        height = self.getSize()[1]
+
+        self._fbo.bind()
+        # OpenGL window coordinates start at the bottom of the framebuffer
+        pixels = readback.readPixels(
+            left, height - 1 - bottom, right - left + 1, bottom - top + 1, floating_point=floating_point
+        )
+        self._fbo.release()
+        if pixels is None:
+            return None
+
+        return self._padPickWindow(pixels, rect)
+
+    ##  Flip the rows of pixels read from the framebuffer so they are top to bottom like the mouse coordinates, and
+    #   pad a window that was clipped by the edges of the framebuffer with misses so the cursor is in the center.
+    def _padPickWindow(self, pixels: numpy.ndarray, rect: Tuple[int, int, int, int, int, int]) -> numpy.ndarray:
+        px, py, left, top, right, bottom = rect
+        size = self._pick_window_size
+        half_size = size // 2
+
+        window = numpy.zeros((size, size, 4), dtype=pixels.dtype)
+        window[
+            top - (py - half_size):bottom - (py - half_size) + 1,
+            left - (px - half_size):right - (px - half_size) + 1
+        ] = pixels[::-1]
+        return window
+
+    ##  Get the coordinate under the cursor from the complete framebuffer contents.
+    #   Used when pixels can not be read directly from the framebuffer.
+    def _getPickedCoordinateFromImage(self, x: int, y: int) -> float:
         output = self.getOutput()
 
         window_size = self._renderer.getWindowSize()
@@ -87,14 +452,116 @@ class MeasurePass(RenderPass):
         px = round((0.5 + x / 2.0) * window_size[0])
         py = round((0.5 + y / 2.0) * window_size[1])
 
-        if px < 0 or px > (output.width() - 1) or py < 0 or py > (output.height() - 1):
+        width, height = self.getSize()
+        if px < 0 or px > (width - 1) or py < 0 or py > (height - 1):
             return inf
 
-        value = output.pixel(px, py)  # value in micron, from in r, g & b channels
+        # The pass is rendered to the bottom of the framebuffer, which may be larger than the pass
+        value = output.pixel(px, py + output.height() - height)  # value in micron, from in r, g & b channels
         if value == 0x00FFFFFF or value == 0x00000000:
             return inf
         value = (
             (value & 0x00FFFFFF) - 0x00800000
         ) / 1000.0  # drop the alpha channel, correct for signedness and covert to mm
 
-        return value
+        return value + float(self._origin[self._axis])
+
+
+##  Decode coordinates in mm from RGBA pixels rendered by a single axis pass.
+#   Works on any number of pixels at once; the last dimension of the array holds the channels.
+#   \param origin The coordinate of the origin the pass was rendered relative to, or an array of those that
+#   broadcasts against the pixels without their channels, to decode pixels of several passes at once.
+def decodeAxisPixels(pixels: numpy.ndarray, origin: Union[float, numpy.ndarray] = 0.0) -> numpy.ndarray:
+    pixels = pixels.astype(numpy.int32)
+    value = (pixels[..., 0] << 16) | (pixels[..., 1] << 8) | pixels[..., 2]  # value in micron, from in r, g & b channels
+    return (value - 0x00800000) / 1000.0 + origin  # correct for signedness, covert to mm and add the origin
+
+
+##  Decode world space positions in mm from RGBA pixels rendered by a pass for all axes.
+#   Works on any number of pixels at once; the last dimension of the array holds the channels.
+def decodePositionPixels(pixels: numpy.ndarray, origin: numpy.ndarray) -> numpy.ndarray:
+    return pixels[..., :3].astype(numpy.float64) + origin
+
+
+##  Get the world space position in mm under the mouse from the three passes that render a single axis each.
+#   The windows of all passes are decoded at once, and the same pixel is used for all axes: the pixel nearest to the
+#   mouse that hit an object in all passes.
+#   \return The position, or None if nothing was hit.
+def getPickedAxesPosition(measure_passes: List[MeasurePass], x: int, y: int) -> Optional[Tuple[float, float, float]]:
+    windows = [measure_pass.readPickWindow(x, y, floating_point=False) for measure_pass in measure_passes]
+    if any(window is None for window in windows):
+        # The pixels can not be read directly from the framebuffers, so each pass is decoded from its own image
+        coordinates = [measure_pass.getPickedCoordinate(x, y) for measure_pass in measure_passes]
+        if inf in coordinates:
+            return None
+        return (coordinates[0], coordinates[1], coordinates[2])
+
+    windows = numpy.stack(windows)  # (axes, size, size, channels)
+    nearest = _nearestHit(windows[..., 3].min(axis=0) != 0)
+    if nearest is None:
+        return None
+
+    origins = numpy.array([measure_pass.getOrigin()[axis] for axis, measure_pass in enumerate(measure_passes)])
+    return tuple(decodeAxisPixels(windows[:, nearest[0], nearest[1]], origins).tolist())
+
+
+# The columns of the bounds (minimum x, y, z, maximum x, y, z) of a bounding box that make up each of its corners
+_BoxCornerColumns = numpy.array([[x, y, z] for x in (0, 3) for y in (1, 4) for z in (2, 5)])
+
+
+##  Get the minimum and maximum of axis aligned bounding boxes, as an array of shape (boxes, 6) with the minimum x, y,
+#   z and maximum x, y, z of each box. Missing boxes get infinite bounds.
+def _getBoxBounds(bounding_boxes: List[Optional["AxisAlignedBox"]]) -> numpy.ndarray:
+    return numpy.array([
+        (-inf, -inf, -inf, inf, inf, inf) if bounding_box is None else (
+            bounding_box.minimum.x, bounding_box.minimum.y, bounding_box.minimum.z,
+            bounding_box.maximum.x, bounding_box.maximum.y, bounding_box.maximum.z
+        )
+        for bounding_box in bounding_boxes
+    ], dtype=numpy.float64).reshape(-1, 6)
+
+
+##  Check which axis aligned bounding boxes can be seen through a rectangle of pixels.
+#   The test is conservative; boxes that extend behind the camera, and missing boxes, are always considered to be
+#   visible. The corners of all boxes are projected together.
+#   \param bounds The minimum and maximum of the boxes, as returned by _getBoxBounds().
+#   \return A boolean array with an element for each box.
+def _boundingBoxesOverlapRect(bounds: numpy.ndarray, view_projection: numpy.ndarray, rect: Tuple[int, int, int, int], width: int, height: int) -> numpy.ndarray:
+    missing = numpy.isinf(bounds).any(axis=1)
+    bounds = numpy.where(numpy.isinf(bounds), 0.0, bounds)
+    corners = bounds[:, _BoxCornerColumns]  # (boxes, 8, 3)
+    clip = numpy.dot(corners, view_projection[:, :3].T) + view_projection[:, 3]
+    behind = numpy.any(clip[..., 3] <= 0, axis=1)
+
+    w = numpy.where(clip[..., 3] > 0, clip[..., 3], 1.0)
+    pixel_x = (clip[..., 0] / w + 1) / 2 * width
+    pixel_y = (1 - clip[..., 1] / w) / 2 * height  # pixel rows start at the top
+
+    left, top, right, bottom = rect
+    overlaps = (
+        (pixel_x.max(axis=1) >= left) & (pixel_x.min(axis=1) <= right + 1)
+        & (pixel_y.max(axis=1) >= top) & (pixel_y.min(axis=1) <= bottom + 1)
+    )
+    return missing | behind | overlaps
+
+
+##  Find the pixel that hit an object nearest to the center of a square window of pixels.
+#   Pixels that did not hit anything are recognisable by their transparent alpha channel.
+def _nearestHitPixel(window: numpy.ndarray) -> Optional[numpy.ndarray]:
+    nearest = _nearestHit(window[..., 3] != 0)
+    if nearest is None:
+        return None
+    return window[nearest[0], nearest[1]]
+
+
+##  Find the row and column of the hit nearest to the center of a square window of booleans.
+def _nearestHit(hits: numpy.ndarray) -> Optional[Tuple[int, int]]:
+    if hits.size == 0 or not hits.any():
+        return None
+
+    size = hits.shape[0]
+    offsets = numpy.arange(size) - size // 2
+    distances = offsets[:, numpy.newaxis] ** 2 + offsets[numpy.newaxis, :] ** 2
+    distances = numpy.where(hits, distances, size * size)
+    row, column = numpy.unravel_index(numpy.argmin(distances), distances.shape)
+    return int(row), int(column)
@@ -0,0 +1,113 @@
+# Copyright (c) 2023 Aldo Hoeben / fieldOfView
+# MeasureTool is released under the terms of the AGPLv3 or higher.
+
+from cura.CuraApplication import CuraApplication
+from UM.Logger import Logger
+
+from .MeasurePass import MeasurePass
+
+try:
+    from cura.ApplicationMetadata import CuraSDKVersion
+except ImportError:  # Cura <= 3.6
+    CuraSDKVersion = "6.0.0"
+if CuraSDKVersion >= "8.0.0":
+    from PyQt6.QtCore import QTimer
+else:
+    from PyQt5.QtCore import QTimer
+
+from typing import List, Optional, Tuple
+
+
+##  Owns the MeasurePasses that are used for picking, and keeps them the size of the viewport.
+#
+#   Resizing the window emits a burst of size changes; these are collected and applied once the burst is over, or
+#   when the passes are needed before then. Resizing a pass keeps its framebuffer if it is still large enough, so
+#   the framebuffers are only reallocated when the viewport grows beyond them or shrinks far below them.
+class MeasurePassPool:
+    ResizeDelay = 100  # ms to wait for more size changes before resizing the passes
+
+    def __init__(self) -> None:
+        self._passes = []  # type: List[MeasurePass]
+        self._all_axes_supported = None  # type: Optional[bool]
+        self._pick_window_size = 1
+
+        self._resize_timer = QTimer()
+        self._resize_timer.setSingleShot(True)
+        self._resize_timer.setInterval(MeasurePassPool.ResizeDelay)
+        self._resize_timer.timeout.connect(self._applyResize)
+
+    ##  Get the passes to pick with, creating them if needed.
+    #   \return A single pass for all axes, a pass per axis, or an empty list if the passes can not be created.
+    def getPasses(self) -> List[MeasurePass]:
+        if self._resize_timer.isActive():
+            self._resize_timer.stop()
+            self._applyResize()
+        if not self._passes:
+            self._createPasses()
+        return self._passes
+
+    ##  Resize the passes to the viewport after the current burst of size changes.
+    #   Can be connected directly to the size signals of the main window.
+    def requestResize(self, *args, **kwargs) -> None:
+        if self._passes:
+            self._resize_timer.start()
+
+    ##  Stop rendering all axes in a single pass, and use a pass per axis instead.
+    def setAllAxesSupported(self, supported: bool) -> None:
+        if supported == self._all_axes_supported:
+            return
+        self._all_axes_supported = supported
+        self._destroyPasses()
+
+    ##  Release the passes and their OpenGL objects, for example when the application shuts down.
+    def destroy(self) -> None:
+        self._resize_timer.stop()
+        self._destroyPasses()
+
+    def setPickWindowSize(self, size: int) -> None:
+        if size == self._pick_window_size:
+            return
+        self._pick_window_size = size
+        for measure_pass in self._passes:
+            measure_pass.setPickWindowSize(size)
+
+    def _destroyPasses(self) -> None:
+        for measure_pass in self._passes:
+            measure_pass.destroy()
+        self._passes = []
+
+    def _getViewportSize(self) -> Optional[Tuple[int, int]]:
+        active_camera = CuraApplication.getInstance().getController().getScene().getActiveCamera()
+        if not active_camera:
+            return None
+        return active_camera.getViewportWidth(), active_camera.getViewportHeight()
+
+    def _applyResize(self) -> None:
+        size = self._getViewportSize()
+        if size is None:
+            return
+        for measure_pass in self._passes:
+            measure_pass.setSize(*size)
+
+    def _createPasses(self) -> None:
+        size = self._getViewportSize()
+        if size is None:
+            return
+
+        if self._all_axes_supported is None:
+            self._all_axes_supported = MeasurePass.getAllAxesSupported()
+
+        try:
+            if self._all_axes_supported:
+                # Create a single pass that renders the world-space location to a floating point texture
+                passes = [MeasurePass(size[0], size[1], MeasurePass.AllAxes)]
+            else:
+                # Create a set of passes for picking a world-space location from the mouse location
+                passes = [MeasurePass(size[0], size[1], axis) for axis in range(0, 3)]
+        except Exception:
+            Logger.logException("e", "Unable to create the passes for picking")
+            return
+
+        for measure_pass in passes:
+            measure_pass.setPickWindowSize(self._pick_window_size)
+        self._passes = passes
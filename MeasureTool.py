@@ -6,16 +6,35 @@ from UM.Event import Event, MouseEvent
 from UM.Math.Vector import Vector
 from UM.Scene.Selection import Selection
 from UM.Scene.SceneNode import SceneNode
+from UM.Scene.Camera import Camera
+from UM.Scene.ToolHandle import ToolHandle
 from UM.Logger import Logger
 from UM.i18n import i18nCatalog
 from UM.Resources import Resources
-from UM.Version import Version
-from UM.View.GL.OpenGL import OpenGL
 
 from cura.CuraApplication import CuraApplication
 
-from .MeasurePass import MeasurePass
+from .MeasurePass import MeasurePass, getPickedAxesPosition
+from .MeasurePassPool import MeasurePassPool
+from .PickProfiler import PickProfiler
+from .Polyline import Polyline
+from .PickScheduler import PickScheduler
 from .MeasureToolHandle import MeasureToolHandle
+from .GeometryCache import GeometryCache
+from .RayCastPicker import RayCastHit, RayCastPicker, getPickableItems
+from .FeatureSnapper import FeatureSnapper
+from .MinimumDistanceJob import MinimumDistanceJob
+from .MeshDistance import ClosestPoints
+from .WallThickness import WallThickness, getWallThickness, getCombinedStatistics
+from .WallThicknessJob import WallThicknessJob
+from .GeometryCache import NodeGeometry
+from .MeshFeatures import MeshFeatures
+from .Measurements import MeasurementStore
+from .IndexBuilder import IndexBuilder
+from .GeodesicJob import GeodesicJob
+from .CaliperJob import CaliperJob
+from .Calipers import CaliperMeasurement
+from .BatchMeasurer import BatchMeasurer
 
 try:
     from cura.ApplicationMetadata import CuraSDKVersion
@@ -32,20 +51,28 @@ else:
     from PyQt5.QtGui import QVector3D
     KeyboardShiftModifier = Qt.ShiftModifier
 
-from math import inf
+import numpy
 import os.path
 
-from typing import cast, List, Optional
+from typing import Any, Callable, cast, Dict, List, Optional, Set, Tuple
 
 
 class MeasureTool(Tool):
+    PolylinePointPickDistance = 0.03  # distance in mouse coordinates within which a press drags a polyline point
+    PinAnchorDistance = 0.05  # distance in mm within which a pinned point is anchored to the surface of a model
+
     def __init__(self, parent=None) -> None:
         super().__init__()
 
         self._application = CuraApplication.getInstance()
         self._controller = self.getController()
-        self._measure_passes = []  # type: List[MeasurePass]
+        self._measure_pass_pool = MeasurePassPool()
         self._measure_passes_dirty = True
+        self._pick_scheduler = PickScheduler(self._handleDragEvent)
+        self._geometry_cache = GeometryCache()
+        self._ray_cast_picker = RayCastPicker(self._geometry_cache)
+        self._feature_snapper = FeatureSnapper(self._geometry_cache)
+        self._index_builder = IndexBuilder()
 
         self._toolbutton_item = None  # type: Optional[QObject]
         self._tool_enabled = False
@@ -53,6 +80,7 @@ class MeasureTool(Tool):
 
         self._from_locked = False
         self._snap_vertices = False
+        self._snap_features = set()  # type: Set[str]
 
         Resources.addSearchPath(os.path.abspath(os.path.join(
             os.path.dirname(__file__),
@@ -60,39 +88,300 @@ class MeasureTool(Tool):
         )))  # Plugin translation file import
         self._i18n_catalog = i18nCatalog("measuretool")
 
-        self._points = [QVector3D(), QVector3D()]
+        self._polyline = Polyline(2)
+        self._polyline_mode = False
         self._active_point = 0
+        self._insert_point_index = None  # type: Optional[int]
+        self._placed_points = set()  # type: Set[int]  # points that have been placed, when measuring between two points
+
+        self._geodesic_mode = False
+        self._geodesic_path = numpy.zeros((0, 3))
+        self._geodesic_distance = 0.0
+        self._geodesic_status = ""
+        self._geodesic_job = None  # type: Optional[GeodesicJob]
+
+        self._minimum_distance_mode = False
+        self._minimum_distance_job = None  # type: Optional[MinimumDistanceJob]
+        self._minimum_distance_status = ""
+
+        self._wall_thickness_mode = False
+        self._wall_thickness_job = None  # type: Optional[WallThicknessJob]
+        self._wall_thickness_items = []  # type: List[Tuple[NodeGeometry, WallThickness]]
+        # The combined statistics, with the analyses and their versions they were computed for
+        self._wall_thickness_statistics = None  # type: Optional[Tuple[List[Tuple[WallThickness, int]], Optional[Dict[str, float]]]]
+
+        self._caliper_mode = False
+        self._caliper_job = None  # type: Optional[CaliperJob]
+        self._caliper_measurement = None  # type: Optional[CaliperMeasurement]
+        self._caliper_status = ""
+
+        self._measurement_store = MeasurementStore(self._geometry_cache)
+        self._stored_node_count = 0  # number of nodes when the pinned measurements were last stored in the workspace
+        self._loaded_measurements = None  # type: Optional[Dict[str, Any]]  # measurements of a project that is loading
 
         self._handle = (
             MeasureToolHandle()
         )  # type: MeasureToolHandle  # Because for some reason MyPy thinks this variable contains Optional[ToolHandle].
         self._handle.setTool(self)
 
-        self.setExposedProperties("PointA", "PointB", "Distance", "ActivePoint", "FromLocked", "SnapVerticesSupported", "SnapVertices")
+        self.setExposedProperties("PointA", "PointB", "Distance", "ActivePoint", "FromLocked", "SnapVertices", "SnapEdgeMidpoints", "SnapFaceCentroids", "SnapCircleCenters", "PickProfiling", "PickStatistics", "PolylineMode", "SegmentLengths", "TotalLength", "GeodesicMode", "GeodesicDistance", "GeodesicStatus", "MinimumDistanceMode", "MinimumDistanceStatus", "WallThicknessMode", "WallThicknessProgress", "WallThicknessStatistics", "CaliperMode", "CaliperDimensions", "CaliperStatus", "PinnedMeasurements")
 
         self._application.engineCreatedSignal.connect(self._onEngineCreated)
         Selection.selectionChanged.connect(self._onSelectionChanged)
         self._controller.activeStageChanged.connect(self._onActiveStageChanged)
         self._controller.activeToolChanged.connect(self._onActiveToolChanged)
         self._controller.getScene().sceneChanged.connect(self._onSceneChanged)
+        self._application.workspaceLoaded.connect(self._onWorkspaceLoaded)
+        self._application.getPreferences().preferenceChanged.connect(self._onPreferenceChanged)
+        self._application.applicationShuttingDown.connect(self._index_builder.shutdown)
+        self._application.applicationShuttingDown.connect(self._measure_pass_pool.destroy)
 
         self._selection_tool = None  # type: Optional[Tool]
 
         self._application.getPreferences().addPreference("measuretool/unit_factor", 1)
+        self._application.getPreferences().addPreference("measuretool/pick_window_size", 1)
+        self._application.getPreferences().addPreference("measuretool/async_picking", False)
+        self._application.getPreferences().addPreference("measuretool/scissored_picking", False)
+        self._application.getPreferences().addPreference("measuretool/picking_engine", "gpu")
+        self._application.getPreferences().addPreference("measuretool/coordinate_origin", "camera")
+        self._application.getPreferences().addPreference("measuretool/snap_distance", 2)
+        self._application.getPreferences().addPreference("measuretool/pick_profiling", False)
+
+        PickProfiler.getInstance().setEnabled(
+            bool(self._application.getPreferences().getValue("measuretool/pick_profiling"))
+        )
 
     def resetPoints(self) -> None:
-        self._points = [QVector3D(), QVector3D()]
+        if self._polyline_mode:
+            self._polyline.clear()
+        else:
+            self._polyline.setPoints(numpy.zeros((2, 3)))
+        self._placed_points = set()
+        self._active_point = 0
+        self._updateGeodesicPath()
         self.propertyChanged.emit()
         self._controller.getScene().sceneChanged.emit(self._handle)
 
+    ##  Get the first point of the measurement.
     def getPointA(self) -> QVector3D:
-        return self._points[0]
+        if self._polyline.getPointCount() == 0:
+            return QVector3D()
+        return QVector3D(*self._polyline.getPoint(0))
 
+    ##  Get the last point of the measurement.
     def getPointB(self) -> QVector3D:
-        return self._points[1]
+        if self._polyline.getPointCount() == 0:
+            return QVector3D()
+        return QVector3D(*self._polyline.getPoint(-1))
 
     def getDistance(self) -> QVector3D:
-        return self._points[1] - self._points[0]
+        return self.getPointB() - self.getPointA()
+
+    ##  Get all points of the measurement, as an array of shape (point count, 3).
+    def getPolylinePoints(self) -> numpy.ndarray:
+        return self._polyline.getPoints()
+
+    def getPolylineMode(self) -> bool:
+        return self._polyline_mode
+
+    ##  Switch between measuring between two points, and measuring along a chain of points.
+    #   The current points are kept; when switching back to two points, the first and last point are kept.
+    def setPolylineMode(self, polyline_mode: bool) -> None:
+        if polyline_mode == self._polyline_mode:
+            return
+        if polyline_mode:
+            self.setMinimumDistanceMode(False)
+            self.setGeodesicMode(False)
+        self._polyline_mode = polyline_mode
+
+        points = self._polyline.getPoints()
+        if polyline_mode:
+            # Points that were never placed are at the origin, and are not part of the chain
+            self._polyline.setPoints(points[sorted(self._placed_points)])
+            self._active_point = min(self._active_point, max(0, self._polyline.getPointCount() - 1))
+        else:
+            self._polyline.setPoints(points[[0, -1]] if len(points) else numpy.zeros((2, 3)))
+            self._placed_points = {0, 1} if len(points) else set()
+            self._active_point = min(self._active_point, 1)
+
+        self.propertyChanged.emit()
+        self._controller.getScene().sceneChanged.emit(self._handle)
+
+    def getSegmentLengths(self) -> List[float]:
+        return self._polyline.getSegmentLengths().tolist()
+
+    def getTotalLength(self) -> float:
+        return self._polyline.getTotalLength()
+
+    def getGeodesicMode(self) -> bool:
+        return self._geodesic_mode
+
+    ##  Switch between measuring the straight distance between the two points, and the shortest distance over the
+    #   surface of the model they are on.
+    def setGeodesicMode(self, geodesic_mode: bool) -> None:
+        if geodesic_mode == self._geodesic_mode:
+            return
+        if geodesic_mode:
+            self.setPolylineMode(False)
+            self.setMinimumDistanceMode(False)
+        self._geodesic_mode = geodesic_mode
+
+        self._scheduleIndexes()
+        self._updateGeodesicPath()
+        self.propertyChanged.emit()
+        self._controller.getScene().sceneChanged.emit(self._handle)
+
+    ##  Get the length of the shortest path over the surface between the two points, in mm.
+    def getGeodesicDistance(self) -> float:
+        return self._geodesic_distance
+
+    ##  Get a message about why there is no path over the surface, or an empty string if there is one.
+    def getGeodesicStatus(self) -> str:
+        return self._geodesic_status
+
+    ##  Get the points of the shortest path over the surface between the two points, as an array of shape (points, 3).
+    def getGeodesicPath(self) -> numpy.ndarray:
+        return self._geodesic_path
+
+    def getMinimumDistanceMode(self) -> bool:
+        return self._minimum_distance_mode
+
+    ##  Switch between picking the points, and placing them at the closest points between the two selected objects.
+    def setMinimumDistanceMode(self, minimum_distance_mode: bool) -> None:
+        if minimum_distance_mode == self._minimum_distance_mode:
+            return
+        if minimum_distance_mode:
+            self.setPolylineMode(False)
+            self.setGeodesicMode(False)
+        self._minimum_distance_mode = minimum_distance_mode
+
+        if minimum_distance_mode:
+            self._updateMinimumDistance()
+        else:
+            self._cancelMinimumDistance()
+            self._minimum_distance_status = ""
+        self.propertyChanged.emit()
+
+    ##  Get a message about the state of the search for the closest points, or an empty string if they are shown.
+    def getMinimumDistanceStatus(self) -> str:
+        return self._minimum_distance_status
+
+    def getWallThicknessMode(self) -> bool:
+        return self._wall_thickness_mode
+
+    ##  Show the wall thickness of the selected objects as a heat map.
+    def setWallThicknessMode(self, wall_thickness_mode: bool) -> None:
+        if wall_thickness_mode == self._wall_thickness_mode:
+            return
+        self._wall_thickness_mode = wall_thickness_mode
+
+        if wall_thickness_mode:
+            self._updateWallThickness()
+        else:
+            self._cancelWallThickness()
+            self._wall_thickness_items = []
+        self.propertyChanged.emit()
+        self._controller.getScene().sceneChanged.emit(self._handle)
+
+    ##  Get the percentage of the vertices of the selected objects of which the wall thickness has been computed.
+    def getWallThicknessProgress(self) -> float:
+        batch_counts = [max(1, analysis.getBatchCount()) for _, analysis in self._wall_thickness_items]
+        if not batch_counts:
+            return 100.0
+        done = sum(analysis.getProgress() * count for (_, analysis), count in zip(self._wall_thickness_items, batch_counts))
+        return 100 * done / sum(batch_counts)
+
+    ##  Get the minimum and the 5th, 50th and 95th percentile of the wall thickness computed so far, in mm.
+    #   \return A list of those four values, or an empty list if no thickness is known.
+    def getWallThicknessStatistics(self) -> List[float]:
+        versions = [(analysis, analysis.getVersion()) for _, analysis in self._wall_thickness_items]
+        if self._wall_thickness_statistics is None or self._wall_thickness_statistics[0] != versions:
+            self._wall_thickness_statistics = (versions, getCombinedStatistics([analysis for analysis, _ in versions]))
+        statistics = self._wall_thickness_statistics[1]
+        if statistics is None:
+            return []
+        return [statistics["min"], statistics["p5"], statistics["p50"], statistics["p95"]]
+
+    ##  Get the geometry of the nodes of which the wall thickness is shown, with their wall thickness analysis.
+    def getWallThicknessItems(self) -> List[Tuple[NodeGeometry, WallThickness]]:
+        return self._wall_thickness_items
+
+    ##  Get the thickness that is shown as the thick end of the heat map, in mm.
+    def getWallThicknessColorRange(self) -> float:
+        statistics = self.getWallThicknessStatistics()
+        return statistics[3] if statistics else 1.0
+
+    def getCaliperMode(self) -> bool:
+        return self._caliper_mode
+
+    ##  Show the smallest box around the selected objects, and their smallest and largest width.
+    def setCaliperMode(self, caliper_mode: bool) -> None:
+        if caliper_mode == self._caliper_mode:
+            return
+        self._caliper_mode = caliper_mode
+
+        if caliper_mode:
+            self._updateCalipers()
+        else:
+            self._cancelCalipers()
+            self._caliper_measurement = None
+            self._caliper_status = ""
+        self.propertyChanged.emit()
+        self._controller.getScene().sceneChanged.emit(self._handle)
+
+    ##  Get the lengths of the edges of the smallest box around the selected objects from the longest to the shortest,
+    #   followed by the smallest and the largest width of the objects, in mm.
+    #   \return A list of those five values, or an empty list if they are not known.
+    def getCaliperDimensions(self) -> List[float]:
+        if self._caliper_measurement is None:
+            return []
+        return [float(extent) for extent in self._caliper_measurement.extents] + [
+            self._caliper_measurement.minimum_width, self._caliper_measurement.getMaximumWidth()
+        ]
+
+    ##  Get a message about the state of the measurement of the selected objects, or an empty string if it is shown.
+    def getCaliperStatus(self) -> str:
+        return self._caliper_status
+
+    ##  Get the edges of the smallest box around the selected objects and the line between the two points that are
+    #   farthest apart, as an array of shape (segments, 2, 3).
+    def getCaliperSegments(self) -> numpy.ndarray:
+        if self._caliper_measurement is None:
+            return numpy.zeros((0, 2, 3))
+        return numpy.concatenate([
+            self._caliper_measurement.getEdges(), self._caliper_measurement.maximum_width_points[numpy.newaxis]
+        ])
+
+    ##  Keep the current measurement, anchored to the surfaces it was measured on so it follows the models when they
+    #   are moved, rotated or scaled. Pinned measurements are saved with the project.
+    def pinMeasurement(self) -> None:
+        points = self._polyline.getPoints()
+        if len(points) < 2 or (not self._polyline_mode and len(self._placed_points) < 2):
+            return
+
+        items = list(getPickableItems(self._controller.getScene().getRoot()))
+        anchors = [self._findAnchor(items, point) for point in points]
+        for index in range(len(points) - 1):
+            self._measurement_store.addMeasurement(anchors[index:index + 2], points[index:index + 2])
+        self._loaded_measurements = None
+        self._onPinnedMeasurementsChanged()
+
+    def clearPinnedMeasurements(self) -> None:
+        if self._measurement_store.getCount():
+            self._measurement_store.clear()
+            self._onPinnedMeasurementsChanged()
+
+    ##  Get the lengths of the pinned measurements, in mm.
+    def getPinnedMeasurements(self) -> List[float]:
+        return self._measurement_store.getLengths().tolist()
+
+    ##  Get the points of the pinned measurements, as an array of shape (measurements, 2, 3).
+    def getPinnedSegments(self) -> numpy.ndarray:
+        return self._measurement_store.getSegments()
+
+    ##  Get a measurer for scripts, which shares the hierarchies and hulls of the meshes with this tool.
+    def getBatchMeasurer(self) -> BatchMeasurer:
+        return BatchMeasurer(self._geometry_cache)
 
     def getActivePoint(self) -> int:
         return self._active_point
@@ -111,17 +400,53 @@ class MeasureTool(Tool):
             self._active_point = 1
             self.propertyChanged.emit()
 
-    def getSnapVerticesSupported(self) -> bool:
-        # Use a dummy postfix, since an equal version with a postfix is considered smaller normally.
-        return Version(OpenGL.getInstance().getOpenGLVersion()) >= Version("4.1 dummy-postfix")
-
     def getSnapVertices(self) -> bool:
         return self._snap_vertices
 
     def setSnapVertices(self, snap) -> None:
         if snap != self._snap_vertices:
             self._snap_vertices = snap
-            self._measure_passes_dirty = True
+            self._scheduleIndexes()
+            self.propertyChanged.emit()
+
+    def getSnapEdgeMidpoints(self) -> bool:
+        return MeshFeatures.EdgeMidpoints in self._snap_features
+
+    def setSnapEdgeMidpoints(self, snap) -> None:
+        self._setSnapFeature(MeshFeatures.EdgeMidpoints, snap)
+
+    def getSnapFaceCentroids(self) -> bool:
+        return MeshFeatures.FaceCentroids in self._snap_features
+
+    def setSnapFaceCentroids(self, snap) -> None:
+        self._setSnapFeature(MeshFeatures.FaceCentroids, snap)
+
+    def getSnapCircleCenters(self) -> bool:
+        return MeshFeatures.CircleCenters in self._snap_features
+
+    def setSnapCircleCenters(self, snap) -> None:
+        self._setSnapFeature(MeshFeatures.CircleCenters, snap)
+
+    def getPickProfiling(self) -> bool:
+        return PickProfiler.getInstance().isEnabled()
+
+    def setPickProfiling(self, profiling: bool) -> None:
+        if profiling != PickProfiler.getInstance().isEnabled():
+            PickProfiler.getInstance().setEnabled(profiling)
+            self._application.getPreferences().setValue("measuretool/pick_profiling", profiling)
+            self.propertyChanged.emit()
+
+    ##  Get the percentiles of the time spent in each stage of recent picks, as text.
+    def getPickStatistics(self) -> str:
+        return PickProfiler.getInstance().getSummaryText()
+
+    def _setSnapFeature(self, feature: str, snap: bool) -> None:
+        if snap != (feature in self._snap_features):
+            if snap:
+                self._snap_features.add(feature)
+            else:
+                self._snap_features.discard(feature)
+            self._scheduleIndexes()
             self.propertyChanged.emit()
 
     def _onEngineCreated(self) -> None:
@@ -132,12 +457,22 @@ class MeasureTool(Tool):
         self._toolbutton_item = self._findToolbarIcon(main_window.contentItem())
         self._forceToolEnabled()
 
-        main_window.viewportRectChanged.connect(self._createPickingPass)
-        main_window.widthChanged.connect(self._createPickingPass)
-        main_window.heightChanged.connect(self._createPickingPass)
+        main_window.viewportRectChanged.connect(self._measure_pass_pool.requestResize)
+        main_window.widthChanged.connect(self._measure_pass_pool.requestResize)
+        main_window.heightChanged.connect(self._measure_pass_pool.requestResize)
+        main_window.frameSwapped.connect(self._onFrameSwapped)
         self.propertyChanged.emit()
 
+    ##  Let the pick scheduler pick for the next frame. The frameSwapped signal may be emitted on the render thread, so
+    #   the pick is deferred to the main thread rather than rendered from inside the swap notification.
+    def _onFrameSwapped(self) -> None:
+        if self._pick_scheduler.isWaitingForFrame():
+            self._application.callLater(self._pick_scheduler.onFrame)
+
     def _onSelectionChanged(self) -> None:
+        if self._controller.getActiveTool() == self:
+            self._updateSelectionAnalyses()
+
         if not self._toolbutton_item:
             return
         self._application.callLater(lambda: self._forceToolEnabled())
@@ -160,7 +495,173 @@ class MeasureTool(Tool):
         if node == self._handle:
             return
 
+        # The picking passes depend on the camera and the whole scene, but the cached geometry only needs to be
+        # recomputed for nodes that have actually moved or changed. Moving the camera or the handle of another tool
+        # changes no models, so the scene is not walked for those
         self._measure_passes_dirty = True
+        if isinstance(node, (Camera, ToolHandle)):
+            return
+
+        items = list(getPickableItems(self._controller.getScene().getRoot()))
+        changed, removed = self._geometry_cache.update(items)
+        if changed or removed:
+            self._scheduleIndexes(items)
+            if self._geodesic_mode:
+                self._updateGeodesicPath()
+                self.propertyChanged.emit()
+                self._controller.getScene().sceneChanged.emit(self._handle)
+
+        if self._loaded_measurements is not None and (changed or removed):
+            self._restorePinnedMeasurements()
+        elif self._measurement_store.getCount():
+            if self._measurement_store.update(changed, removed):
+                self.propertyChanged.emit()
+                self._controller.getScene().sceneChanged.emit(self._handle)
+            if removed or len(items) != self._stored_node_count:
+                # The stored measurements refer to nodes by their order, which changes when nodes are added or removed
+                self._storePinnedMeasurements()
+
+        if (changed or removed) and self._controller.getActiveTool() == self:
+            selected_nodes = set(id(item[0]) for node in Selection.getAllSelectedObjects() for item in getPickableItems(node))
+            if any(id(node) in selected_nodes for node in changed + removed):
+                self._updateSelectionAnalyses()
+
+    ##  Find the triangle of a model that a point is on.
+    #   \return A tuple of the node, the index of the triangle in its mesh data and the barycentric coordinates of the
+    #   point within the triangle, or None if the point is not on a model (for example when it is on the build plate).
+    def _findAnchor(self, items: List[Tuple[SceneNode, numpy.ndarray, Any]], point: numpy.ndarray) -> Optional[Tuple[SceneNode, int, Tuple[float, float]]]:
+        hit = self._findSurfaceHit(items, point)
+        if hit is None:
+            return None
+        return hit.node, hit.triangle_id, hit.barycentric
+
+    ##  Find where a point is on the surface of the models, by casting a short ray from the direction of the camera.
+    #   \return The hit, or None if the point is not within PinAnchorDistance of any of the models.
+    def _findSurfaceHit(self, items: List[Tuple[SceneNode, numpy.ndarray, Any]], point: numpy.ndarray) -> Optional[RayCastHit]:
+        camera_position = self._getCameraPosition()
+        if camera_position is None or not items:
+            return None
+        return self._ray_cast_picker.pickSurface(items, point, camera_position, MeasureTool.PinAnchorDistance)
+
+    def _getCameraPosition(self) -> Optional[numpy.ndarray]:
+        camera = self._controller.getScene().getActiveCamera()
+        if not camera:
+            return None
+        position = camera.getWorldPosition()
+        return numpy.array([position.x, position.y, position.z])
+
+    def _onPreferenceChanged(self, preference: str) -> None:
+        if preference == "measuretool/picking_engine":
+            self._scheduleIndexes()
+        elif preference == "measuretool/coordinate_origin":
+            self._measure_passes_dirty = True
+
+    ##  Build the indexes that picking and snapping need for the meshes in the scene in the background, starting with
+    #   the meshes in view. Builds of meshes that are no longer in the scene are cancelled.
+    def _scheduleIndexes(self, items: Optional[List[Tuple[SceneNode, numpy.ndarray, Any]]] = None) -> None:
+        if items is None:
+            items = list(getPickableItems(self._controller.getScene().getRoot()))
+        bvh = self._application.getPreferences().getValue("measuretool/picking_engine") == "cpu"
+        features = self._getSnapFeatureTypes()
+        if features:
+            # Snapping locates the triangle under a picked position with the hierarchy
+            bvh = True
+        if self._geodesic_mode:
+            # The points are located on the surface with the hierarchy
+            bvh = True
+        if not bvh and not features:
+            items = []
+
+        camera = self._controller.getScene().getActiveCamera()
+        view_projection = None  # type: Optional[numpy.ndarray]
+        camera_position = numpy.zeros(3)
+        if camera:
+            view_projection = numpy.dot(
+                camera.getProjectionMatrix().getData(),
+                numpy.linalg.inv(camera.getWorldTransformation().getData())
+            )
+            camera_position = camera.getWorldTransformation().getData()[:3, 3]
+
+        self._index_builder.schedule([
+            (self._geometry_cache.getMeshGeometry(mesh_data), self._getViewPriority(node, view_projection, camera_position))
+            for node, _, mesh_data in items
+        ], bvh, features)
+
+    ##  Get the order in which to build the indexes of a node: first the nodes that are in view, nearest first.
+    def _getViewPriority(self, node: SceneNode, view_projection: Optional[numpy.ndarray], camera_position: numpy.ndarray) -> Tuple[int, float]:
+        bounding_box = node.getBoundingBox()
+        if view_projection is None or bounding_box is None:
+            return 1, 0.0
+
+        minimum = numpy.array([bounding_box.minimum.x, bounding_box.minimum.y, bounding_box.minimum.z])
+        maximum = numpy.array([bounding_box.maximum.x, bounding_box.maximum.y, bounding_box.maximum.z])
+        distance = float(numpy.linalg.norm((minimum + maximum) / 2 - camera_position))
+
+        corners = numpy.array([
+            [x, y, z, 1.0] for x in (minimum[0], maximum[0]) for y in (minimum[1], maximum[1]) for z in (minimum[2], maximum[2])
+        ])
+        clip = corners.dot(view_projection.T)
+        in_front = clip[:, 3] > 1e-6
+        if not in_front.any():
+            return 1, distance
+        if not in_front.all():
+            return 0, distance  # the camera is inside or right next to the box
+
+        # Conservatively, the box is in view if the bounds of its projected corners overlap the viewport
+        ndc = clip[:, :2] / clip[:, 3:4]
+        in_view = bool((ndc.max(axis=0) >= -1).all() and (ndc.min(axis=0) <= 1).all())
+        return (0 if in_view else 1), distance
+
+    def _getSnapFeatureTypes(self) -> List[str]:
+        features = sorted(self._snap_features)
+        if self._snap_vertices:
+            features.insert(0, MeshFeatures.Vertices)
+        return features
+
+    def _onPinnedMeasurementsChanged(self) -> None:
+        self._storePinnedMeasurements()
+        self.propertyChanged.emit()
+        self._controller.getScene().sceneChanged.emit(self._handle)
+
+    ##  Store the pinned measurements in the metadata of the workspace, so they are saved with the project.
+    def _storePinnedMeasurements(self) -> None:
+        nodes = [item[0] for item in getPickableItems(self._controller.getScene().getRoot())]
+        self._stored_node_count = len(nodes)
+        try:
+            self._application.getWorkspaceMetadataStorage().setEntryToStore(
+                self.getPluginId(), "measurements", self._measurement_store.serialize(nodes)
+            )
+        except AttributeError:  # Cura < 4.1
+            pass
+
+    def _onWorkspaceLoaded(self, file_name: str) -> None:
+        self._measurement_store.clear()
+        self.propertyChanged.emit()
+        try:
+            self._loaded_measurements = self._application.getWorkspaceMetadataStorage().getPluginMetadataEntry(
+                self.getPluginId(), "measurements"
+            )
+        except AttributeError:  # Cura < 4.1
+            return
+        if self._loaded_measurements is not None:
+            # The nodes of the project may not all be in the scene yet; if not, this is tried again as they are added
+            self._application.callLater(self._restorePinnedMeasurements)
+
+    ##  Restore the pinned measurements of a project that was loaded, once the nodes they refer to are in the scene.
+    #   If the measurements can not be restored once all nodes of the project are in the scene, they are dropped.
+    def _restorePinnedMeasurements(self) -> None:
+        if self._loaded_measurements is None:
+            return
+        nodes = [item[0] for item in getPickableItems(self._controller.getScene().getRoot())]
+        if self._measurement_store.deserialize(self._loaded_measurements, nodes):
+            self._loaded_measurements = None
+            self._onPinnedMeasurementsChanged()
+            return
+
+        node_count = MeasurementStore.getSerializedNodeCount(self._loaded_measurements)
+        if node_count is None or len(nodes) >= node_count:
+            Logger.log("w", "Unable to restore the pinned measurements of the project; they do not match the objects in the scene.")
+            self._loaded_measurements = None
 
     def _findToolbarIcon(self, rootItem: QObject) -> Optional[QObject]:
         for child in rootItem.childItems():
@@ -215,6 +716,8 @@ class MeasureTool(Tool):
             self._selection_tool = self._controller._selection_tool
             self._controller.setSelectionTool(None)
 
+            self._updateSelectionAnalyses()
+
             self._application.callLater(lambda: self._forceToolEnabled(passive=True))
 
         if event.type == Event.ToolDeactivateEvent:
@@ -227,15 +730,31 @@ class MeasureTool(Tool):
             event.type == Event.MouseReleaseEvent
             and MouseEvent.LeftButton in cast(MouseEvent, event).buttons
         ):
+            if self._dragging:
+                # Resolve the exact position under the cursor, instead of the last position that was picked or read
+                # back during the drag
+                self._pick_scheduler.cancel()
+                if self._getAsyncPicking() and not self._getRayCastPicking():
+                    for measure_pass in self._getMeasurePasses():
+                        measure_pass.cancelPickRequests()
+                result = self._handleMouseEvent(event, result)
+                self._dragging = False
+                if self._geodesic_mode:
+                    self._updateGeodesicPath()
             self._dragging = False
+            self._insert_point_index = None
 
         if (
             event.type == Event.MousePressEvent
             and MouseEvent.LeftButton in cast(MouseEvent, event).buttons
+            and not self._minimum_distance_mode  # the points are placed by the search, clicks only select objects
         ):
             mouse_event = cast(MouseEvent, event)
 
-            if self._from_locked:
+            self._insert_point_index = None
+            if self._polyline_mode:
+                self._choosePolylinePoint(mouse_event)
+            elif self._from_locked:
                 self._active_point = 1
             elif QApplication.keyboardModifiers() & KeyboardShiftModifier:
                 if self._active_point == 0:
@@ -246,10 +765,10 @@ class MeasureTool(Tool):
                 distances = []  # type: List[float]
                 camera = self._controller.getScene().getActiveCamera()
 
-                for point in self._points:
+                for point in self._polyline.getPoints():
                     if camera.isPerspective():
                         projected_point = camera.project(
-                            Vector(point.x(), point.y(), point.z())
+                            Vector(float(point[0]), float(point[1]), float(point[2]))
                         )
                     else:
                         # Camera.project() does not work for orthographic views in Cura 4.9 and before, so we calculate our own projection
@@ -257,7 +776,7 @@ class MeasureTool(Tool):
                         view = camera.getWorldTransformation()
                         view.invert()
 
-                        position = Vector(point.x(), point.y(), point.z())
+                        position = Vector(float(point[0]), float(point[1]), float(point[2]))
                         position = position.preMultiply(view)
                         position = position.preMultiply(projection)
 
@@ -277,62 +796,485 @@ class MeasureTool(Tool):
                 if distances[1] < distances[0]:
                     self._active_point = 1
 
+            self._pick_scheduler.cancel()
             self._dragging = True
             result = self._handleMouseEvent(event, result)
+            if self._insert_point_index is not None:
+                # The press missed, so no point was added; do not add it later in the drag, or drag another point
+                self._insert_point_index = None
+                self._dragging = False
 
         if event.type == Event.MouseMoveEvent:
             if self._dragging:
-                result = self._handleMouseEvent(event, result)
+                self._pick_scheduler.schedule(event)
 
         if self._selection_tool:
             self._selection_tool.event(event)
 
         return result
 
+    ##  Update the measurements of the modes that depend on the selected objects.
+    def _updateSelectionAnalyses(self) -> None:
+        if self._minimum_distance_mode:
+            self._updateMinimumDistance()
+        if self._wall_thickness_mode:
+            self._updateWallThickness()
+        if self._caliper_mode:
+            self._updateCalipers()
+
+    ##  Find the closest points between the two selected objects, and show them as point A and point B.
+    #   The search runs in a background job, which is cancelled when the selection or the selected objects change
+    #   before it has finished. Results are cached until either object moves, and are shown immediately.
+    def _updateMinimumDistance(self) -> None:
+        self._cancelMinimumDistance()
+
+        geometries = [
+            self._geometry_cache.getNodeGeometries(getPickableItems(node)) for node in Selection.getAllSelectedObjects()
+        ]
+        if len(geometries) != 2 or not geometries[0] or not geometries[1]:
+            self._setMinimumDistanceStatus(self._i18n_catalog.i18nc("@label", "Select two objects"))
+            return
+
+        job = MinimumDistanceJob(geometries[0], geometries[1])
+        if job.isCached():
+            job.run()
+            self._showClosestPoints(job.getResult())
+            return
+
+        self._minimum_distance_job = job
+        job.finished.connect(self._onMinimumDistanceJobFinished)
+        job.start()
+        self._setMinimumDistanceStatus(self._i18n_catalog.i18nc("@label", "Finding the closest points..."))
+
+    def _cancelMinimumDistance(self) -> None:
+        if self._minimum_distance_job is not None:
+            self._minimum_distance_job.finished.disconnect(self._onMinimumDistanceJobFinished)
+            self._minimum_distance_job.cancel()
+            self._minimum_distance_job = None
+
+    def _onMinimumDistanceJobFinished(self, job: MinimumDistanceJob) -> None:
+        if job is not self._minimum_distance_job:
+            return
+        self._minimum_distance_job = None
+        self._showClosestPoints(job.getResult())
+
+    def _showClosestPoints(self, closest_points: Optional[ClosestPoints]) -> None:
+        if closest_points is None:
+            self._setMinimumDistanceStatus(self._i18n_catalog.i18nc("@label", "The selected objects have no faces"))
+            return
+
+        self._polyline.setPoints(numpy.array([closest_points.point_a, closest_points.point_b]))
+        self._placed_points = {0, 1}
+        self._minimum_distance_status = ""
+        self.propertyChanged.emit()
+        self._controller.getScene().sceneChanged.emit(self._handle)
+
+    def _setMinimumDistanceStatus(self, status: str) -> None:
+        if status != self._minimum_distance_status:
+            self._minimum_distance_status = status
+            self.propertyChanged.emit()
+
+    ##  Find the shortest path over the surface between the two points in a background job.
+    #   The search starts at the point that is not being dragged, so the distances from it can be reused while the
+    #   other point is dragged. During a drag the path is only searched for near the path over the graph of the surface;
+    #   it is refined when the drag ends. The previous path is shown until the new one is found, unless the hierarchies
+    #   of the models or the graph of the surface have to be built first.
+    def _updateGeodesicPath(self) -> None:
+        self._cancelGeodesicPath()
+        points = self._polyline.getPoints()
+        if not self._geodesic_mode or len(points) != 2:
+            self._showGeodesicPath(numpy.zeros((0, 3)), 0.0, "")
+            return
+
+        items = list(getPickableItems(self._controller.getScene().getRoot()))
+        source = 1 - min(self._active_point, 1)
+        job = GeodesicJob(
+            self._ray_cast_picker, self._geometry_cache.getNodeGeometries(items), points[source], points[1 - source],
+            self._getCameraPosition(), MeasureTool.PinAnchorDistance, refine=not self._dragging
+        )
+        if not job.isPrepared():
+            self._showGeodesicPath(numpy.zeros((0, 3)), 0.0, self._i18n_catalog.i18nc("@label", "Preparing the surface of the model..."))
+
+        self._geodesic_job = job
+        job.finished.connect(self._onGeodesicJobFinished)
+        job.start()
+
+    def _cancelGeodesicPath(self) -> None:
+        if self._geodesic_job is not None:
+            self._geodesic_job.finished.disconnect(self._onGeodesicJobFinished)
+            self._geodesic_job.cancel()
+            self._geodesic_job = None
+
+    def _onGeodesicJobFinished(self, job: GeodesicJob) -> None:
+        if job is not self._geodesic_job:
+            return
+        self._geodesic_job = None
+
+        result = job.getResult()
+        if result is not None:
+            node_geometry, path = result
+            self._showGeodesicPath(node_geometry.transformPoints(path.points), path.distance, "")
+        elif job.getError() == GeodesicJob.NotOnSameModel:
+            self._showGeodesicPath(numpy.zeros((0, 3)), 0.0, self._i18n_catalog.i18nc("@label", "Place both points on the same model"))
+        else:
+            self._showGeodesicPath(numpy.zeros((0, 3)), 0.0, self._i18n_catalog.i18nc("@label", "The points are not connected over the surface"))
+
+    def _showGeodesicPath(self, path: numpy.ndarray, distance: float, status: str) -> None:
+        self._geodesic_path = path
+        self._geodesic_distance = distance
+        self._geodesic_status = status
+        self.propertyChanged.emit()
+        self._controller.getScene().sceneChanged.emit(self._handle)
+
+    ##  Show the wall thickness of the selected objects, computing it in a background job where it is not cached yet.
+    def _updateWallThickness(self) -> None:
+        geometries = [
+            node_geometry for node in Selection.getAllSelectedObjects()
+            for node_geometry in self._geometry_cache.getNodeGeometries(getPickableItems(node))
+        ]
+        items = [(node_geometry, getWallThickness(node_geometry)) for node_geometry in geometries]
+        analyses = [analysis for _, analysis in items]
+
+        if self._wall_thickness_job is not None and self._wall_thickness_job.getAnalyses() != analyses:
+            self._cancelWallThickness()
+        self._wall_thickness_items = items
+
+        if self._wall_thickness_job is None and not all(analysis.isComplete() for analysis in analyses):
+            self._wall_thickness_job = WallThicknessJob(analyses, self._index_builder)
+            self._wall_thickness_job.progress.connect(self._onWallThicknessJobProgress)
+            self._wall_thickness_job.finished.connect(self._onWallThicknessJobFinished)
+            self._wall_thickness_job.start()
+
+        self.propertyChanged.emit()
+        self._controller.getScene().sceneChanged.emit(self._handle)
+
+    def _cancelWallThickness(self) -> None:
+        if self._wall_thickness_job is not None:
+            self._wall_thickness_job.progress.disconnect(self._onWallThicknessJobProgress)
+            self._wall_thickness_job.finished.disconnect(self._onWallThicknessJobFinished)
+            self._wall_thickness_job.cancel()
+            self._wall_thickness_job = None
+
+    def _onWallThicknessJobProgress(self, job: WallThicknessJob, amount: float) -> None:
+        if job is not self._wall_thickness_job:
+            return
+        self.propertyChanged.emit()
+        self._controller.getScene().sceneChanged.emit(self._handle)
+
+    def _onWallThicknessJobFinished(self, job: WallThicknessJob) -> None:
+        if job is not self._wall_thickness_job:
+            return
+        self._wall_thickness_job = None
+        self.propertyChanged.emit()
+        self._controller.getScene().sceneChanged.emit(self._handle)
+
+    ##  Measure the smallest box around the selected objects in a background job.
+    #   Results are cached with the meshes, so rotating or moving a single object shows its new box immediately.
+    def _updateCalipers(self) -> None:
+        self._cancelCalipers()
+        self._caliper_measurement = None
+
+        geometries = [
+            node_geometry for node in Selection.getAllSelectedObjects()
+            for node_geometry in self._geometry_cache.getNodeGeometries(getPickableItems(node))
+        ]
+        if not geometries:
+            self._caliper_status = self._i18n_catalog.i18nc("@label", "Select one or more objects")
+            self.propertyChanged.emit()
+            self._controller.getScene().sceneChanged.emit(self._handle)
+            return
+
+        job = CaliperJob(geometries)
+        if job.isCached():
+            job.run()
+            self._showCalipers(job.getResult())
+            return
+
+        self._caliper_job = job
+        job.finished.connect(self._onCaliperJobFinished)
+        job.start()
+        self._caliper_status = self._i18n_catalog.i18nc("@label", "Measuring the selected objects...")
+        self.propertyChanged.emit()
+        self._controller.getScene().sceneChanged.emit(self._handle)
+
+    def _cancelCalipers(self) -> None:
+        if self._caliper_job is not None:
+            self._caliper_job.finished.disconnect(self._onCaliperJobFinished)
+            self._caliper_job.cancel()
+            self._caliper_job = None
+
+    def _onCaliperJobFinished(self, job: CaliperJob) -> None:
+        if job is not self._caliper_job:
+            return
+        self._caliper_job = None
+        self._showCalipers(job.getResult())
+
+    def _showCalipers(self, measurement: Optional[CaliperMeasurement]) -> None:
+        self._caliper_measurement = measurement
+        if measurement is None:
+            self._caliper_status = self._i18n_catalog.i18nc("@label", "The selected objects have no vertices")
+        else:
+            self._caliper_status = ""
+        self.propertyChanged.emit()
+        self._controller.getScene().sceneChanged.emit(self._handle)
+
+    ##  Choose which point of the polyline a mouse press drags, or where it adds a new point.
+    #   Pressing near a point drags that point. Pressing elsewhere appends a point to the end of the polyline, or with
+    #   shift held inserts a point into the nearest segment.
+    def _choosePolylinePoint(self, mouse_event: MouseEvent) -> None:
+        mouse_position = numpy.array([mouse_event.x, mouse_event.y])
+        projected_points = self._projectToMouseCoordinates(self._polyline.getPoints())
+
+        if len(projected_points):
+            distances = numpy.linalg.norm(projected_points - mouse_position, axis=1)
+            nearest = int(numpy.argmin(distances))
+            if distances[nearest] < self.PolylinePointPickDistance:
+                self._active_point = nearest
+                return
+
+        if QApplication.keyboardModifiers() & KeyboardShiftModifier:
+            nearest_segment = self._polyline.findNearestSegment(projected_points, mouse_position)
+            if nearest_segment is not None:
+                self._insert_point_index = nearest_segment[0] + 1
+                return
+
+        self._insert_point_index = self._polyline.getPointCount()
+
+    ##  Project world space points to the coordinates of mouse events.
+    #   \return An array of shape (point count, 2).
+    def _projectToMouseCoordinates(self, points: numpy.ndarray) -> numpy.ndarray:
+        camera = self._controller.getScene().getActiveCamera()
+        if len(points) == 0 or not camera:
+            return numpy.zeros((0, 2))
+
+        view_projection = numpy.dot(
+            camera.getProjectionMatrix().getData(),
+            numpy.linalg.inv(camera.getWorldTransformation().getData())
+        )
+        clip = numpy.dot(numpy.hstack([points, numpy.ones((len(points), 1))]), view_projection.T)
+        ndc = clip[:, :2] / clip[:, 3:4]
+
+        # Mouse coordinates run from -1 to 1 over the window, top to bottom
+        return numpy.stack([
+            (ndc[:, 0] + 1) * camera.getViewportWidth() / camera.getWindowSize()[0] - 1,
+            -ndc[:, 1]
+        ], axis=1)
+
+    ##  Pick for a mouse move event during a drag, as scheduled by the PickScheduler.
+    def _handleDragEvent(self, event: Event) -> None:
+        if not self._dragging:
+            return
+        if self._getAsyncPicking() and not self._getRayCastPicking():
+            self._handleMouseEventAsync(event, True)
+        else:
+            self._handleMouseEvent(event, True)
+
     def _handleMouseEvent(self, event: Event, result: bool) -> bool:
-        if not self._measure_passes:
-            self._createPickingPass()
-        if not self._measure_passes:
+        return self._profilePick(self._pickActivePoint, event, result)
+
+    ##  Pick the position under the mouse without waiting for the GPU to finish rendering.
+    #   The active point is moved to the most recent position that has been read back, which may be a frame behind.
+    def _handleMouseEventAsync(self, event: Event, result: bool) -> bool:
+        return self._profilePick(self._pickActivePointAsync, event, result)
+
+    ##  Time a pick with the profiler. The statistics in the tool panel are only updated once the pick has ended, so
+    #   they include the propagation of the new position of that pick.
+    def _profilePick(self, pick: Callable[[Event, bool], bool], event: Event, result: bool) -> bool:
+        profiler = PickProfiler.getInstance()
+        profiler.beginPick()
+        try:
+            return pick(event, result)
+        finally:
+            if profiler.endPick():
+                self.propertyChanged.emit()
+
+    def _pickActivePoint(self, event: Event, result: bool) -> bool:
+        if self._getRayCastPicking():
+            hit = self._pickRayCast(cast(MouseEvent, event))
+            if hit is None:
+                return False
+
+            self._setActivePointCoordinate([float(value) for value in hit.position], hit)
+            return result
+
+        picked_coordinate = self._pickCoordinate(cast(MouseEvent, event))
+        if picked_coordinate is None:
             return False
 
-        picked_coordinate = []
+        self._setActivePointCoordinate(picked_coordinate)
+
+        return result
+
+    def _pickActivePointAsync(self, event: Event, result: bool) -> bool:
         mouse_event = cast(MouseEvent, event)
+        if not self._renderMeasurePasses(mouse_event):
+            return False
+        measure_passes = self._getMeasurePasses()
+        if len(measure_passes) != 1 or not measure_passes[0].getAsyncPickingSupported():
+            return self._pickActivePoint(event, result)
 
-        for axis in self._measure_passes:
-            if self._measure_passes_dirty:
-                axis.render(self._snap_vertices)
+        measure_pass = measure_passes[0]
+        measure_pass.requestPickedPosition(mouse_event.x, mouse_event.y)
 
-            axis_value = axis.getPickedCoordinate(mouse_event.x, mouse_event.y)
-            if axis_value == inf:
-                return False
-            picked_coordinate.append(axis_value)
-        self._measure_passes_dirty = False
+        picked_position = measure_pass.getCompletedPickedPosition()
+        PickProfiler.getInstance().mark(PickProfiler.Readback)
+        if picked_position is None:
+            return result
+
+        self._setActivePointCoordinate(list(picked_position))
 
-        self._points[self._active_point] = QVector3D(*picked_coordinate)
+        return result
+
+    ##  Move the active point to a picked coordinate.
+    #   \param hit The hit of a CPU pick, which tells the model and the triangle that the coordinate is on.
+    def _setActivePointCoordinate(self, coordinate: List[float], hit: Optional[RayCastHit] = None) -> None:
+        profiler = PickProfiler.getInstance()
+        if self._snap_vertices or self._snap_features:
+            coordinate = self._snapCoordinate(coordinate, hit)
+            profiler.mark(PickProfiler.Snap)
+
+        if self._insert_point_index is not None:
+            self._active_point = self._polyline.insertPoint(self._insert_point_index, numpy.array(coordinate))
+            self._insert_point_index = None
+        elif self._active_point < self._polyline.getPointCount():
+            self._polyline.setPoint(self._active_point, numpy.array(coordinate))
+            self._placed_points.add(self._active_point)
+        if self._geodesic_mode:
+            self._updateGeodesicPath()
 
         self._controller.getScene().sceneChanged.emit(self._handle)
         self.propertyChanged.emit()
+        profiler.mark(PickProfiler.Propagation)
+
+    ##  Move a picked coordinate to the nearest enabled feature of the model it is on, if there is one near enough.
+    #   The model and its triangle under the coordinate are taken from the hit of a CPU pick, or found with a short ray
+    #   for a GPU pick. Meshes of which the indexes are still being built in the background are not snapped to.
+    def _snapCoordinate(self, coordinate: List[float], hit: Optional[RayCastHit] = None) -> List[float]:
+        features = self._getSnapFeatureTypes()
+        items = [
+            item for item in getPickableItems(self._controller.getScene().getRoot())
+            if self._geometry_cache.getMeshGeometry(item[2]).hasIndexes(True, features)
+        ]
+        camera_position = self._getCameraPosition()
+        point = numpy.array(coordinate)
+        if hit is None:
+            hit = self._findSurfaceHit(items, point)
+        item = next((item for item in items if hit is not None and item[0] is hit.node), None)
+        if item is None or camera_position is None:
+            return coordinate  # not on a model, or on a model that is not ready to be snapped to
+
+        snap_distance = float(self._application.getPreferences().getValue("measuretool/snap_distance"))
+        snapped = self._feature_snapper.snap(
+            self._geometry_cache.getNodeGeometry(*item), hit.triangle_id, point, camera_position, snap_distance, features
+        )
+        if snapped is None:
+            return coordinate
+        return [float(value) for value in snapped]
+
+    ##  Check whether to pick by casting rays on the CPU. While the hierarchies of the meshes in the scene are still
+    #   being built in the background, picking falls back to rendering a MeasurePass, so it never waits for them.
+    def _getRayCastPicking(self) -> bool:
+        if self._application.getPreferences().getValue("measuretool/picking_engine") != "cpu":
+            return False
+        return all(
+            self._geometry_cache.getMeshGeometry(mesh_data).hasIndexes(True)
+            for _, _, mesh_data in getPickableItems(self._controller.getScene().getRoot())
+        )
+
+    ##  Pick the position under the mouse by casting a ray from the camera against the meshes in the scene.
+    def _pickRayCast(self, mouse_event: MouseEvent) -> Optional[RayCastHit]:
+        camera = self._controller.getScene().getActiveCamera()
+        if not camera:
+            return None
+
+        ray = camera.getRay(mouse_event.x, mouse_event.y)
+        origin = numpy.array([ray.origin.x, ray.origin.y, ray.origin.z])
+        direction = numpy.array([ray.direction.x, ray.direction.y, ray.direction.z])
+
+        items = list(getPickableItems(self._controller.getScene().getRoot()))
+
+        # Include the build plate, like the MeasurePass does
+        build_volume = self._application.getBuildVolume()
+        buildplate_mesh = build_volume._grid_mesh
+        if buildplate_mesh:
+            buildplate_transformation = numpy.identity(4)
+            buildplate_transformation[1, 3] = 0.2  # Distance between buildplate and disallowed area meshes to prevent z-fighting
+            items.append((build_volume, buildplate_transformation, buildplate_mesh))
+
+        hit = self._ray_cast_picker.pick(items, origin, direction)
+        PickProfiler.getInstance().mark(PickProfiler.RayCast)
+        return hit
+
+    def _getAsyncPicking(self) -> bool:
+        return bool(self._application.getPreferences().getValue("measuretool/async_picking"))
+
+    ##  Render the picking passes if the scene has changed since they were last rendered, or if the last render did
+    #   not include the pixels under the mouse.
+    #   \return False if the passes could not be rendered.
+    def _renderMeasurePasses(self, mouse_event: MouseEvent) -> bool:
+        measure_passes = self._getMeasurePasses()
+        if not measure_passes:
+            return False
+        if not self._measure_passes_dirty and all(
+            measure_pass.isPickRendered(mouse_event.x, mouse_event.y) for measure_pass in measure_passes
+        ):
+            return True
 
-        return result
-
-    def _createPickingPass(self, *args, **kwargs) -> None:
-        active_camera = self._controller.getScene().getActiveCamera()
-        if not active_camera:
-            return
-        viewport_width = active_camera.getViewportWidth()
-        viewport_height = active_camera.getViewportHeight()
+        pick_position = None
+        if self._application.getPreferences().getValue("measuretool/scissored_picking"):
+            # Only render the pixels around the mouse, and the objects that can be seen there
+            pick_position = (mouse_event.x, mouse_event.y)
 
-        self._measure_passes.clear()
+        origin = self._getCoordinateOrigin()
         try:
-            # Create a set of passes for picking a world-space location from the mouse location
-            for axis in range(0, 3):
-                self._measure_passes.append(
-                    MeasurePass(viewport_width, viewport_height, axis)
-                )
-        except:
-            pass
+            for measure_pass in measure_passes:
+                measure_pass.render(pick_position, origin)
+        except RuntimeError as e:
+            if not measure_passes[0].isAllAxes():
+                Logger.log("e", "Unable to render the picking passes: %s", str(e))
+                return False
+            Logger.log("w", "Unable to pick all axes in a single pass, falling back to one pass per axis: %s", str(e))
+            self._measure_pass_pool.setAllAxesSupported(False)
+            return self._renderMeasurePasses(mouse_event)
 
-        self._measure_passes_dirty = True
+        self._measure_passes_dirty = False
+        return True
+
+    def _pickCoordinate(self, mouse_event: MouseEvent) -> Optional[List[float]]:
+        if not self._renderMeasurePasses(mouse_event):
+            return None
+
+        profiler = PickProfiler.getInstance()
+        measure_passes = self._getMeasurePasses()
+        if len(measure_passes) == 1:
+            # A single pass renders all three coordinates at once
+            measure_pass = measure_passes[0]
+            picked_position = measure_pass.getPickedPosition(mouse_event.x, mouse_event.y)
+            profiler.mark(PickProfiler.Readback)
+            if picked_position is None:
+                return None
+            return list(picked_position)
+
+        # The passes for the three axes are read back and decoded together
+        picked_position = getPickedAxesPosition(measure_passes, mouse_event.x, mouse_event.y)
+        profiler.mark(PickProfiler.Readback)
+        if picked_position is None:
+            return None
+        return list(picked_position)
+
+    ##  Get the world space position that the picking passes render positions relative to.
+    #   Rendering relative to the camera keeps the range and precision of the passes centered on what is being looked
+    #   at, so objects far from the center of the build plate can be picked as precisely as objects near it.
+    #   \return The position, or None to render absolute world space positions.
+    def _getCoordinateOrigin(self) -> Optional[numpy.ndarray]:
+        if self._application.getPreferences().getValue("measuretool/coordinate_origin") != "camera":
+            return None
+        return self._getCameraPosition()
+
+    def _getMeasurePasses(self) -> List[MeasurePass]:
+        pick_window_size = int(self._application.getPreferences().getValue("measuretool/pick_window_size"))
+        self._measure_pass_pool.setPickWindowSize(pick_window_size)
+        return self._measure_pass_pool.getPasses()
 
     def _getFallbackTool(self) -> str:
         try:
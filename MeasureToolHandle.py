@@ -1,22 +1,35 @@
 # Copyright (c) 2023 Aldo Hoeben / fieldOfView
 # MeasureTool is released under the terms of the AGPLv3 or higher.
 
-from UM.Mesh.MeshData import MeshData, calculateNormalsFromIndexedVertices
+from UM.Mesh.MeshData import MeshData
 from UM.Scene.ToolHandle import ToolHandle
 from UM.Math.Vector import Vector
 from UM.View.GL.OpenGL import OpenGL
+from UM.View.RenderBatch import RenderBatch
 from UM.Resources import Resources
 
-import trimesh
+from .WallThickness import getHeatMapColors
+
 import numpy
+import os.path
+import time
 
-from typing import Optional, TYPE_CHECKING
+from typing import Dict, Optional, Tuple, TYPE_CHECKING
 
 if TYPE_CHECKING:
+    import trimesh
     from .MeasureTool import MeasureTool
+    from .GeometryCache import NodeGeometry
+    from .WallThickness import WallThickness
+
+# Sphere meshes by subdivisions and radius, shared by all handles in this process
+_sphere_meshes = {}  # type: Dict[Tuple[int, float], MeshData]
 
 
 class MeasureToolHandle(ToolHandle):
+    SphereSubdivisions = 2
+    HeatMapUpdateInterval = 1.0  # seconds between rebuilds of a heat map while its wall thickness is being computed
+
     def __init__(self, parent=None) -> None:
         super().__init__(parent)
         self._name = "MeasureToolHandle"
@@ -25,68 +38,202 @@ class MeasureToolHandle(ToolHandle):
         self._selection_mesh = MeshData()
 
         self._tool = None  # type: Optional[MeasureTool]
+        self._build_mesh_pending = True
+
+        # Mesh with a sphere for every point, and the points it was built for. The spheres are scaled by the shader.
+        self._points_mesh = None  # type: Optional[MeshData]
+        self._points_mesh_key = None  # type: Optional[numpy.ndarray]
+        self._points_shader = None
+        self._lines_mesh = None  # type: Optional[MeshData]
+        self._lines_mesh_key = None  # type: Optional[numpy.ndarray]
+
+        # Heat map meshes of the wall thickness per node geometry, with the thickness version and color range they
+        # were built for and the time they were built. The world space vertices, normals and faces of each heat map
+        # are kept separately, so only the colors are computed again when the thickness changes.
+        self._heat_map_meshes = {}  # type: Dict[NodeGeometry, Tuple[int, float, MeshData, float]]
+        self._heat_map_geometries = {}  # type: Dict[NodeGeometry, Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]]
+        self._heat_map_shader = None
 
     def setTool(self, tool: "MeasureTool") -> None:
         self._tool = tool
 
+    ##  Building the mesh needs trimesh, which is slow to import. Postpone it until the handle is first rendered, so
+    #   it does not slow down starting Cura.
     def buildMesh(self) -> None:
-        mesh = self._toMeshData(
-            trimesh.creation.icosphere(subdivisions=2, radius=self._handle_width / 2)
-        )
+        self._build_mesh_pending = True
+
+    def _buildSolidMesh(self) -> None:
+        self._build_mesh_pending = False
+
+        key = (MeasureToolHandle.SphereSubdivisions, self._handle_width / 2)
+        mesh = _sphere_meshes.get(key)
+        if mesh is None:
+            import trimesh
+            mesh = self._toMeshData(trimesh.creation.icosphere(subdivisions=key[0], radius=key[1]))
+            _sphere_meshes[key] = mesh
         self.setSolidMesh(mesh)
 
     def render(self, renderer) -> bool:
+        if self._build_mesh_pending:
+            self._buildSolidMesh()
+
         if not self._shader:
             self._shader = OpenGL.getInstance().createShaderProgram(
                 Resources.getPath(Resources.Shaders, "toolhandle.shader")
             )
 
-        if self._auto_scale:
-            active_camera = self._scene.getActiveCamera()
-            if active_camera.isPerspective():
-                camera_position = active_camera.getWorldPosition()
-                dist = (camera_position - self.getWorldPosition()).length()
-                scale = dist / 400
-            else:
-                view_width = active_camera.getViewportWidth()
-                current_size = view_width + (
-                    2 * active_camera.getZoomFactor() * view_width
-                )
-                scale = current_size / view_width * 5
+        if not self._solid_mesh or not self._tool:
+            return True
 
-            self.setScale(Vector(scale, scale, scale))
+        # The heat maps and the spheres of all points are drawn in world space, so the handle itself is not moved or
+        # scaled
+        self.setPosition(Vector(0, 0, 0))
+        self.setScale(Vector(1, 1, 1))
 
-        if self._solid_mesh and self._tool:
-            for position in [self._tool.getPointA(), self._tool.getPointB()]:
-                self.setPosition(Vector(position.x(), position.y(), position.z()))
-                renderer.queueNode(
-                    self, mesh=self._solid_mesh, overlay=False, shader=self._shader
+        wall_thickness_items = self._tool.getWallThicknessItems()
+        if wall_thickness_items:
+            if not self._heat_map_shader:
+                self._heat_map_shader = OpenGL.getInstance().createShaderProgram(
+                    os.path.join(os.path.dirname(os.path.abspath(__file__)), "resources", "shaders", "heatmap.shader")
+                )
+            maximum = self._tool.getWallThicknessColorRange()
+            for node_geometry, analysis in wall_thickness_items:
+                mesh = self._getHeatMapMesh(node_geometry, analysis, maximum)
+                if mesh is not None:
+                    renderer.queueNode(self, mesh=mesh, overlay=False, shader=self._heat_map_shader)
+        self._heat_map_meshes = {
+            node_geometry: self._heat_map_meshes[node_geometry]
+            for node_geometry, _ in wall_thickness_items if node_geometry in self._heat_map_meshes
+        }
+        self._heat_map_geometries = {
+            node_geometry: self._heat_map_geometries[node_geometry]
+            for node_geometry, _ in wall_thickness_items if node_geometry in self._heat_map_geometries
+        }
+
+        polyline_points = self._tool.getPolylinePoints()
+        pinned_segments = self._tool.getPinnedSegments()
+        points = numpy.concatenate([polyline_points, pinned_segments.reshape(-1, 3)])
+        if len(points):
+            if not self._points_shader:
+                self._points_shader = OpenGL.getInstance().createShaderProgram(
+                    os.path.join(os.path.dirname(os.path.abspath(__file__)), "resources", "shaders", "points.shader")
                 )
 
-        return True
-
-    def _toMeshData(self, tri_node: trimesh.base.Trimesh) -> MeshData:
-        tri_faces = tri_node.faces
-        tri_vertices = tri_node.vertices
+            point_scale, distance_scale = self._getPointScale()
+            renderer.queueNode(
+                self, mesh=self._getPointsMesh(points), overlay=False, shader=self._points_shader,
+                uniforms={"u_pointScale": point_scale, "u_distanceScale": distance_scale}
+            )
 
-        indices = []
-        vertices = []
+        # The edges of the box around the selected objects are drawn even when there are no points
+        segments = numpy.concatenate([pinned_segments, self._tool.getCaliperSegments()])
+        if self._tool.getPolylineMode() and len(polyline_points) > 1:
+            segments = numpy.concatenate([numpy.stack([polyline_points[:-1], polyline_points[1:]], axis=1), segments])
+        geodesic_path = self._tool.getGeodesicPath()
+        if len(geodesic_path) > 1:
+            segments = numpy.concatenate([numpy.stack([geodesic_path[:-1], geodesic_path[1:]], axis=1), segments])
+        if len(segments):
+            renderer.queueNode(
+                self, mesh=self._getLinesMesh(segments), mode=RenderBatch.RenderMode.Lines, overlay=False, shader=self._shader
+            )
 
-        index_count = 0
-        face_count = 0
-        for tri_face in tri_faces:
-            face = []
-            for tri_index in tri_face:
-                vertices.append(tri_vertices[tri_index])
-                face.append(index_count)
-                index_count += 1
-            indices.append(face)
-            face_count += 1
+        return True
 
-        vertices = numpy.asarray(vertices, dtype=numpy.float32)
-        indices = numpy.asarray(indices, dtype=numpy.int32)
-        normals = calculateNormalsFromIndexedVertices(vertices, indices, face_count)
+    ##  Get the scale of the spheres, so they have about the same size on screen.
+    #   \return A tuple of the constant scale and the scale per mm of distance to the camera.
+    def _getPointScale(self) -> Tuple[float, float]:
+        if not self._auto_scale:
+            return 1.0, 0.0
 
-        mesh_data = MeshData(vertices=vertices, indices=indices, normals=normals)
+        active_camera = self._scene.getActiveCamera()
+        if active_camera.isPerspective():
+            return 0.0, 1 / 400
 
-        return mesh_data
+        view_width = active_camera.getViewportWidth()
+        current_size = view_width + (
+            2 * active_camera.getZoomFactor() * view_width
+        )
+        return current_size / view_width * 5, 0.0
+
+    ##  Get a single mesh with a copy of the solid mesh at every point.
+    #   The vertices of the mesh are the centers of the spheres, and the offset of each vertex from its center is
+    #   passed as a separate attribute, so the shader can scale the spheres without rebuilding the mesh.
+    def _getPointsMesh(self, points: numpy.ndarray) -> MeshData:
+        if self._points_mesh is not None and numpy.array_equal(self._points_mesh_key, points):
+            return self._points_mesh
+
+        sphere_vertices = self._solid_mesh.getVertices()
+        vertices = numpy.repeat(points, len(sphere_vertices), axis=0).astype(numpy.float32)
+        offsets = numpy.tile(sphere_vertices, (len(points), 1)).astype(numpy.float32)
+        indices = numpy.arange(len(vertices), dtype=numpy.int32).reshape(-1, 3)
+
+        self._points_mesh = MeshData(
+            vertices=vertices,
+            indices=indices,
+            attributes={"offsets": {"value": offsets, "opengl_name": "a_offset", "opengl_type": "vector3f"}}
+        )
+        self._points_mesh_key = points.copy()
+        return self._points_mesh
+
+    ##  Get a mesh with a line for every segment.
+    #   \param segments The start and end points of the segments, as an array of shape (segments, 2, 3).
+    def _getLinesMesh(self, segments: numpy.ndarray) -> MeshData:
+        if self._lines_mesh is None or not numpy.array_equal(self._lines_mesh_key, segments):
+            self._lines_mesh = MeshData(vertices=segments.reshape(-1, 3).astype(numpy.float32))
+            self._lines_mesh_key = segments.copy()
+        return self._lines_mesh
+
+    ##  Get a copy of the mesh of a node in world space, colored by the wall thickness at its vertices.
+    #   The copy is moved outwards a little, so it is drawn over the node itself. While the thickness is being
+    #   computed, the mesh is rebuilt at most every HeatMapUpdateInterval seconds, since every rebuild is uploaded to
+    #   the GPU again.
+    def _getHeatMapMesh(self, node_geometry: "NodeGeometry", analysis: "WallThickness", maximum: float) -> Optional[MeshData]:
+        if not analysis.isPrepared():
+            return None
+        cached = self._heat_map_meshes.get(node_geometry)
+        if cached is not None:
+            if cached[0] == analysis.getVersion() and cached[1] == maximum:
+                return cached[2]
+            if not analysis.isComplete() and time.monotonic() - cached[3] < MeasureToolHandle.HeatMapUpdateInterval:
+                return cached[2]
+
+        vertices, normals, faces = self._getHeatMapGeometry(node_geometry, analysis)
+        mesh = MeshData(
+            vertices=vertices, normals=normals, indices=faces, colors=getHeatMapColors(analysis.getThickness(), maximum)
+        )
+        self._heat_map_meshes[node_geometry] = (analysis.getVersion(), maximum, mesh, time.monotonic())
+        return mesh
+
+    ##  Get the world space vertices, normals and faces of the heat map of a node.
+    #   The arrays are read-only, so MeshData does not copy them for every rebuild of the heat map.
+    def _getHeatMapGeometry(self, node_geometry: "NodeGeometry", analysis: "WallThickness") -> Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]:
+        cached = self._heat_map_geometries.get(node_geometry)
+        if cached is not None:
+            return cached
+
+        vertices = node_geometry.transformPoints(analysis.getVertices())
+        normals = analysis.getNormals().dot(node_geometry.getInverseTransformation()[:3, :3])
+        normals /= numpy.maximum(numpy.linalg.norm(normals, axis=1), 1e-12)[:, numpy.newaxis]
+        if len(vertices):
+            vertices += normals * max(0.01, 1e-4 * float(numpy.linalg.norm(vertices.max(axis=0) - vertices.min(axis=0))))
+
+        geometry = (vertices.astype(numpy.float32), normals.astype(numpy.float32), analysis.getFaces().astype(numpy.int32))
+        for array in geometry:
+            array.flags.writeable = False
+        self._heat_map_geometries[node_geometry] = geometry
+        return geometry
+
+    ##  Convert a trimesh mesh to MeshData with separate vertices for each face, so the faces are rendered flat.
+    def _toMeshData(self, tri_node: "trimesh.base.Trimesh") -> MeshData:
+        faces = numpy.asarray(tri_node.faces)
+        face_vertices = numpy.asarray(tri_node.vertices, dtype=numpy.float32)[faces]  # (face_count, 3, 3)
+
+        vertices = face_vertices.reshape(-1, 3)
+        indices = numpy.arange(len(vertices), dtype=numpy.int32).reshape(-1, 3)
+
+        # Every vertex gets the normal of its face, like calculateNormalsFromIndexedVertices() in Uranium does
+        face_normals = numpy.cross(face_vertices[:, 0] - face_vertices[:, 1], face_vertices[:, 0] - face_vertices[:, 2])
+        face_normals /= numpy.linalg.norm(face_normals, axis=1, keepdims=True)
+        normals = numpy.repeat(face_normals, 3, axis=0).astype(numpy.float32)
+
+        return MeshData(vertices=vertices, indices=indices, normals=normals)
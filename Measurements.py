@@ -0,0 +1,293 @@
+# Copyright (c) 2023 Aldo Hoeben / fieldOfView
+# MeasureTool is released under the terms of the AGPLv3 or higher.
+
+from .GeometryCache import GeometryCache
+
+import base64
+import numpy
+import weakref
+
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+
+##  A collection of measurements between points that are anchored to the meshes of nodes.
+#
+#   Each point (anchor) is stored as the index of the node it is on, the index of a triangle of the mesh of that node
+#   and barycentric coordinates within that triangle, so it follows the node when it is moved, rotated or scaled.
+#   Points that are not on a node (such as points on the build plate) have node index -1, and stay where they are.
+#   A measurement is a pair of anchors.
+#
+#   All anchors and measurements are kept in flat arrays. When nodes change, only the anchors on those nodes, and the
+#   measurements that use those anchors, are recomputed.
+class MeasurementStore:
+    DataVersion = 1
+
+    def __init__(self, geometry_cache: Optional[GeometryCache] = None) -> None:
+        self._geometry_cache = geometry_cache if geometry_cache is not None else GeometryCache()
+
+        self._nodes = []  # type: List[Optional[weakref.ref]]
+        self._node_indices = weakref.WeakKeyDictionary()  # type: weakref.WeakKeyDictionary
+
+        self._anchor_nodes = numpy.zeros(0, dtype=numpy.int32)
+        self._anchor_triangles = numpy.zeros(0, dtype=numpy.int32)
+        self._anchor_barycentric = numpy.zeros((0, 2), dtype=numpy.float32)
+        self._anchor_positions = numpy.zeros((0, 3), dtype=numpy.float64)
+
+        self._measurements = numpy.zeros((0, 2), dtype=numpy.int32)  # pairs of anchor indices
+        self._lengths = numpy.zeros(0, dtype=numpy.float64)
+
+        # Lookup tables from nodes to anchors and from anchors to measurements, built when they are first needed
+        # after anchors or measurements have been added or removed
+        self._node_anchors = None  # type: Optional[Tuple[numpy.ndarray, numpy.ndarray]]
+        self._anchor_measurements = None  # type: Optional[Tuple[numpy.ndarray, numpy.ndarray]]
+
+        self._version = 0
+
+    def getCount(self) -> int:
+        return len(self._measurements)
+
+    ##  Get a number that changes whenever a measurement changes, to check if something derived from them is outdated.
+    def getVersion(self) -> int:
+        return self._version
+
+    ##  Get the world space positions of the points of the measurements, as an array of shape (measurements, 2, 3).
+    def getSegments(self) -> numpy.ndarray:
+        return self._anchor_positions[self._measurements]
+
+    def getLengths(self) -> numpy.ndarray:
+        return self._lengths
+
+    ##  Add a measurement between two points.
+    #   \param anchors For both points, either a tuple of the node, the index of the triangle in its mesh data and the
+    #   barycentric coordinates (u, v) within that triangle, or None for a point that is not on a node.
+    #   \param positions The world space positions of both points.
+    #   \return The index of the new measurement.
+    def addMeasurement(self, anchors: List[Optional[Tuple[Any, int, Tuple[float, float]]]], positions: numpy.ndarray) -> int:
+        first_anchor = len(self._anchor_nodes)
+        self._anchor_nodes = numpy.append(self._anchor_nodes, [
+            self._getNodeIndex(anchor[0]) if anchor is not None else -1 for anchor in anchors
+        ]).astype(numpy.int32)
+        self._anchor_triangles = numpy.append(self._anchor_triangles, [
+            anchor[1] if anchor is not None else -1 for anchor in anchors
+        ]).astype(numpy.int32)
+        self._anchor_barycentric = numpy.concatenate([self._anchor_barycentric, numpy.array([
+            anchor[2] if anchor is not None else (0, 0) for anchor in anchors
+        ], dtype=numpy.float32).reshape(-1, 2)])
+        self._anchor_positions = numpy.concatenate([self._anchor_positions, numpy.asarray(positions, dtype=numpy.float64).reshape(-1, 3)])
+
+        self._measurements = numpy.concatenate([
+            self._measurements, numpy.array([[first_anchor, first_anchor + 1]], dtype=numpy.int32)
+        ])
+        self._lengths = numpy.append(self._lengths, 0.0)
+        self._invalidateLookups()
+
+        # Compute the anchored positions rather than keeping the picked positions, so they are consistent with later
+        # updates
+        self._updateAnchors(numpy.arange(first_anchor, first_anchor + 2))
+        return len(self._measurements) - 1
+
+    ##  Remove measurements by index.
+    def removeMeasurements(self, indices: Iterable[int]) -> None:
+        keep = numpy.ones(len(self._measurements), dtype=bool)
+        keep[list(indices)] = False
+        self._measurements = self._measurements[keep]
+        self._lengths = self._lengths[keep]
+        self._removeUnusedAnchors()
+
+    def clear(self) -> None:
+        self.removeMeasurements(range(len(self._measurements)))
+
+    ##  Recompute the measurements on nodes that have changed, and remove the measurements on nodes that were removed.
+    #   \param changed The nodes of which the mesh data or world transformation has changed.
+    #   \param removed The nodes that are no longer in the scene.
+    #   \return True if any measurement has changed.
+    def update(self, changed: Iterable[Any], removed: Iterable[Any] = ()) -> bool:
+        if len(self._measurements) == 0:
+            return False
+
+        removed_indices = [self._node_indices.pop(node) for node in removed if node in self._node_indices]
+        if removed_indices:
+            on_removed = numpy.isin(self._anchor_nodes, removed_indices)
+            self.removeMeasurements(numpy.flatnonzero(on_removed[self._measurements].any(axis=1)))
+            for index in removed_indices:
+                self._nodes[index] = None
+
+        changed_indices = [self._node_indices[node] for node in changed if node in self._node_indices]
+        if not changed_indices:
+            return bool(removed_indices)
+
+        starts, anchors = self._getNodeAnchors()
+        moved = numpy.concatenate([anchors[starts[index]:starts[index + 1]] for index in changed_indices])
+        if len(moved) == 0:
+            return bool(removed_indices)
+        self._updateAnchors(moved)
+        return True
+
+    ##  Serialize the measurements to a dictionary of strings and numbers that can be stored as JSON.
+    #   \param nodes The nodes in the scene, in an order that can be reproduced when the measurements are loaded.
+    def serialize(self, nodes: List[Any]) -> Dict[str, Any]:
+        # The last element maps the anchors that are not on a node (and on nodes that are not in the list) to -1
+        node_order = numpy.full(len(self._nodes) + 1, -1, dtype=numpy.int32)
+        for order, node in enumerate(nodes):
+            index = self._node_indices.get(node)
+            if index is not None:
+                node_order[index] = order
+
+        anchor_nodes = node_order[self._anchor_nodes]
+        return {
+            "version": MeasurementStore.DataVersion,
+            "node_triangles": _encodeArray(self._getTriangleCounts(nodes)),
+            "anchor_nodes": _encodeArray(anchor_nodes),
+            "anchor_triangles": _encodeArray(self._anchor_triangles),
+            "anchor_barycentric": _encodeArray(self._anchor_barycentric),
+            "anchor_positions": _encodeArray(self._anchor_positions),
+            "measurements": _encodeArray(self._measurements),
+        }
+
+    ##  Get the number of nodes that were passed to serialize().
+    #   \return The number of nodes, or None if the data can not be read.
+    @staticmethod
+    def getSerializedNodeCount(data: Dict[str, Any]) -> Optional[int]:
+        try:
+            if data.get("version") != MeasurementStore.DataVersion:
+                return None
+            return len(_decodeArray(data["node_triangles"], numpy.int32))
+        except (KeyError, ValueError, TypeError):
+            return None
+
+    ##  Replace the measurements with measurements that were serialized before.
+    #   \param nodes The nodes in the scene, in the same order as they were passed to serialize().
+    #   \return False if the data could not be used, in which case the current measurements are kept.
+    def deserialize(self, data: Dict[str, Any], nodes: List[Any]) -> bool:
+        try:
+            if data.get("version") != MeasurementStore.DataVersion:
+                return False
+            # Check that the nodes are (most likely) the same nodes as when the measurements were serialized
+            if not numpy.array_equal(_decodeArray(data["node_triangles"], numpy.int32), self._getTriangleCounts(nodes)):
+                return False
+            anchor_nodes = _decodeArray(data["anchor_nodes"], numpy.int32)
+            anchor_triangles = _decodeArray(data["anchor_triangles"], numpy.int32)
+            anchor_barycentric = _decodeArray(data["anchor_barycentric"], numpy.float32).reshape(-1, 2)
+            anchor_positions = _decodeArray(data["anchor_positions"], numpy.float64).reshape(-1, 3)
+            measurements = _decodeArray(data["measurements"], numpy.int32).reshape(-1, 2)
+        except (KeyError, ValueError, TypeError):
+            return False
+
+        anchor_count = len(anchor_nodes)
+        if (
+            len(anchor_triangles) != anchor_count or len(anchor_barycentric) != anchor_count
+            or len(anchor_positions) != anchor_count
+            or (len(measurements) and (measurements.min() < 0 or measurements.max() >= anchor_count))
+            or (anchor_count and anchor_nodes.max() >= len(nodes))
+        ):
+            return False
+
+        used_nodes = numpy.unique(anchor_nodes[anchor_nodes >= 0])
+        self._nodes = [weakref.ref(nodes[order]) for order in used_nodes]
+        self._node_indices = weakref.WeakKeyDictionary()
+        for index, node in enumerate(self._nodes):
+            self._node_indices[node()] = index
+
+        self._anchor_nodes = numpy.where(anchor_nodes >= 0, numpy.searchsorted(used_nodes, anchor_nodes), -1).astype(numpy.int32)
+        self._anchor_triangles = anchor_triangles
+        self._anchor_barycentric = anchor_barycentric
+        self._anchor_positions = anchor_positions
+        self._measurements = measurements
+        self._lengths = numpy.zeros(len(measurements))
+        self._invalidateLookups()
+
+        self._updateAnchors(numpy.arange(anchor_count))
+        return True
+
+    def _getTriangleCounts(self, nodes: List[Any]) -> numpy.ndarray:
+        return numpy.array([
+            self._geometry_cache.getMeshGeometry(node.getMeshData()).getTriangleCount() if node.getMeshData() else 0
+            for node in nodes
+        ], dtype=numpy.int32)
+
+    def _getNodeIndex(self, node: Any) -> int:
+        index = self._node_indices.get(node)
+        if index is None:
+            index = len(self._nodes)
+            self._nodes.append(weakref.ref(node))
+            self._node_indices[node] = index
+        return index
+
+    ##  Get the anchors per node, as the start of the anchors of each node in a list of anchors sorted by node.
+    def _getNodeAnchors(self) -> Tuple[numpy.ndarray, numpy.ndarray]:
+        if self._node_anchors is None:
+            order = numpy.argsort(self._anchor_nodes, kind="stable")
+            starts = numpy.searchsorted(self._anchor_nodes[order], numpy.arange(len(self._nodes) + 1))
+            self._node_anchors = (starts, order)
+        return self._node_anchors
+
+    ##  Get the measurements per anchor, as the start of the measurements of each anchor in a list of measurements
+    #   sorted by anchor.
+    def _getAnchorMeasurements(self) -> Tuple[numpy.ndarray, numpy.ndarray]:
+        if self._anchor_measurements is None:
+            anchors = self._measurements.ravel()
+            order = numpy.argsort(anchors, kind="stable")
+            starts = numpy.searchsorted(anchors[order], numpy.arange(len(self._anchor_nodes) + 1))
+            self._anchor_measurements = (starts, order // 2)
+        return self._anchor_measurements
+
+    def _invalidateLookups(self) -> None:
+        self._node_anchors = None
+        self._anchor_measurements = None
+        self._version += 1
+
+    ##  Recompute the positions of anchors from the current geometry of their nodes, and the lengths of the
+    #   measurements that use them. Anchors on nodes that no longer exist keep their last position, and anchors of
+    #   which the mesh no longer has the triangle are detached from their node.
+    def _updateAnchors(self, anchors: numpy.ndarray) -> None:
+        anchor_nodes = self._anchor_nodes[anchors]
+        for index in numpy.unique(anchor_nodes[anchor_nodes >= 0]):
+            node = self._nodes[index]() if self._nodes[index] is not None else None
+            if node is None or not node.getMeshData():
+                continue
+            node_anchors = anchors[anchor_nodes == index]
+
+            node_geometry = self._geometry_cache.getNodeGeometry(
+                node, node.getWorldTransformation().getData(), node.getMeshData()
+            )
+            triangles = self._anchor_triangles[node_anchors]
+            valid = (triangles >= 0) & (triangles < node_geometry.mesh_geometry.getTriangleCount())
+            if not valid.all():
+                # The mesh has been replaced by a mesh with fewer triangles; keep those points where they were
+                self._anchor_nodes[node_anchors[~valid]] = -1
+                self._node_anchors = None
+            node_anchors = node_anchors[valid]
+
+            corners = node_geometry.mesh_geometry.getTriangles(triangles[valid])
+            u = self._anchor_barycentric[node_anchors, 0:1].astype(numpy.float64)
+            v = self._anchor_barycentric[node_anchors, 1:2].astype(numpy.float64)
+            local_positions = (1 - u - v) * corners[:, 0] + u * corners[:, 1] + v * corners[:, 2]
+            self._anchor_positions[node_anchors] = node_geometry.transformPoints(local_positions)
+
+        starts, measurements = self._getAnchorMeasurements()
+        affected = numpy.unique(numpy.concatenate(
+            [measurements[starts[anchor]:starts[anchor + 1]] for anchor in anchors] or [numpy.zeros(0, dtype=numpy.int64)]
+        ))
+        segments = self._anchor_positions[self._measurements[affected]]
+        self._lengths[affected] = numpy.linalg.norm(segments[:, 1] - segments[:, 0], axis=1)
+        self._version += 1
+
+    def _removeUnusedAnchors(self) -> None:
+        used = numpy.zeros(len(self._anchor_nodes), dtype=bool)
+        used[self._measurements.ravel()] = True
+        new_indices = numpy.cumsum(used) - 1
+
+        self._anchor_nodes = self._anchor_nodes[used]
+        self._anchor_triangles = self._anchor_triangles[used]
+        self._anchor_barycentric = self._anchor_barycentric[used]
+        self._anchor_positions = self._anchor_positions[used]
+        self._measurements = new_indices[self._measurements].astype(numpy.int32).reshape(-1, 2)
+        self._invalidateLookups()
+
+
+def _encodeArray(array: numpy.ndarray) -> str:
+    return base64.b64encode(numpy.ascontiguousarray(array).astype(array.dtype.newbyteorder("<")).tobytes()).decode("ascii")
+
+
+def _decodeArray(text: str, dtype: Any) -> numpy.ndarray:
+    return numpy.frombuffer(base64.b64decode(text), dtype=numpy.dtype(dtype).newbyteorder("<")).astype(dtype)
@@ -0,0 +1,235 @@
+# Copyright (c) 2023 Aldo Hoeben / fieldOfView
+# MeasureTool is released under the terms of the AGPLv3 or higher.
+
+import numpy
+
+from typing import List, Optional, Tuple
+
+
+##  A bounding volume hierarchy over the triangles of a mesh, built and queried with vectorized numpy operations.
+#
+#   Triangles are sorted along a Morton (Z-order) curve through their centroids and grouped into leaves of a fixed
+#   number of consecutive triangles. The hierarchy above the leaves is an implicit binary tree: node i of a level has
+#   nodes 2i and 2i + 1 of the level below as its children. This makes both building the tree and descending it a
+#   matter of operating on whole levels at once, instead of visiting nodes one by one in Python.
+#
+#   The hierarchy is built in the local coordinate space of the mesh, so it stays valid when the object is moved;
+#   rays are transformed into the local space of the mesh instead.
+class MeshBVH:
+    LeafSize = 16
+    LeavesPerRound = 4  # number of leaves per ray that are intersected at a time, nearest first
+
+    def __init__(self, vertices: numpy.ndarray, indices: Optional[numpy.ndarray] = None) -> None:
+        vertices = numpy.asarray(vertices, dtype=numpy.float64)
+        if indices is None:
+            indices = numpy.arange(len(vertices) - len(vertices) % 3).reshape(-1, 3)
+        indices = numpy.asarray(indices, dtype=numpy.int64)
+
+        triangles = vertices[indices]  # (triangle, corner, axis)
+        order = _mortonOrder(triangles.mean(axis=1))
+
+        self._triangle_ids = order  # original index of each sorted triangle
+        self._v0 = triangles[order, 0]
+        self._e1 = triangles[order, 1] - self._v0
+        self._e2 = triangles[order, 2] - self._v0
+
+        self._sorted_positions = None  # type: Optional[numpy.ndarray]
+
+        self._levels = []  # type: List[Tuple[numpy.ndarray, numpy.ndarray]]
+        if len(order) == 0:
+            return
+
+        # Bounds of the leaves, each spanning LeafSize consecutive sorted triangles
+        leaf_starts = numpy.arange(0, len(order), MeshBVH.LeafSize)
+        sorted_triangles = triangles[order]
+        self._levels.append((
+            numpy.minimum.reduceat(sorted_triangles.min(axis=1), leaf_starts),
+            numpy.maximum.reduceat(sorted_triangles.max(axis=1), leaf_starts)
+        ))
+
+        # Merge pairs of nodes until a single root is left
+        while len(self._levels[-1][0]) > 1:
+            minimum, maximum = self._levels[-1]
+            starts = numpy.arange(0, len(minimum), 2)
+            self._levels.append((
+                numpy.minimum.reduceat(minimum, starts),
+                numpy.maximum.reduceat(maximum, starts)
+            ))
+
+    def getTriangleCount(self) -> int:
+        return len(self._triangle_ids)
+
+    ##  Get the bounds of the mesh, as a tuple of minimum and maximum corner.
+    def getBounds(self) -> Optional[Tuple[numpy.ndarray, numpy.ndarray]]:
+        if not self._levels:
+            return None
+        minimum, maximum = self._levels[-1]
+        return minimum[0], maximum[0]
+
+    ##  Get the corners of triangles, by their index in the original mesh.
+    #   \return An array of shape (triangles, 3 corners, 3 axes).
+    def getTriangles(self, triangle_ids: numpy.ndarray) -> numpy.ndarray:
+        if self._sorted_positions is None:
+            self._sorted_positions = numpy.empty_like(self._triangle_ids)
+            self._sorted_positions[self._triangle_ids] = numpy.arange(len(self._triangle_ids))
+        sorted_ids = self._sorted_positions[numpy.asarray(triangle_ids, dtype=numpy.int64)]
+        v0 = self._v0[sorted_ids]
+        return numpy.stack([v0, v0 + self._e1[sorted_ids], v0 + self._e2[sorted_ids]], axis=1)
+
+    ##  Find the nearest intersection of a single ray with the mesh.
+    #   \return A tuple with the distance along the ray, the index of the triangle in the original mesh and the
+    #   barycentric coordinates (u, v) of the hit within that triangle, or None if the ray misses the mesh.
+    def intersectRay(self, origin: numpy.ndarray, direction: numpy.ndarray, max_distance: float = numpy.inf) -> Optional[Tuple[float, int, float, float]]:
+        distances, triangle_ids, u, v = self.intersectRays(
+            numpy.asarray(origin, dtype=numpy.float64).reshape(1, 3),
+            numpy.asarray(direction, dtype=numpy.float64).reshape(1, 3),
+            max_distance
+        )
+        if triangle_ids[0] < 0:
+            return None
+        return float(distances[0]), int(triangle_ids[0]), float(u[0]), float(v[0])
+
+    ##  Find the nearest intersections of a batch of rays with the mesh.
+    #   Intersections are found in both directions of the triangles, and only in front of the ray origins.
+    #   \param origins, directions Arrays of shape (rays, 3).
+    #   \param max_distance Ignore intersections further away than this; a scalar or an array with one value per ray.
+    #   \return Arrays with the distance, original triangle index and barycentric coordinates (u, v) of the nearest
+    #   intersection per ray. The triangle index is -1 and the distance is inf for rays that miss the mesh.
+    def intersectRays(self, origins: numpy.ndarray, directions: numpy.ndarray, max_distance=numpy.inf) -> Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray, numpy.ndarray]:
+        origins = numpy.asarray(origins, dtype=numpy.float64)
+        directions = numpy.asarray(directions, dtype=numpy.float64)
+        ray_count = len(origins)
+
+        best_distances = numpy.broadcast_to(numpy.asarray(max_distance, dtype=numpy.float64), (ray_count,)).copy()
+        best_triangles = numpy.full(ray_count, -1, dtype=numpy.int64)
+        best_u = numpy.zeros(ray_count)
+        best_v = numpy.zeros(ray_count)
+        if not self._levels or ray_count == 0:
+            best_distances[:] = numpy.inf
+            return best_distances, best_triangles, best_u, best_v
+
+        # Avoid infinities for rays parallel to an axis, which would otherwise give nan in the slab test
+        safe_directions = numpy.where(numpy.abs(directions) < 1e-12, numpy.copysign(1e-12, directions), directions)
+        inverse_directions = 1.0 / safe_directions
+
+        # Descend the tree one level at a time, keeping the (ray, node) pairs whose boxes are hit
+        rays = numpy.arange(ray_count)
+        nodes = numpy.zeros(ray_count, dtype=numpy.int64)
+        entry_distances = numpy.zeros(ray_count)
+        for level in range(len(self._levels) - 1, -1, -1):
+            minimum, maximum = self._levels[level]
+            if level < len(self._levels) - 1:
+                rays = numpy.repeat(rays, 2)
+                nodes = (nodes[:, numpy.newaxis] * 2 + numpy.array([0, 1])).ravel()
+                exists = nodes < len(minimum)
+                rays = rays[exists]
+                nodes = nodes[exists]
+
+            hit, entry_distances = _intersectBoxes(
+                origins[rays], inverse_directions[rays], minimum[nodes], maximum[nodes], best_distances[rays]
+            )
+            rays = rays[hit]
+            nodes = nodes[hit]
+            entry_distances = entry_distances[hit]
+            if len(rays) == 0:
+                best_distances[best_triangles < 0] = numpy.inf
+                return best_distances, best_triangles, best_u, best_v
+
+        # Visit the leaves that are hit in order of distance along each ray, a few leaves per ray at a time, so the
+        # leaves behind the nearest hit found so far can be skipped
+        order = numpy.lexsort((entry_distances, rays))
+        rays = rays[order]
+        nodes = nodes[order]
+        entry_distances = entry_distances[order]
+        ranks = numpy.arange(len(rays)) - numpy.searchsorted(rays, rays)  # position of each leaf along its ray
+
+        for first_rank in range(0, int(ranks.max()) + 1, MeshBVH.LeavesPerRound):
+            remaining = (ranks >= first_rank) & (entry_distances <= best_distances[rays])
+            if not remaining.any():
+                break
+            in_round = remaining & (ranks < first_rank + MeshBVH.LeavesPerRound)
+            self._intersectLeaves(
+                origins, directions, rays[in_round], nodes[in_round], best_distances, best_triangles, best_u, best_v
+            )
+
+        best_distances[best_triangles < 0] = numpy.inf
+        return best_distances, best_triangles, best_u, best_v
+
+    ##  Intersect (ray, leaf) pairs, and update the nearest intersection per ray with the hits that are nearer.
+    def _intersectLeaves(self, origins: numpy.ndarray, directions: numpy.ndarray, rays: numpy.ndarray, nodes: numpy.ndarray,
+                         best_distances: numpy.ndarray, best_triangles: numpy.ndarray, best_u: numpy.ndarray, best_v: numpy.ndarray) -> None:
+        # Expand the leaves into (ray, triangle) pairs
+        leaf_starts = nodes * MeshBVH.LeafSize
+        leaf_counts = numpy.minimum(MeshBVH.LeafSize, len(self._triangle_ids) - leaf_starts)
+        pair_rays = numpy.repeat(rays, leaf_counts)
+        pair_triangles = numpy.repeat(leaf_starts - numpy.cumsum(leaf_counts) + leaf_counts, leaf_counts) + numpy.arange(leaf_counts.sum())
+
+        distances, u, v = _intersectTriangles(
+            origins[pair_rays], directions[pair_rays],
+            self._v0[pair_triangles], self._e1[pair_triangles], self._e2[pair_triangles]
+        )
+        hit = distances < best_distances[pair_rays]
+        pair_rays = pair_rays[hit]
+        pair_triangles = pair_triangles[hit]
+        distances = distances[hit]
+        u = u[hit]
+        v = v[hit]
+
+        # Keep the nearest hit per ray: sort by distance and take the first pair of each ray
+        order = numpy.lexsort((distances, pair_rays))
+        pair_rays = pair_rays[order]
+        first = numpy.ones(len(pair_rays), dtype=bool)
+        first[1:] = pair_rays[1:] != pair_rays[:-1]
+        nearest = order[first]
+
+        hit_rays = pair_rays[first]
+        best_distances[hit_rays] = distances[nearest]
+        best_triangles[hit_rays] = self._triangle_ids[pair_triangles[nearest]]
+        best_u[hit_rays] = u[nearest]
+        best_v[hit_rays] = v[nearest]
+
+
+##  Slab test of rays against axis aligned boxes, pairwise.
+#   \return A boolean array indicating which boxes are hit in front of the ray, closer than max_distances, and the
+#   distances along the rays at which they enter the boxes.
+def _intersectBoxes(origins: numpy.ndarray, inverse_directions: numpy.ndarray, minimum: numpy.ndarray, maximum: numpy.ndarray, max_distances: numpy.ndarray) -> Tuple[numpy.ndarray, numpy.ndarray]:
+    t1 = (minimum - origins) * inverse_directions
+    t2 = (maximum - origins) * inverse_directions
+    t_near = numpy.minimum(t1, t2).max(axis=1)
+    t_far = numpy.maximum(t1, t2).min(axis=1)
+    return (t_near <= t_far) & (t_far >= 0) & (t_near <= max_distances), t_near
+
+
+##  Moller-Trumbore intersection of rays with triangles, pairwise.
+#   \return Arrays with the distance along the ray (inf when missed) and the barycentric coordinates of the hit.
+def _intersectTriangles(origins: numpy.ndarray, directions: numpy.ndarray, v0: numpy.ndarray, e1: numpy.ndarray, e2: numpy.ndarray) -> Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]:
+    p = numpy.cross(directions, e2)
+    determinant = numpy.einsum("ij,ij->i", e1, p)
+    valid = numpy.abs(determinant) > 1e-12
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        inverse_determinant = numpy.where(valid, 1.0 / determinant, 0.0)
+
+    s = origins - v0
+    u = numpy.einsum("ij,ij->i", s, p) * inverse_determinant
+    q = numpy.cross(s, e1)
+    v = numpy.einsum("ij,ij->i", directions, q) * inverse_determinant
+    distances = numpy.einsum("ij,ij->i", e2, q) * inverse_determinant
+
+    valid &= (u >= 0) & (v >= 0) & (u + v <= 1) & (distances >= 0)
+    return numpy.where(valid, distances, numpy.inf), u, v
+
+
+##  Get the order of points along a Morton (Z-order) curve through their bounding box.
+def _mortonOrder(points: numpy.ndarray) -> numpy.ndarray:
+    if len(points) == 0:
+        return numpy.zeros(0, dtype=numpy.int64)
+
+    minimum = points.min(axis=0)
+    extent = numpy.maximum(points.max(axis=0) - minimum, 1e-12)
+    cells = ((points - minimum) / extent * 1023).astype(numpy.uint64)  # 10 bits per axis
+
+    code = numpy.zeros(len(points), dtype=numpy.uint64)
+    for bit in range(10):
+        for axis in range(3):
+            code |= ((cells[:, axis] >> numpy.uint64(bit)) & numpy.uint64(1)) << numpy.uint64(3 * bit + axis)
+    return numpy.argsort(code, kind="stable")
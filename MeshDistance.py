@@ -0,0 +1,313 @@
+# Copyright (c) 2023 Aldo Hoeben / fieldOfView
+# MeasureTool is released under the terms of the AGPLv3 or higher.
+
+from .GeometryCache import NodeGeometry
+from .MeshBVH import MeshBVH, _intersectTriangles
+
+import numpy
+import weakref
+
+from typing import List, Optional, Tuple
+
+
+##  The closest pair of points between the meshes of two nodes.
+class ClosestPoints:
+    def __init__(self, distance: float, point_a: numpy.ndarray, point_b: numpy.ndarray, triangle_a: int, triangle_b: int) -> None:
+        self.distance = distance  # distance between the points, in mm; 0 if the meshes intersect
+        self.point_a = point_a  # world space position on the mesh of the first node
+        self.point_b = point_b  # world space position on the mesh of the second node
+        self.triangle_a = triangle_a  # index of the triangle in the mesh data of the first node that point_a lies on
+        self.triangle_b = triangle_b
+
+
+##  Find the closest pair of points between the meshes of two nodes.
+#
+#   Both bounding volume hierarchies are descended together, one level at a time, keeping the pairs of nodes of which
+#   the boxes may still contain a closer pair than the best known upper bound. The hierarchies are built in the local
+#   space of the meshes, so their boxes are transformed to world space (conservatively) per level; the hierarchies
+#   themselves are shared with picking and do not need to be rebuilt when an object moves. The remaining pairs of
+#   leaves are expanded to pairs of triangles, nearest first, and the exact distance between those triangles is
+#   computed in vectorized batches.
+#
+#   \param is_cancelled Optional function that is called between batches; the search is stopped if it returns True.
+#   \return The closest points, or None if either mesh is empty or the search was cancelled.
+def findClosestPoints(geometry_a: NodeGeometry, geometry_b: NodeGeometry, is_cancelled=None) -> Optional[ClosestPoints]:
+    bvh_a = geometry_a.mesh_geometry.getBVH()
+    bvh_b = geometry_b.mesh_geometry.getBVH()
+    if bvh_a.getTriangleCount() == 0 or bvh_b.getTriangleCount() == 0:
+        return None
+
+    levels_a = _getWorldLevels(geometry_a)
+    levels_b = _getWorldLevels(geometry_b)
+    level_a = len(levels_a) - 1
+    level_b = len(levels_b) - 1
+    nodes_a = numpy.zeros(1, dtype=numpy.int64)
+    nodes_b = numpy.zeros(1, dtype=numpy.int64)
+
+    # Any pair of actual vertices gives an upper bound of the distance; the first vertex of the first triangle under
+    # each node is used as a representative of that node
+    upper_bound = numpy.inf
+    while True:
+        lower_bounds = _boxDistances(
+            levels_a[level_a][0][nodes_a], levels_a[level_a][1][nodes_a],
+            levels_b[level_b][0][nodes_b], levels_b[level_b][1][nodes_b]
+        )
+        representatives = numpy.linalg.norm(
+            _getRepresentatives(geometry_a, bvh_a, level_a, nodes_a) - _getRepresentatives(geometry_b, bvh_b, level_b, nodes_b),
+            axis=1
+        )
+        upper_bound = min(upper_bound, float(representatives.min()))
+
+        keep = lower_bounds <= upper_bound
+        nodes_a = nodes_a[keep]
+        nodes_b = nodes_b[keep]
+        lower_bounds = lower_bounds[keep]
+
+        if level_a == 0 and level_b == 0:
+            break
+        if is_cancelled is not None and is_cancelled():
+            return None
+
+        # Descend into the children of the node with the larger boxes, or of both when they are at the same level
+        split_a = level_a > 0 and level_a >= level_b
+        split_b = level_b > 0 and level_b >= level_a
+        if split_a:
+            level_a -= 1
+            nodes_a, nodes_b = _splitNodes(nodes_a, nodes_b, len(levels_a[level_a][0]))
+        if split_b:
+            level_b -= 1
+            nodes_b, nodes_a = _splitNodes(nodes_b, nodes_a, len(levels_b[level_b][0]))
+
+    # Compare the triangles of the remaining pairs of leaves, nearest pairs first, so that the best distance found so
+    # far prunes the batches that follow
+    order = numpy.argsort(lower_bounds, kind="stable")
+    nodes_a = nodes_a[order]
+    nodes_b = nodes_b[order]
+    lower_bounds = lower_bounds[order]
+
+    best = None  # type: Optional[ClosestPoints]
+    bound = upper_bound
+    leaf_pairs_per_batch = max(1, _TrianglePairsPerBatch // (MeshBVH.LeafSize * MeshBVH.LeafSize))
+    for start in range(0, len(nodes_a), leaf_pairs_per_batch):
+        if lower_bounds[start] > bound or (bound == 0 and best is not None):
+            break
+        if is_cancelled is not None and is_cancelled():
+            return None
+
+        batch = slice(start, start + leaf_pairs_per_batch)
+        in_bound = lower_bounds[batch] <= bound
+        leaves_a, pairs_a = numpy.unique(nodes_a[batch][in_bound], return_inverse=True)
+        leaves_b, pairs_b = numpy.unique(nodes_b[batch][in_bound], return_inverse=True)
+        triangles_a = _getLeafTriangles(geometry_a, bvh_a, leaves_a)
+        triangles_b = _getLeafTriangles(geometry_b, bvh_b, leaves_b)
+
+        # Prune the pairs of triangles by the distance between their boxes, and tighten the bound with the distance
+        # between their first corners
+        minimum_a = triangles_a.min(axis=2)[pairs_a, :, numpy.newaxis]
+        maximum_a = triangles_a.max(axis=2)[pairs_a, :, numpy.newaxis]
+        minimum_b = triangles_b.min(axis=2)[pairs_b, numpy.newaxis, :]
+        maximum_b = triangles_b.max(axis=2)[pairs_b, numpy.newaxis, :]
+        gaps = numpy.maximum(0, numpy.maximum(minimum_a - maximum_b, minimum_b - maximum_a))
+        triangle_bounds = numpy.sqrt((gaps * gaps).sum(axis=-1))
+        corners = triangles_a[pairs_a, :, numpy.newaxis, 0] - triangles_b[pairs_b, numpy.newaxis, :, 0]
+        bound = min(bound, float(numpy.sqrt(numpy.nanmin((corners * corners).sum(axis=-1)))))
+
+        pairs, rows_a, rows_b = numpy.nonzero(triangle_bounds <= bound)
+        if len(pairs) == 0:
+            continue
+        leaf_pairs_a = pairs_a[pairs]
+        leaf_pairs_b = pairs_b[pairs]
+        distances, points_a, points_b = _triangleDistances(
+            triangles_a[leaf_pairs_a, rows_a], triangles_b[leaf_pairs_b, rows_b]
+        )
+        nearest = int(numpy.nanargmin(distances))
+        if best is None or distances[nearest] < best.distance:
+            best = ClosestPoints(
+                float(distances[nearest]), points_a[nearest], points_b[nearest],
+                int(bvh_a._triangle_ids[leaves_a[leaf_pairs_a[nearest]] * MeshBVH.LeafSize + rows_a[nearest]]),
+                int(bvh_b._triangle_ids[leaves_b[leaf_pairs_b[nearest]] * MeshBVH.LeafSize + rows_b[nearest]])
+            )
+            bound = min(bound, best.distance)
+
+    return best
+
+
+##  Get the closest points between two nodes if they have been found before for their current geometry.
+def getCachedClosestPoints(geometry_a: NodeGeometry, geometry_b: NodeGeometry) -> Optional[ClosestPoints]:
+    return geometry_a.getCachedDerived(("closest_points", weakref.ref(geometry_b)))
+
+
+##  Remember the closest points between two nodes, for as long as neither of them moves or changes.
+def setCachedClosestPoints(geometry_a: NodeGeometry, geometry_b: NodeGeometry, closest_points: ClosestPoints) -> None:
+    geometry_a.setDerived(("closest_points", weakref.ref(geometry_b)), closest_points)
+
+
+_TrianglePairsPerBatch = 65536  # limits the size of the temporary arrays of the triangle pairs of leaves
+
+
+##  Get the boxes of the levels of the hierarchy of a node in world space.
+#   The leaves are bounded again from their transformed triangles, because transforming the local boxes of a rotated
+#   object would inflate them. Cached with the geometry of the node, so they are only computed again when it moves.
+def _getWorldLevels(node_geometry: NodeGeometry) -> List[Tuple[numpy.ndarray, numpy.ndarray]]:
+    def transformLevels() -> List[Tuple[numpy.ndarray, numpy.ndarray]]:
+        bvh = node_geometry.mesh_geometry.getBVH()
+        v0 = node_geometry.transformPoints(bvh._v0)
+        e1 = node_geometry.transformPoints(bvh._e1) - node_geometry.transformation[:3, 3]
+        e2 = node_geometry.transformPoints(bvh._e2) - node_geometry.transformation[:3, 3]
+        minimum = numpy.minimum(v0, numpy.minimum(v0 + e1, v0 + e2))
+        maximum = numpy.maximum(v0, numpy.maximum(v0 + e1, v0 + e2))
+
+        starts = numpy.arange(0, len(v0), MeshBVH.LeafSize)
+        levels = [(numpy.minimum.reduceat(minimum, starts), numpy.maximum.reduceat(maximum, starts))]
+        while len(levels[-1][0]) > 1:
+            minimum, maximum = levels[-1]
+            starts = numpy.arange(0, len(minimum), 2)
+            levels.append((numpy.minimum.reduceat(minimum, starts), numpy.maximum.reduceat(maximum, starts)))
+        return levels
+    return node_geometry.getDerived("world_bvh_levels", transformLevels)
+
+
+##  Get the world position of a representative vertex of each node at a level of a hierarchy.
+def _getRepresentatives(node_geometry: NodeGeometry, bvh: MeshBVH, level: int, nodes: numpy.ndarray) -> numpy.ndarray:
+    first_triangles = nodes * (MeshBVH.LeafSize << level)
+    return node_geometry.transformPoints(bvh._v0[first_triangles])
+
+
+##  Replace each node in a list of pairs by its (one or two) children on the level below.
+#   \return The children, and the other node of each pair repeated to match.
+def _splitNodes(nodes: numpy.ndarray, others: numpy.ndarray, child_count: int) -> Tuple[numpy.ndarray, numpy.ndarray]:
+    children = (nodes[:, numpy.newaxis] * 2 + numpy.array([0, 1])).ravel()
+    others = numpy.repeat(others, 2)
+    exists = children < child_count
+    return children[exists], others[exists]
+
+
+##  Get the distances between pairs of axis aligned boxes; 0 for boxes that overlap.
+def _boxDistances(minimum_a: numpy.ndarray, maximum_a: numpy.ndarray, minimum_b: numpy.ndarray, maximum_b: numpy.ndarray) -> numpy.ndarray:
+    gaps = numpy.maximum(0, numpy.maximum(minimum_a - maximum_b, minimum_b - maximum_a))
+    return numpy.sqrt(numpy.einsum("ij,ij->i", gaps, gaps))
+
+
+##  Get the world space corners of the triangles of leaves of a hierarchy.
+#   \return An array of shape (leaves, LeafSize, 3 corners, 3 axes). The last leaf of a hierarchy can have fewer
+#   triangles; the missing triangles are filled with nan, so they never compare as closer than any other.
+def _getLeafTriangles(node_geometry: NodeGeometry, bvh: MeshBVH, leaves: numpy.ndarray) -> numpy.ndarray:
+    sorted_ids = (leaves * MeshBVH.LeafSize)[:, numpy.newaxis] + numpy.arange(MeshBVH.LeafSize)
+    exists = sorted_ids < bvh.getTriangleCount()
+    sorted_ids = numpy.where(exists, sorted_ids, 0)
+
+    v0 = bvh._v0[sorted_ids]
+    triangles = node_geometry.transformPoints(numpy.stack([v0, v0 + bvh._e1[sorted_ids], v0 + bvh._e2[sorted_ids]], axis=2))
+    triangles[~exists] = numpy.nan
+    return triangles
+
+
+##  Get the exact distances between pairs of triangles, and the closest points on them.
+#
+#   For triangles that do not intersect, the closest points lie on an edge of both triangles or on a corner of one of
+#   them, so it suffices to compare the 9 pairs of edges and the 6 corners with the other triangle. Intersecting
+#   triangles are found by an edge of either triangle crossing the other one.
+#   \param triangles_a, triangles_b Arrays of shape (pairs, 3 corners, 3 axes).
+#   \return The distances, and the closest points on the first and on the second triangles.
+def _triangleDistances(triangles_a: numpy.ndarray, triangles_b: numpy.ndarray) -> Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]:
+    best_distances = numpy.full(len(triangles_a), numpy.inf)
+    best_a = numpy.zeros((len(triangles_a), 3))
+    best_b = numpy.zeros((len(triangles_a), 3))
+
+    def update(distances: numpy.ndarray, points_a: numpy.ndarray, points_b: numpy.ndarray) -> None:
+        closer = distances < best_distances
+        best_distances[closer] = distances[closer]
+        best_a[closer] = points_a[closer]
+        best_b[closer] = points_b[closer]
+
+    for i in range(3):
+        start_a = triangles_a[:, i]
+        end_a = triangles_a[:, (i + 1) % 3]
+        for j in range(3):
+            points_a, points_b = _closestPointsOnSegments(start_a, end_a, triangles_b[:, j], triangles_b[:, (j + 1) % 3])
+            update(numpy.linalg.norm(points_a - points_b, axis=1), points_a, points_b)
+
+    for i in range(3):
+        points_b = _closestPointsOnTriangles(triangles_a[:, i], triangles_b)
+        update(numpy.linalg.norm(triangles_a[:, i] - points_b, axis=1), triangles_a[:, i], points_b)
+        points_a = _closestPointsOnTriangles(triangles_b[:, i], triangles_a)
+        update(numpy.linalg.norm(points_a - triangles_b[:, i], axis=1), points_a, triangles_b[:, i])
+
+    for edge_triangles, other_triangles, is_a in ((triangles_a, triangles_b, True), (triangles_b, triangles_a, False)):
+        v0 = other_triangles[:, 0]
+        e1 = other_triangles[:, 1] - v0
+        e2 = other_triangles[:, 2] - v0
+        for i in range(3):
+            start = edge_triangles[:, i]
+            direction = edge_triangles[:, (i + 1) % 3] - start
+            distances, _, _ = _intersectTriangles(start, direction, v0, e1, e2)
+            crossing = distances <= 1
+            points = start + numpy.minimum(distances, 1)[:, numpy.newaxis] * direction
+            update(numpy.where(crossing, 0.0, numpy.inf), points, points)
+
+    return best_distances, best_a, best_b
+
+
+##  Get the closest points between pairs of line segments.
+#   \return The closest points on the first and on the second segments.
+def _closestPointsOnSegments(start_a: numpy.ndarray, end_a: numpy.ndarray, start_b: numpy.ndarray, end_b: numpy.ndarray) -> Tuple[numpy.ndarray, numpy.ndarray]:
+    direction_a = end_a - start_a
+    direction_b = end_b - start_b
+    offset = start_a - start_b
+    a = numpy.einsum("ij,ij->i", direction_a, direction_a)
+    e = numpy.einsum("ij,ij->i", direction_b, direction_b)
+    f = numpy.einsum("ij,ij->i", direction_b, offset)
+    c = numpy.einsum("ij,ij->i", direction_a, offset)
+    b = numpy.einsum("ij,ij->i", direction_a, direction_b)
+
+    # Parameters of the closest points on the infinite lines, clamped to the segments; parallel and degenerate
+    # segments start at the start of the first segment
+    safe_a = numpy.maximum(a, 1e-12)
+    safe_e = numpy.maximum(e, 1e-12)
+    denominator = a * e - b * b
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        s = numpy.where(denominator > 1e-12 * numpy.maximum(a * e, 1e-12), (b * f - c * e) / denominator, 0.0)
+    s = numpy.clip(s, 0, 1)
+    t = (b * s + f) / safe_e
+
+    # If the closest point on the second segment is beyond its ends, clamp it and recompute the first
+    t_clamped = numpy.clip(t, 0, 1)
+    s = numpy.where(t_clamped != t, numpy.clip((b * t_clamped - c) / safe_a, 0, 1), s)
+    t = t_clamped
+
+    s = numpy.where(a > 1e-12, s, 0.0)
+    t = numpy.where(e > 1e-12, t, 0.0)
+    return start_a + s[:, numpy.newaxis] * direction_a, start_b + t[:, numpy.newaxis] * direction_b
+
+
+##  Get the closest points on triangles to points, pairwise.
+#   \param triangles An array of shape (pairs, 3 corners, 3 axes).
+def _closestPointsOnTriangles(points: numpy.ndarray, triangles: numpy.ndarray) -> numpy.ndarray:
+    v0 = triangles[:, 0]
+    e1 = triangles[:, 1] - v0
+    e2 = triangles[:, 2] - v0
+    normals = numpy.cross(e1, e2)
+    squared_areas = numpy.einsum("ij,ij->i", normals, normals)
+
+    # The projection on the plane of the triangle, if that lies within the triangle
+    offsets = points - v0
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        u = numpy.einsum("ij,ij->i", numpy.cross(offsets, e2), normals) / squared_areas
+        v = numpy.einsum("ij,ij->i", numpy.cross(e1, offsets), normals) / squared_areas
+    inside = (squared_areas > 1e-24) & (u >= 0) & (v >= 0) & (u + v <= 1)
+    projected = v0 + numpy.nan_to_num(u)[:, numpy.newaxis] * e1 + numpy.nan_to_num(v)[:, numpy.newaxis] * e2
+
+    # Otherwise the closest point lies on one of the edges
+    result = projected
+    best_distances = numpy.where(inside, 0.0, numpy.inf)
+    for i in range(3):
+        start = triangles[:, i]
+        direction = triangles[:, (i + 1) % 3] - start
+        lengths = numpy.maximum(numpy.einsum("ij,ij->i", direction, direction), 1e-24)
+        t = numpy.clip(numpy.einsum("ij,ij->i", points - start, direction) / lengths, 0, 1)
+        edge_points = start + t[:, numpy.newaxis] * direction
+        distances = numpy.linalg.norm(points - edge_points, axis=1)
+        closer = distances < best_distances
+        result = numpy.where(closer[:, numpy.newaxis], edge_points, result)
+        best_distances = numpy.where(closer, distances, best_distances)
+    return result
@@ -0,0 +1,263 @@
+# Copyright (c) 2023 Aldo Hoeben / fieldOfView
+# MeasureTool is released under the terms of the AGPLv3 or higher.
+
+import numpy
+
+try:
+    from scipy.sparse import coo_matrix
+    from scipy.sparse.csgraph import connected_components
+except ImportError:
+    connected_components = None
+
+from typing import Dict, List, Optional, Tuple
+
+
+##  Tables of points on a mesh that are interesting to snap to, in the local coordinate space of the mesh.
+#
+#   Each table is computed the first time it is requested:
+#   * vertices: the unique vertices of the mesh
+#   * edge midpoints: the midpoints of sharp edges, and of edges on the boundary of the mesh
+#   * face centroids: the centroids of planar faces, being groups of connected coplanar triangles that are bounded
+#     by sharp edges
+#   * circle centers: the centers of circles fitted to the boundary loops of planar faces, such as holes and bosses
+class MeshFeatures:
+    Vertices = "vertices"
+    EdgeMidpoints = "edge_midpoints"
+    FaceCentroids = "face_centroids"
+    CircleCenters = "circle_centers"
+
+    SharpEdgeAngle = 30.0  # minimum angle in degrees between the faces on either side of a sharp edge
+    CoplanarAngle = 1.0  # maximum angle in degrees between triangles that are considered to be in the same plane
+    MinimumCirclePoints = 6  # minimum number of vertices in a loop for a circle to be fitted to it
+    MaximumCircleError = 0.01  # maximum RMS deviation from the fitted circle, relative to the radius
+
+    def __init__(self, vertices: numpy.ndarray, indices: Optional[numpy.ndarray] = None) -> None:
+        vertices = numpy.asarray(vertices, dtype=numpy.float64)
+        if indices is None:
+            indices = numpy.arange(len(vertices) - len(vertices) % 3).reshape(-1, 3)
+
+        # Weld coincident vertices, since meshes loaded from STL files have a separate vertex per triangle corner
+        self._vertices, inverse = numpy.unique(vertices, axis=0, return_inverse=True)
+        self._vertex_map = inverse.reshape(-1)
+        faces = self._vertex_map[numpy.asarray(indices, dtype=numpy.int64)]
+        degenerate = (faces[:, 0] == faces[:, 1]) | (faces[:, 1] == faces[:, 2]) | (faces[:, 2] == faces[:, 0])
+        self._faces = faces[~degenerate]
+
+        self._tables = {}  # type: Dict[str, numpy.ndarray]
+        self._topology = None  # type: Optional[Tuple[numpy.ndarray, ...]]
+        self._regions = None  # type: Optional[Tuple[numpy.ndarray, numpy.ndarray]]
+
+    def getVertices(self) -> numpy.ndarray:
+        return self._vertices
+
+    def getFaces(self) -> numpy.ndarray:
+        return self._faces
+
+    ##  Get the index of the unique vertex for each vertex of the mesh data.
+    def getVertexMap(self) -> numpy.ndarray:
+        return self._vertex_map
+
+    ##  Get the points of a type of feature, computing them if that has not been done before.
+    #   \return An array of shape (points, 3).
+    def getPoints(self, feature: str) -> numpy.ndarray:
+        if feature == MeshFeatures.Vertices:
+            return self._vertices
+
+        if feature not in self._tables:
+            if feature == MeshFeatures.EdgeMidpoints:
+                self._tables[feature] = self._computeEdgeMidpoints()
+            elif feature == MeshFeatures.FaceCentroids:
+                self._tables[feature] = self._computeFaceCentroids()
+            elif feature == MeshFeatures.CircleCenters:
+                self._tables[feature] = self._computeCircleCenters()
+            else:
+                raise ValueError("Unknown feature type: %s" % feature)
+        return self._tables[feature]
+
+    ##  Get the half-edges of the mesh, sorted so the two halves of each edge are next to each other.
+    #   \return A tuple of arrays with the start vertex, end vertex and face of each half-edge, the (undirected) edge
+    #   each half-edge belongs to, the number of half-edges per edge and the unit normal of each face.
+    def _getTopology(self) -> Tuple[numpy.ndarray, ...]:
+        if self._topology is None:
+            faces = self._faces
+            starts = faces.ravel()
+            ends = numpy.roll(faces, -1, axis=1).ravel()
+            half_edge_faces = numpy.repeat(numpy.arange(len(faces)), 3)
+
+            keys = numpy.minimum(starts, ends) * len(self._vertices) + numpy.maximum(starts, ends)
+            order = numpy.argsort(keys, kind="stable")
+            _, edges, counts = numpy.unique(keys[order], return_inverse=True, return_counts=True)
+
+            corners = self._vertices[faces]
+            normals = numpy.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+            areas = numpy.linalg.norm(normals, axis=1)
+            normals = normals / numpy.maximum(areas, 1e-12)[:, numpy.newaxis]
+
+            self._topology = (starts[order], ends[order], half_edge_faces[order], edges.reshape(-1), counts, normals)
+        return self._topology
+
+    ##  Get the pairs of faces on either side of manifold edges.
+    #   \return A tuple of the index of the first half-edge of each manifold edge, and the faces on either side.
+    def _getManifoldEdges(self) -> Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]:
+        _, _, half_edge_faces, edges, counts, _ = self._getTopology()
+        first_half_edges = numpy.concatenate([[0], numpy.cumsum(counts)[:-1]])
+        manifold = first_half_edges[counts == 2]
+        return manifold, half_edge_faces[manifold], half_edge_faces[manifold + 1]
+
+    def _computeEdgeMidpoints(self) -> numpy.ndarray:
+        starts, ends, _, _, counts, normals = self._getTopology()
+        first_half_edges = numpy.concatenate([[0], numpy.cumsum(counts)[:-1]])
+
+        manifold, faces_a, faces_b = self._getManifoldEdges()
+        cosines = numpy.einsum("ij,ij->i", normals[faces_a], normals[faces_b])
+        sharp = manifold[cosines < numpy.cos(numpy.radians(MeshFeatures.SharpEdgeAngle))]
+
+        # Edges that do not have exactly two faces are either on the boundary of the mesh or non-manifold
+        other = first_half_edges[counts != 2]
+
+        half_edges = numpy.concatenate([sharp, other])
+        return (self._vertices[starts[half_edges]] + self._vertices[ends[half_edges]]) / 2
+
+    ##  Group the faces of the mesh into planar faces.
+    #   \return A tuple of the region label of each face, and a boolean per region indicating whether that region is
+    #   a planar face bounded by sharp edges.
+    def _getRegions(self) -> Tuple[numpy.ndarray, numpy.ndarray]:
+        if self._regions is not None:
+            return self._regions
+
+        normals = self._getTopology()[5]
+        _, faces_a, faces_b = self._getManifoldEdges()
+        cosines = numpy.einsum("ij,ij->i", normals[faces_a], normals[faces_b])
+
+        coplanar = cosines >= numpy.cos(numpy.radians(MeshFeatures.CoplanarAngle))
+        labels = _connectedComponents(len(self._faces), faces_a[coplanar], faces_b[coplanar])
+        region_count = labels.max() + 1 if len(labels) else 0
+
+        # A region that borders a smooth (not sharp) edge is a facet of a curved surface rather than a planar face
+        smooth = (~coplanar) & (cosines >= numpy.cos(numpy.radians(MeshFeatures.SharpEdgeAngle)))
+        valid = numpy.ones(region_count, dtype=bool)
+        valid[labels[faces_a[smooth]]] = False
+        valid[labels[faces_b[smooth]]] = False
+
+        self._regions = (labels, valid)
+        return self._regions
+
+    def _computeFaceCentroids(self) -> numpy.ndarray:
+        labels, valid = self._getRegions()
+        if len(valid) == 0:
+            return numpy.zeros((0, 3))
+
+        corners = self._vertices[self._faces]
+        areas = numpy.linalg.norm(numpy.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0]), axis=1) / 2
+        centers = corners.mean(axis=1)
+
+        region_areas = numpy.bincount(labels, weights=areas, minlength=len(valid))
+        centroids = numpy.stack([
+            numpy.bincount(labels, weights=areas * centers[:, axis], minlength=len(valid)) for axis in range(3)
+        ], axis=1)
+
+        valid = valid & (region_areas > 0)
+        return centroids[valid] / region_areas[valid, numpy.newaxis]
+
+    def _computeCircleCenters(self) -> numpy.ndarray:
+        starts, ends, half_edge_faces, edges, _, normals = self._getTopology()
+        labels, valid = self._getRegions()
+        if len(valid) == 0:
+            return numpy.zeros((0, 3))
+
+        # Half-edges on the boundary of a planar face are those whose twin lies in a different region, or that
+        # have no twin at all
+        regions = labels[half_edge_faces]
+        same_edge_next = numpy.zeros(len(starts), dtype=bool)
+        same_edge_next[:-1] = edges[1:] == edges[:-1]
+        same_edge_previous = numpy.roll(same_edge_next, 1)
+        twin_regions = numpy.full(len(starts), -1)
+        twin_regions[same_edge_next] = regions[numpy.nonzero(same_edge_next)[0] + 1]
+        twin_regions[same_edge_previous] = regions[numpy.nonzero(same_edge_previous)[0] - 1]
+
+        boundary = valid[regions] & (twin_regions != regions)
+        boundary_indices = numpy.nonzero(boundary)[0]
+        order = numpy.argsort(regions[boundary_indices], kind="stable")
+        boundary_indices = boundary_indices[order]
+
+        centers = []  # type: List[numpy.ndarray]
+        region_starts = numpy.searchsorted(regions[boundary_indices], numpy.arange(len(valid) + 1))
+        for region in numpy.nonzero(valid)[0]:
+            half_edges = boundary_indices[region_starts[region]:region_starts[region + 1]]
+            if len(half_edges) < MeshFeatures.MinimumCirclePoints:
+                continue
+            normal = normals[half_edge_faces[half_edges[0]]]
+            for loop in _chainLoops(starts[half_edges], ends[half_edges]):
+                if len(loop) < MeshFeatures.MinimumCirclePoints:
+                    continue
+                center = _fitCircle(self._vertices[loop], normal)
+                if center is not None:
+                    centers.append(center)
+
+        if not centers:
+            return numpy.zeros((0, 3))
+        return numpy.array(centers)
+
+
+##  Label the connected components of a graph.
+def _connectedComponents(count: int, a: numpy.ndarray, b: numpy.ndarray) -> numpy.ndarray:
+    if connected_components is not None:
+        graph = coo_matrix((numpy.ones(len(a), dtype=numpy.int8), (a, b)), shape=(count, count))
+        return connected_components(graph, directed=False)[1]
+
+    # Propagate the lowest label along the edges until nothing changes, jumping along chains of labels
+    labels = numpy.arange(count)
+    while True:
+        previous = labels.copy()
+        minimum = numpy.minimum(labels[a], labels[b])
+        numpy.minimum.at(labels, a, minimum)
+        numpy.minimum.at(labels, b, minimum)
+        labels = labels[labels]
+        if numpy.array_equal(labels, previous):
+            break
+    _, labels = numpy.unique(labels, return_inverse=True)
+    return labels.reshape(-1)
+
+
+##  Chain directed edges into closed loops of vertices.
+def _chainLoops(starts: numpy.ndarray, ends: numpy.ndarray) -> List[List[int]]:
+    successors = dict(zip(starts.tolist(), ends.tolist()))
+    loops = []  # type: List[List[int]]
+    while successors:
+        first, vertex = successors.popitem()
+        loop = [first]
+        while vertex != first and vertex in successors:
+            loop.append(vertex)
+            vertex = successors.pop(vertex)
+        if vertex == first:
+            loops.append(loop)
+    return loops
+
+
+##  Fit a circle through points in a plane.
+#   \return The center of the circle, or None if the points do not lie on a circle.
+def _fitCircle(points: numpy.ndarray, normal: numpy.ndarray) -> Optional[numpy.ndarray]:
+    # Construct a 2D coordinate system in the plane
+    axis_u = numpy.cross(normal, [1.0, 0.0, 0.0] if abs(normal[0]) < 0.9 else [0.0, 1.0, 0.0])
+    axis_u /= numpy.linalg.norm(axis_u)
+    axis_v = numpy.cross(normal, axis_u)
+
+    origin = points.mean(axis=0)
+    u = (points - origin).dot(axis_u)
+    v = (points - origin).dot(axis_v)
+
+    # Algebraic (Kasa) fit: u^2 + v^2 = 2 a u + 2 b v + c
+    matrix = numpy.stack([2 * u, 2 * v, numpy.ones(len(u))], axis=1)
+    (a, b, c), _, rank, _ = numpy.linalg.lstsq(matrix, u * u + v * v, rcond=None)
+    if rank < 3:
+        return None
+    radius_squared = c + a * a + b * b
+    if radius_squared <= 0:
+        return None
+    radius = numpy.sqrt(radius_squared)
+
+    error = numpy.sqrt(numpy.mean((numpy.hypot(u - a, v - b) - radius) ** 2))
+    if error > MeshFeatures.MaximumCircleError * radius:
+        return None
+
+    return origin + a * axis_u + b * axis_v
@@ -0,0 +1,54 @@
+# Copyright (c) 2023 Aldo Hoeben / fieldOfView
+# MeasureTool is released under the terms of the AGPLv3 or higher.
+
+from UM.Job import Job
+
+from .GeometryCache import NodeGeometry
+from .MeshDistance import ClosestPoints, findClosestPoints, getCachedClosestPoints, setCachedClosestPoints
+
+from typing import List, Optional
+
+
+##  Finds the closest points between two objects in a background thread.
+#
+#   Each object can consist of several meshes, for example when it is a group. The closest points are found per pair
+#   of meshes, and cached with the geometry of the meshes so they are only searched again after either mesh moves.
+#   The result is None if either object has no triangles, or if the job was cancelled.
+class MinimumDistanceJob(Job):
+    def __init__(self, geometries_a: List[NodeGeometry], geometries_b: List[NodeGeometry]) -> None:
+        super().__init__()
+        self._geometries_a = geometries_a
+        self._geometries_b = geometries_b
+        self._cancelled = False
+
+    ##  Check whether the closest points of all pairs of meshes are already cached.
+    def isCached(self) -> bool:
+        return all(
+            getCachedClosestPoints(geometry_a, geometry_b) is not None
+            for geometry_a in self._geometries_a for geometry_b in self._geometries_b
+        )
+
+    def cancel(self) -> None:
+        self._cancelled = True
+        super().cancel()
+
+    def isCancelled(self) -> bool:
+        return self._cancelled
+
+    def run(self) -> None:
+        nearest = None  # type: Optional[ClosestPoints]
+        for geometry_a in self._geometries_a:
+            for geometry_b in self._geometries_b:
+                closest_points = getCachedClosestPoints(geometry_a, geometry_b)
+                if closest_points is None:
+                    closest_points = findClosestPoints(geometry_a, geometry_b, self.isCancelled)
+                    if self._cancelled:
+                        self.setResult(None)
+                        return
+                    if closest_points is None:
+                        continue
+                    setCachedClosestPoints(geometry_a, geometry_b, closest_points)
+
+                if nearest is None or closest_points.distance < nearest.distance:
+                    nearest = closest_points
+        self.setResult(nearest)
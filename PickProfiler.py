@@ -0,0 +1,121 @@
+# Copyright (c) 2023 Aldo Hoeben / fieldOfView
+# MeasureTool is released under the terms of the AGPLv3 or higher.
+
+from UM.Logger import Logger
+
+from collections import deque
+import time
+import numpy
+
+from typing import Deque, Dict, List, Optional, Tuple
+
+
+##  Times the stages of picking a position, to find out where the time of a slow pick goes.
+#
+#   A pick is timed between beginPick() and endPick(); the code in between calls mark() after each stage, which
+#   attributes the time since the previous mark to that stage. A stage can be marked more than once per pick, for
+#   example once per picking pass; the durations are added up. The durations of the most recent picks are kept per
+#   stage, and summarized as percentiles. When profiling is disabled, all methods return immediately.
+class PickProfiler:
+    SampleCount = 200  # number of most recent picks that the percentiles are computed over
+    Percentiles = (50, 90, 99)
+    LogInterval = 30  # seconds between summaries in the log
+
+    # Stages of a pick
+    Traversal = "traversal"  # collecting and culling the nodes to render
+    Render = "render"  # drawing the picking passes and waiting for the GPU to finish
+    Readback = "readback"  # reading and decoding the pixels under the cursor
+    RayCast = "raycast"  # casting a ray on the CPU, instead of rendering
+    Snap = "snap"  # snapping to features
+    Propagation = "propagation"  # notifying the scene and the tool panel of the new position
+    Total = "total"
+
+    __instance = None  # type: Optional[PickProfiler]
+
+    @classmethod
+    def getInstance(cls) -> "PickProfiler":
+        if cls.__instance is None:
+            cls.__instance = cls()
+        return cls.__instance
+
+    def __init__(self) -> None:
+        self._enabled = False
+        self._samples = {}  # type: Dict[str, Deque[float]]
+        self._pick_start = None  # type: Optional[float]
+        self._pick_stages = {}  # type: Dict[str, float]
+        self._last_mark = 0.0
+        self._last_log_time = 0.0
+        self._summary = None  # type: Optional[Dict[str, Tuple[float, ...]]]
+
+    def isEnabled(self) -> bool:
+        return self._enabled
+
+    def setEnabled(self, enabled: bool) -> None:
+        if enabled == self._enabled:
+            return
+        self._enabled = enabled
+        self.reset()
+
+    def reset(self) -> None:
+        self._samples = {}
+        self._pick_start = None
+        self._summary = None
+        self._last_log_time = time.monotonic()
+
+    def beginPick(self) -> None:
+        if not self._enabled:
+            return
+        self._pick_start = self._last_mark = time.perf_counter()
+        self._pick_stages = {}
+
+    ##  Attribute the time since the start of the pick or the previous mark to a stage.
+    def mark(self, stage: str) -> None:
+        if not self._enabled or self._pick_start is None:
+            return
+        now = time.perf_counter()
+        self._pick_stages[stage] = self._pick_stages.get(stage, 0.0) + now - self._last_mark
+        self._last_mark = now
+
+    ##  Finish timing a pick and add its durations to the statistics.
+    #   \return Whether the statistics changed.
+    def endPick(self) -> bool:
+        if not self._enabled or self._pick_start is None:
+            return False
+        self._pick_stages[PickProfiler.Total] = time.perf_counter() - self._pick_start
+        for stage, duration in self._pick_stages.items():
+            self._addSample(stage, duration)
+        self._pick_start = None
+
+        if time.monotonic() - self._last_log_time > PickProfiler.LogInterval:
+            self._last_log_time = time.monotonic()
+            Logger.log("d", "Pick latency in ms (%s): %s", "/".join("p%d" % p for p in PickProfiler.Percentiles), self.getSummaryText())
+        return True
+
+    ##  Get the percentiles of the duration of each stage, in milliseconds.
+    def getSummary(self) -> Dict[str, Tuple[float, ...]]:
+        if self._summary is None:
+            self._summary = {
+                stage: tuple(float(value) * 1000 for value in numpy.percentile(samples, PickProfiler.Percentiles))
+                for stage, samples in self._samples.items()
+            }
+        return self._summary
+
+    ##  Get the summary as a single line of text, with the total first.
+    def getSummaryText(self) -> str:
+        summary = self.getSummary()
+        if not summary:
+            return ""
+
+        stages = sorted(summary.keys(), key=lambda stage: (stage != PickProfiler.Total, stage))
+        parts = []  # type: List[str]
+        for stage in stages:
+            parts.append("%s %s" % (stage, "/".join("%.1f" % value for value in summary[stage])))
+        return ", ".join(parts)
+
+    def _addSample(self, stage: str, duration: float) -> None:
+        samples = self._samples.get(stage)
+        if samples is None:
+            samples = deque(maxlen=PickProfiler.SampleCount)
+            self._samples[stage] = samples
+        samples.append(duration)
+        self._summary = None
@@ -0,0 +1,66 @@
+# Copyright (c) 2023 Aldo Hoeben / fieldOfView
+# MeasureTool is released under the terms of the AGPLv3 or higher.
+
+try:
+    from cura.ApplicationMetadata import CuraSDKVersion
+except ImportError:  # Cura <= 3.6
+    CuraSDKVersion = "6.0.0"
+if CuraSDKVersion >= "8.0.0":
+    from PyQt6.QtCore import QTimer
+else:
+    from PyQt5.QtCore import QTimer
+
+from typing import Any, Callable, Optional
+
+
+##  Limits picking during a drag to at most one pick per rendered frame.
+#
+#   A pick moves a point of the measurement, which redraws the scene and updates the tool panel. Mice that report
+#   their position more often than the scene is drawn would cause several picks per frame, of which only the last is
+#   ever seen. The first event after a frame is picked immediately; later events before the next frame only replace
+#   the pending event, which is picked when the next frame has been drawn.
+class PickScheduler:
+    FrameTimeout = 50  # ms after which a pending event is picked anyway, in case no frame is drawn
+
+    def __init__(self, pick_callback: Callable[[Any], None]) -> None:
+        self._pick_callback = pick_callback
+        self._pending_event = None  # type: Optional[Any]
+        self._waiting_for_frame = False
+
+        self._frame_timer = QTimer()
+        self._frame_timer.setSingleShot(True)
+        self._frame_timer.setInterval(PickScheduler.FrameTimeout)
+        self._frame_timer.timeout.connect(self.onFrame)
+
+    ##  Pick for an event now if no pick has been done since the last frame, or else at the next frame.
+    def schedule(self, event: Any) -> None:
+        if self._waiting_for_frame:
+            self._pending_event = event  # replaces any older event that has not been picked yet
+            return
+        self._pick(event)
+
+    ##  Check whether a pick has been done since the last frame, so the next frame needs to be reported.
+    def isWaitingForFrame(self) -> bool:
+        return self._waiting_for_frame
+
+    ##  Drop the pending event, if any.
+    def cancel(self) -> None:
+        self._pending_event = None
+        self._waiting_for_frame = False
+        self._frame_timer.stop()
+
+    ##  Call when a frame has been drawn. This picks, so it must be called on the main thread; the frameSwapped signal
+    #   of the main window is emitted on the render thread when Qt uses its threaded render loop.
+    def onFrame(self, *args, **kwargs) -> None:
+        self._waiting_for_frame = False
+        self._frame_timer.stop()
+
+        event = self._pending_event
+        if event is not None:
+            self._pending_event = None
+            self._pick(event)
+
+    def _pick(self, event: Any) -> None:
+        self._waiting_for_frame = True
+        self._frame_timer.start()
+        self._pick_callback(event)
@@ -0,0 +1,278 @@
+# Copyright (c) 2023 Aldo Hoeben / fieldOfView
+# MeasureTool is released under the terms of the AGPLv3 or higher.
+
+from UM.Logger import Logger
+
+try:
+    from cura.ApplicationMetadata import CuraSDKVersion
+except ImportError:  # Cura <= 3.6
+    CuraSDKVersion = "6.0.0"
+if CuraSDKVersion >= "8.0.0":
+    from PyQt6.QtGui import QOpenGLContext
+else:
+    from PyQt5.QtGui import QOpenGLContext
+
+import ctypes
+import sys
+import numpy
+
+from typing import Any, Dict, List, Optional, Tuple
+
+GL_RGBA = 0x1908
+GL_UNSIGNED_BYTE = 0x1401
+GL_FLOAT = 0x1406
+GL_PIXEL_PACK_BUFFER = 0x88EB
+GL_STREAM_READ = 0x88E1
+GL_MAP_READ_BIT = 0x0001
+GL_SYNC_GPU_COMMANDS_COMPLETE = 0x9117
+GL_SYNC_FLUSH_COMMANDS_BIT = 0x0001
+GL_ALREADY_SIGNALED = 0x911A
+GL_CONDITION_SATISFIED = 0x911C
+
+# OpenGL entry points use the stdcall calling convention on Windows
+_GLFunctionType = ctypes.WINFUNCTYPE if sys.platform == "win32" else ctypes.CFUNCTYPE  # type: ignore
+
+# Return type and argument types of the OpenGL functions that are used
+_signatures = {
+    "glReadPixels": (None, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_uint, ctypes.c_uint, ctypes.c_void_p),
+    "glGenBuffers": (None, ctypes.c_int, ctypes.POINTER(ctypes.c_uint)),
+    "glDeleteBuffers": (None, ctypes.c_int, ctypes.POINTER(ctypes.c_uint)),
+    "glBindBuffer": (None, ctypes.c_uint, ctypes.c_uint),
+    "glBufferData": (None, ctypes.c_uint, ctypes.c_ssize_t, ctypes.c_void_p, ctypes.c_uint),
+    "glMapBufferRange": (ctypes.c_void_p, ctypes.c_uint, ctypes.c_ssize_t, ctypes.c_ssize_t, ctypes.c_uint),
+    "glUnmapBuffer": (ctypes.c_ubyte, ctypes.c_uint),
+    "glFenceSync": (ctypes.c_void_p, ctypes.c_uint, ctypes.c_uint),
+    "glClientWaitSync": (ctypes.c_uint, ctypes.c_void_p, ctypes.c_uint, ctypes.c_uint64),
+    "glDeleteSync": (None, ctypes.c_void_p),
+}  # type: Dict[str, Tuple[Any, ...]]
+
+# Functions needed for reading back pixels asynchronously through pixel buffer objects (OpenGL 3.2)
+_async_functions = [
+    "glGenBuffers", "glDeleteBuffers", "glBindBuffer", "glBufferData",
+    "glMapBufferRange", "glUnmapBuffer", "glFenceSync", "glClientWaitSync", "glDeleteSync"
+]
+
+
+##  Reads pixels from the currently bound framebuffer straight into numpy arrays.
+#
+#   The Qt OpenGL bindings used by Uranium only offer reading back a complete framebuffer as a QImage, which is
+#   both slow for large viewports and unable to represent floating point render targets. This class resolves
+#   glReadPixels from the current OpenGL context instead, so arbitrary (small) regions can be read in any format.
+class PixelReadback:
+    __instance = None  # type: Optional[PixelReadback]
+
+    @classmethod
+    def getInstance(cls) -> "PixelReadback":
+        if cls.__instance is None:
+            cls.__instance = cls()
+        return cls.__instance
+
+    def __init__(self) -> None:
+        self._context_key = None  # type: Optional[int]
+        self._functions = {}  # type: Dict[str, Any]
+        self._supported = None  # type: Optional[bool]
+        self._async_supported = None  # type: Optional[bool]
+
+    ##  Check if pixels can be read from the current context.
+    def isSupported(self) -> bool:
+        self._updateContext()
+        if self._context_key is None:
+            return False
+        if self._supported is None:
+            self._supported = self.getFunction("glReadPixels") is not None
+        return self._supported
+
+    ##  Check if pixels can be read asynchronously through pixel buffer objects in the current context.
+    def isAsyncSupported(self) -> bool:
+        if not self.isSupported():
+            return False
+        if self._async_supported is None:
+            self._async_supported = all(self.getFunction(name) is not None for name in _async_functions)
+        return self._async_supported
+
+    ##  Get a callable for an OpenGL function in the current context.
+    #   \return The function, or None if the function is not available.
+    def getFunction(self, name: str) -> Optional[Any]:
+        if name in self._functions:
+            return self._functions[name]
+
+        context = QOpenGLContext.currentContext()
+        if not context:
+            return None
+
+        try:
+            address = int(context.getProcAddress(name.encode("ascii")))
+        except (TypeError, ValueError):
+            address = 0
+        if not address:
+            Logger.log("w", "Unable to resolve OpenGL function %s", name)
+            return None
+
+        function = _GLFunctionType(*_signatures[name])(address)
+        self._functions[name] = function
+        return function
+
+    ##  Read a rectangle of RGBA pixels from the currently bound framebuffer.
+    #
+    #   \param x, y The lower left corner of the rectangle, in OpenGL (bottom-up) window coordinates.
+    #   \param width, height The size of the rectangle.
+    #   \param floating_point Read the pixels as 32 bit floats instead of 8 bit integers.
+    #   \return An array of shape (height, width, 4), with the first row being the bottom row.
+    def readPixels(self, x: int, y: int, width: int, height: int, floating_point: bool = False) -> Optional[numpy.ndarray]:
+        if not self.isSupported():
+            return None
+
+        if floating_point:
+            pixels = numpy.zeros((height, width, 4), dtype=numpy.float32)
+            data_type = GL_FLOAT
+        else:
+            pixels = numpy.zeros((height, width, 4), dtype=numpy.uint8)
+            data_type = GL_UNSIGNED_BYTE
+
+        self._functions["glReadPixels"](
+            x, y, width, height, GL_RGBA, data_type, pixels.ctypes.data_as(ctypes.c_void_p)
+        )
+        return pixels
+
+    ##  Start reading a rectangle of RGBA pixels into the currently bound pixel pack buffer.
+    #   The call returns immediately; the data is copied into the buffer by the GPU when it gets to it.
+    def readPixelsIntoBuffer(self, x: int, y: int, width: int, height: int, floating_point: bool = False) -> None:
+        data_type = GL_FLOAT if floating_point else GL_UNSIGNED_BYTE
+        self._functions["glReadPixels"](x, y, width, height, GL_RGBA, data_type, ctypes.c_void_p(0))
+
+    def _updateContext(self) -> None:
+        context = QOpenGLContext.currentContext()
+        context_key = id(context) if context else None
+        if context_key != self._context_key:
+            self._context_key = context_key
+            self._functions = {}
+            self._supported = None
+            self._async_supported = None
+
+
+##  Reads pixels from the currently bound framebuffer without stalling the CPU until the GPU has finished rendering.
+#
+#   Pixels are read into one of a ring of pixel buffer objects, and a fence is inserted into the command stream.
+#   Later calls to poll() check which reads have completed and return the most recent of those, so the readback of
+#   one frame overlaps the work of the next. Reads that are superseded by a more recent completed read are dropped.
+class AsyncPixelReadback:
+    def __init__(self, floating_point: bool = False, buffer_count: int = 2) -> None:
+        self._readback = PixelReadback.getInstance()
+        self._floating_point = floating_point
+        self._item_size = 4 if floating_point else 1
+
+        self._buffers = None  # type: Optional[ctypes.Array]
+        self._buffer_size = 0
+        self._requests = [None] * buffer_count  # type: List[Optional[Tuple[int, int, Tuple[int, int, int], Any]]]
+        self._next_slot = 0
+        self._sequence = 0
+
+    ##  Start reading a rectangle of RGBA pixels from the currently bound framebuffer.
+    #   \param tag Arbitrary data that is returned alongside the pixels by poll().
+    def request(self, x: int, y: int, width: int, height: int, tag: Any = None) -> None:
+        slot = self._next_slot
+        if self._requests[slot] is not None:
+            # The ring is full; drop the oldest read that is still in flight
+            self._discard(slot)
+
+        size = width * height * 4 * self._item_size
+        self._ensureBuffers(size)
+
+        gl_bind_buffer = self._readback.getFunction("glBindBuffer")
+        gl_bind_buffer(GL_PIXEL_PACK_BUFFER, self._buffers[slot])
+        self._readback.readPixelsIntoBuffer(x, y, width, height, floating_point=self._floating_point)
+        gl_bind_buffer(GL_PIXEL_PACK_BUFFER, 0)
+
+        fence = self._readback.getFunction("glFenceSync")(GL_SYNC_GPU_COMMANDS_COMPLETE, 0)
+
+        self._sequence += 1
+        self._requests[slot] = (self._sequence, fence, (height, width, 4), tag)
+        self._next_slot = (slot + 1) % len(self._requests)
+
+    ##  Get the pixels of the most recent read that has completed.
+    #   \return A tuple with an array of shape (height, width, 4) and the tag passed to request(), or None if none of
+    #   the pending reads have completed.
+    def poll(self) -> Optional[Tuple[numpy.ndarray, Any]]:
+        gl_client_wait_sync = self._readback.getFunction("glClientWaitSync")
+
+        completed_slot = None
+        for slot in self._getPendingSlots():
+            status = gl_client_wait_sync(self._requests[slot][1], GL_SYNC_FLUSH_COMMANDS_BIT, 0)
+            if status not in (GL_ALREADY_SIGNALED, GL_CONDITION_SATISFIED):
+                break  # later reads can not have completed before this one
+            if completed_slot is not None:
+                self._discard(completed_slot)
+            completed_slot = slot
+
+        if completed_slot is None:
+            return None
+
+        _, _, shape, tag = self._requests[completed_slot]
+        pixels = self._mapBuffer(completed_slot, shape)
+        self._discard(completed_slot)
+        return pixels, tag
+
+    ##  Drop all reads that are in flight.
+    def cancel(self) -> None:
+        for slot in range(len(self._requests)):
+            if self._requests[slot] is not None:
+                self._discard(slot)
+
+    ##  Release the pixel buffer objects and the fences of reads in flight. Should be called with the OpenGL context
+    #   current; without a current context they can not be deleted, and are left to be released with the context.
+    def destroy(self) -> None:
+        if not QOpenGLContext.currentContext():
+            self._requests = [None] * len(self._requests)
+            self._buffers = None
+            self._buffer_size = 0
+            return
+
+        self.cancel()
+        if self._buffers is not None:
+            self._readback.getFunction("glDeleteBuffers")(len(self._buffers), self._buffers)
+            self._buffers = None
+            self._buffer_size = 0
+
+    def _getPendingSlots(self) -> List[int]:
+        pending = [slot for slot in range(len(self._requests)) if self._requests[slot] is not None]
+        return sorted(pending, key=lambda slot: self._requests[slot][0])
+
+    def _ensureBuffers(self, size: int) -> None:
+        if self._buffers is not None and self._buffer_size >= size:
+            return
+        self.destroy()
+
+        buffers = (ctypes.c_uint * len(self._requests))()
+        self._readback.getFunction("glGenBuffers")(len(self._requests), buffers)
+
+        gl_bind_buffer = self._readback.getFunction("glBindBuffer")
+        gl_buffer_data = self._readback.getFunction("glBufferData")
+        for buffer in buffers:
+            gl_bind_buffer(GL_PIXEL_PACK_BUFFER, buffer)
+            gl_buffer_data(GL_PIXEL_PACK_BUFFER, size, None, GL_STREAM_READ)
+        gl_bind_buffer(GL_PIXEL_PACK_BUFFER, 0)
+
+        self._buffers = buffers
+        self._buffer_size = size
+
+    def _mapBuffer(self, slot: int, shape: Tuple[int, int, int]) -> numpy.ndarray:
+        size = shape[0] * shape[1] * shape[2] * self._item_size
+        dtype = numpy.float32 if self._floating_point else numpy.uint8
+
+        gl_bind_buffer = self._readback.getFunction("glBindBuffer")
+        gl_bind_buffer(GL_PIXEL_PACK_BUFFER, self._buffers[slot])
+        address = self._readback.getFunction("glMapBufferRange")(GL_PIXEL_PACK_BUFFER, 0, size, GL_MAP_READ_BIT)
+        if address:
+            data = (ctypes.c_ubyte * size).from_address(address)
+            pixels = numpy.frombuffer(data, dtype=dtype).reshape(shape).copy()
+            self._readback.getFunction("glUnmapBuffer")(GL_PIXEL_PACK_BUFFER)
+        else:
+            pixels = numpy.zeros(shape, dtype=dtype)
+        gl_bind_buffer(GL_PIXEL_PACK_BUFFER, 0)
+        return pixels
+
+    def _discard(self, slot: int) -> None:
+        request = self._requests[slot]
+        if request is not None:
+            self._readback.getFunction("glDeleteSync")(request[1])
+            self._requests[slot] = None
@@ -0,0 +1,133 @@
+# Copyright (c) 2023 Aldo Hoeben / fieldOfView
+# MeasureTool is released under the terms of the AGPLv3 or higher.
+
+import numpy
+
+from typing import Optional, Tuple
+
+
+##  An ordered list of points in world space, with the lengths of the segments between them.
+#
+#   The points are stored in a contiguous array that grows by doubling, like a list. Moving a point only recomputes
+#   the lengths of the (at most two) segments that it is part of; the cumulative lengths are recomputed lazily.
+class Polyline:
+    def __init__(self, point_count: int = 0) -> None:
+        self._points = numpy.zeros((max(4, point_count), 3), dtype=numpy.float64)
+        self._segment_lengths = numpy.zeros(len(self._points), dtype=numpy.float64)  # segment i ends at point i + 1
+        self._count = point_count
+        self._cumulative_lengths = None  # type: Optional[numpy.ndarray]
+        self._version = 0
+
+    def getPointCount(self) -> int:
+        return self._count
+
+    ##  Get the points as an array of shape (point count, 3). The array is a view, and should not be modified.
+    def getPoints(self) -> numpy.ndarray:
+        return self._points[:self._count]
+
+    def getPoint(self, index: int) -> numpy.ndarray:
+        return self._points[:self._count][index]
+
+    ##  Get a number that changes whenever the points change, to check if something derived from them is outdated.
+    def getVersion(self) -> int:
+        return self._version
+
+    def getSegmentLengths(self) -> numpy.ndarray:
+        return self._segment_lengths[:max(0, self._count - 1)]
+
+    ##  Get the length of the polyline up to each point, starting with 0 for the first point.
+    def getCumulativeLengths(self) -> numpy.ndarray:
+        if self._cumulative_lengths is None:
+            self._cumulative_lengths = numpy.concatenate([[0.0], numpy.cumsum(self.getSegmentLengths())])[:self._count]
+        return self._cumulative_lengths
+
+    def getTotalLength(self) -> float:
+        return float(self.getSegmentLengths().sum())
+
+    def setPoint(self, index: int, position: numpy.ndarray) -> None:
+        index = range(self._count)[index]  # resolve negative indices, and raise IndexError like a list
+        self._points[index] = position
+        self._updateSegments(index - 1, index + 1)
+
+    def appendPoint(self, position: numpy.ndarray) -> int:
+        return self.insertPoint(self._count, position)
+
+    ##  Insert a point before the point at index.
+    #   \return The index of the new point.
+    def insertPoint(self, index: int, position: numpy.ndarray) -> int:
+        index = max(0, min(self._count, index))
+        self._reserve(self._count + 1)
+
+        segment_count = max(0, self._count - 1)
+        self._points[index + 1:self._count + 1] = self._points[index:self._count].copy()
+        if index < segment_count:
+            self._segment_lengths[index + 1:segment_count + 1] = self._segment_lengths[index:segment_count].copy()
+        self._points[index] = position
+        self._count += 1
+
+        self._updateSegments(index - 1, index + 1)
+        return index
+
+    def removePoint(self, index: int) -> None:
+        index = range(self._count)[index]
+        segment_count = self._count - 1
+        self._points[index:self._count - 1] = self._points[index + 1:self._count].copy()
+        if index + 1 < segment_count:
+            self._segment_lengths[index:segment_count - 1] = self._segment_lengths[index + 1:segment_count].copy()
+        self._count -= 1
+
+        self._updateSegments(index - 1, index)
+
+    ##  Replace all points.
+    def setPoints(self, points: numpy.ndarray) -> None:
+        points = numpy.asarray(points, dtype=numpy.float64).reshape(-1, 3)
+        self._count = 0
+        self._reserve(len(points))
+        self._points[:len(points)] = points
+        self._count = len(points)
+        self._updateSegments(0, self._count)
+
+    def clear(self) -> None:
+        self._count = 0
+        self._cumulative_lengths = None
+        self._version += 1
+
+    ##  Find the segment nearest to a position in a 2D projection of the points.
+    #   \param projected_points The projected points, of shape (point count, 2).
+    #   \return The index of the first point of the segment and the distance to it, or None if there are no segments.
+    def findNearestSegment(self, projected_points: numpy.ndarray, position: Tuple[float, float]) -> Optional[Tuple[int, float]]:
+        if self._count < 2:
+            return None
+
+        starts = projected_points[:-1]
+        directions = projected_points[1:] - starts
+        squared_lengths = numpy.maximum((directions * directions).sum(axis=1), 1e-12)
+        t = numpy.clip(((numpy.asarray(position) - starts) * directions).sum(axis=1) / squared_lengths, 0, 1)
+        distances = numpy.linalg.norm(starts + t[:, numpy.newaxis] * directions - position, axis=1)
+
+        index = int(numpy.argmin(distances))
+        return index, float(distances[index])
+
+    ##  Recompute the lengths of the segments that end at points first + 1 up to and including last.
+    def _updateSegments(self, first: int, last: int) -> None:
+        first = max(0, first)
+        last = min(self._count - 1, last)
+        if last > first:
+            self._segment_lengths[first:last] = numpy.linalg.norm(
+                self._points[first + 1:last + 1] - self._points[first:last], axis=1
+            )
+        self._cumulative_lengths = None
+        self._version += 1
+
+    def _reserve(self, count: int) -> None:
+        if count <= len(self._points):
+            return
+        capacity = max(count, 2 * len(self._points))
+
+        points = numpy.zeros((capacity, 3), dtype=numpy.float64)
+        points[:self._count] = self._points[:self._count]
+        self._points = points
+
+        segment_lengths = numpy.zeros(capacity, dtype=numpy.float64)
+        segment_lengths[:len(self._segment_lengths)] = self._segment_lengths
+        self._segment_lengths = segment_lengths
@@ -0,0 +1,82 @@
+# Copyright (c) 2023 Aldo Hoeben / fieldOfView
+# MeasureTool is released under the terms of the AGPLv3 or higher.
+
+from .GeometryCache import GeometryCache, NodeGeometry
+
+import numpy
+
+from typing import Any, Iterable, Iterator, List, Optional, Tuple
+
+
+##  The result of casting a ray into the scene.
+class RayCastHit:
+    def __init__(self, position: numpy.ndarray, distance: float, node: Any, triangle_id: int, barycentric: Tuple[float, float]) -> None:
+        self.position = position  # world space position of the hit, in mm
+        self.distance = distance  # distance along the ray
+        self.node = node  # the node that was hit (the build volume for the build plate)
+        self.triangle_id = triangle_id  # index of the triangle in the mesh data of the node
+        self.barycentric = barycentric  # (u, v) coordinates of the hit within the triangle
+
+
+##  Picks world space positions by casting rays against the meshes in the scene on the CPU.
+#
+#   This is an alternative to rendering a MeasurePass, which does not need an OpenGL context and does not suffer from
+#   the limited range and precision of encoding coordinates in a framebuffer. A bounding volume hierarchy is built for
+#   each mesh the first time it is picked, and kept in the geometry cache until the mesh data is no longer used.
+class RayCastPicker:
+    def __init__(self, geometry_cache: Optional[GeometryCache] = None) -> None:
+        self._geometry_cache = geometry_cache if geometry_cache is not None else GeometryCache()
+
+    ##  Cast a ray into a collection of meshes.
+    #   \param items Tuples of a node, its 4x4 world transformation matrix and its mesh data, or NodeGeometry
+    #   instances from the geometry cache.
+    #   \param origin, direction The ray, in world space. The direction does not need to be normalized.
+    #   \param max_distance Only hits closer to the origin than this are returned.
+    #   \return The nearest hit, or None if the ray does not hit any of the meshes.
+    def pick(self, items: Iterable[Any], origin: numpy.ndarray, direction: numpy.ndarray, max_distance: float = numpy.inf) -> Optional[RayCastHit]:
+        origin = numpy.asarray(origin, dtype=numpy.float64)
+        direction = numpy.asarray(direction, dtype=numpy.float64)
+        direction = direction / numpy.linalg.norm(direction)
+
+        nearest = None  # type: Optional[RayCastHit]
+        for item in items:
+            node_geometry = item if isinstance(item, NodeGeometry) else self._geometry_cache.getNodeGeometry(*item)
+
+            inverse = node_geometry.getInverseTransformation()
+            # Because the local direction is not normalized, distances along the local ray equal world distances
+            local_origin = inverse[:3, :3].dot(origin) + inverse[:3, 3]
+            local_direction = inverse[:3, :3].dot(direction)
+
+            bvh = node_geometry.mesh_geometry.getBVH()
+            hit = bvh.intersectRay(local_origin, local_direction, nearest.distance if nearest else max_distance)
+            if hit is None:
+                continue
+
+            distance, triangle_id, u, v = hit
+            nearest = RayCastHit(origin + distance * direction, distance, node_geometry.getNode(), triangle_id, (u, v))
+
+        return nearest
+
+    ##  Find where a point is on the surface of a collection of meshes, by casting a short ray towards it.
+    #   \param view_position The world space position that the point is seen from, such as the position of the camera.
+    #   \param max_distance The distance from the surface within which the point is considered to be on it.
+    #   \return The hit, or None if the point is not within max_distance of any of the meshes.
+    def pickSurface(self, items: Iterable[Any], point: numpy.ndarray, view_position: numpy.ndarray, max_distance: float) -> Optional[RayCastHit]:
+        towards_view = numpy.asarray(view_position, dtype=numpy.float64) - point
+        towards_view /= max(float(numpy.linalg.norm(towards_view)), 1e-12)
+        return self.pick(items, point + towards_view * max_distance, -towards_view, 2 * max_distance)
+
+
+##  Iterate over the nodes in a scene that can be picked, depth first.
+#   \return Tuples of the node, its 4x4 world transformation matrix and its mesh data.
+def getPickableItems(root: Any) -> Iterator[Tuple[Any, numpy.ndarray, Any]]:
+    stack = [root]  # type: List[Any]
+    while stack:
+        node = stack.pop()
+        stack.extend(reversed(node.getChildren()))
+        if (
+            node.callDecoration("isSliceable")
+            and node.getMeshData()
+            and node.isVisible()
+        ):
+            yield node, node.getWorldTransformation().getData(), node.getMeshData()
@@ -0,0 +1,97 @@
+# Copyright (c) 2023 Aldo Hoeben / fieldOfView
+# MeasureTool is released under the terms of the AGPLv3 or higher.
+
+import numpy
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:
+    cKDTree = None
+
+
+##  A spatial index for finding the points of a set that are near a point.
+#
+#   Uses a KD-tree from scipy when it is available. Otherwise the points are hashed into a regular grid of voxels, and
+#   the shells of voxels around the query point that are within the distance are searched.
+class VertexIndex:
+    TargetPointsPerVoxel = 4
+    MaximumShells = 8
+
+    def __init__(self, points: numpy.ndarray) -> None:
+        points = numpy.unique(numpy.asarray(points, dtype=numpy.float64).reshape(-1, 3), axis=0)
+        self._points = points
+
+        self._minimum = points.min(axis=0) if len(points) else numpy.zeros(3)
+        self._maximum = points.max(axis=0) if len(points) else numpy.zeros(3)
+
+        self._tree = None
+        if cKDTree is not None:
+            self._tree = cKDTree(points)
+            return
+
+        # Choose the voxel size so that on average a few points end up in each occupied voxel
+        extent = numpy.maximum(self._maximum - self._minimum, 1e-6)
+        self._voxel_size = max(
+            float(numpy.cbrt(numpy.prod(extent) * VertexIndex.TargetPointsPerVoxel / max(1, len(points)))),
+            float(extent.max()) / 1024  # limit the grid to 1024 voxels along an axis
+        )
+        self._grid_size = (extent // self._voxel_size).astype(numpy.int64) + 1
+
+        keys = self._getVoxelKeys(self._getVoxels(points))
+        order = numpy.argsort(keys, kind="stable")
+        self._points = points[order]
+        self._keys = keys[order]
+
+    def getPointCount(self) -> int:
+        return len(self._points)
+
+    def getPoints(self) -> numpy.ndarray:
+        return self._points
+
+    ##  Get the distance from a point to the bounding box of the indexed points.
+    def getBoundsDistance(self, point: numpy.ndarray) -> float:
+        return float(numpy.linalg.norm(numpy.maximum(0, numpy.maximum(self._minimum - point, point - self._maximum))))
+
+    ##  Find all indexed points within a distance of a query point.
+    #   \return An array of shape (points, 3), in no particular order.
+    def queryRadius(self, point: numpy.ndarray, radius: float) -> numpy.ndarray:
+        point = numpy.asarray(point, dtype=numpy.float64)
+        if len(self._points) == 0 or self.getBoundsDistance(point) > radius:
+            return numpy.zeros((0, 3))
+
+        if self._tree is not None:
+            return self._points[self._tree.query_ball_point(point, radius)].reshape(-1, 3)
+
+        shells = int(radius // self._voxel_size) + 1
+        if shells >= VertexIndex.MaximumShells:
+            candidates = self._points
+        else:
+            center = self._getVoxels(point[numpy.newaxis])[0]
+            candidates = numpy.concatenate([self._getShellPoints(center, shell) for shell in range(shells + 1)])
+        return candidates[numpy.linalg.norm(candidates - point, axis=1) <= radius]
+
+    def _getVoxels(self, points: numpy.ndarray) -> numpy.ndarray:
+        voxels = ((points - self._minimum) // self._voxel_size).astype(numpy.int64)
+        return numpy.clip(voxels, 0, self._grid_size - 1)
+
+    def _getVoxelKeys(self, voxels: numpy.ndarray) -> numpy.ndarray:
+        return (voxels[..., 0] * self._grid_size[1] + voxels[..., 1]) * self._grid_size[2] + voxels[..., 2]
+
+    ##  Get the points in the voxels at a Chebyshev distance of exactly shell voxels from the center voxel.
+    def _getShellPoints(self, center: numpy.ndarray, shell: int) -> numpy.ndarray:
+        offsets = numpy.arange(-shell, shell + 1)
+        voxels = numpy.stack(numpy.meshgrid(offsets, offsets, offsets, indexing="ij"), axis=-1).reshape(-1, 3)
+        voxels = voxels[numpy.abs(voxels).max(axis=1) == shell] + center
+        voxels = voxels[numpy.all((voxels >= 0) & (voxels < self._grid_size), axis=1)]
+        if len(voxels) == 0:
+            return numpy.zeros((0, 3))
+
+        keys = self._getVoxelKeys(voxels)
+        starts = numpy.searchsorted(self._keys, keys, side="left")
+        ends = numpy.searchsorted(self._keys, keys, side="right")
+        counts = ends - starts
+        if counts.sum() == 0:
+            return numpy.zeros((0, 3))
+        indices = numpy.repeat(starts - numpy.cumsum(counts) + counts, counts) + numpy.arange(counts.sum())
+        return self._points[indices]
+
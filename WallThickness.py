@@ -0,0 +1,190 @@
+# Copyright (c) 2023 Aldo Hoeben / fieldOfView
+# MeasureTool is released under the terms of the AGPLv3 or higher.
+
+from .GeometryCache import MeshGeometry, NodeGeometry
+
+import numpy
+
+from typing import Dict, List, Optional
+
+
+##  The local wall thickness at every vertex of a mesh, computed in batches.
+#
+#   The thickness at a vertex is the distance from that vertex to the opposite surface, along the inverted vertex
+#   normal. Rays are cast against the bounding volume hierarchy of the mesh in its local space, but in directions
+#   chosen so that distances along them are distances in world space; the result therefore only depends on the scale
+#   (and shear) of the node, not on its position or rotation, and is shared by all nodes with the same mesh and scale.
+#
+#   The thickness is computed in batches of vertices, which can be computed in parallel by computeBatch() and stored
+#   with setBatchResult() as they finish. Vertices that have not been computed yet have a thickness of nan; vertices
+#   of which the ray does not hit the mesh (in open meshes) have a thickness of inf.
+class WallThickness:
+    BatchSize = 4096  # number of rays per batch
+    Percentiles = (5, 50, 95)
+
+    def __init__(self, mesh_geometry: MeshGeometry, linear_transformation: numpy.ndarray) -> None:
+        self._mesh_geometry = mesh_geometry
+        self._linear_transformation = numpy.array(linear_transformation, dtype=numpy.float64)
+
+        self._origins = None  # type: Optional[numpy.ndarray]
+        self._directions = None  # type: Optional[numpy.ndarray]
+        self._normals = None  # type: Optional[numpy.ndarray]
+        self._offset = 0.0
+        self._thickness = numpy.zeros(0)
+        self._computed = numpy.zeros(0, dtype=bool)  # per batch
+        self._version = 0
+        self._statistics = None  # type: Optional[Dict[str, float]]
+
+    ##  Compute the rays to cast. This is done separately from the constructor, so it can be done in a background job.
+    def prepare(self) -> None:
+        if self._origins is not None:
+            return
+        features = self._mesh_geometry.getFeatures()
+        vertices = features.getVertices()
+        faces = features.getFaces()
+
+        # Area weighted vertex normals. Meshes with the faces wound the wrong way round (a negative volume) would have
+        # the normals pointing inwards, so those are flipped.
+        corners = vertices[faces]
+        face_normals = numpy.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+        if numpy.einsum("ij,ij->", corners[:, 0], face_normals) < 0:
+            face_normals = -face_normals
+        normals = numpy.stack([
+            numpy.bincount(faces.ravel(), numpy.repeat(face_normals[:, axis], 3), minlength=len(vertices))
+            for axis in range(3)
+        ], axis=1)
+        normals /= numpy.maximum(numpy.linalg.norm(normals, axis=1), 1e-12)[:, numpy.newaxis]
+
+        # Inward directions in local space, of which the world space length is 1 so distances along them are world
+        # space distances. Normals are transformed to world space by the inverse transpose of the transformation.
+        inverse = numpy.linalg.inv(self._linear_transformation)
+        world_normals = normals.dot(inverse)
+        world_normals /= numpy.maximum(numpy.linalg.norm(world_normals, axis=1), 1e-12)[:, numpy.newaxis]
+        directions = -world_normals.dot(inverse.T)
+
+        # Start the rays slightly inside the surface, so they do not hit the triangles around the vertex itself
+        if len(vertices):
+            world_extent = (vertices.max(axis=0) - vertices.min(axis=0)).dot(numpy.abs(self._linear_transformation).T)
+            self._offset = max(1e-4, 1e-5 * float(numpy.linalg.norm(world_extent)))
+        self._normals = normals
+        self._directions = directions
+        self._origins = vertices + directions * self._offset
+
+        # Build the hierarchy now, rather than in each of the threads that compute the first batches
+        self._mesh_geometry.getBVH()
+
+        batch_count = (len(vertices) + WallThickness.BatchSize - 1) // WallThickness.BatchSize
+        self._thickness = numpy.full(len(vertices), numpy.nan)
+        self._computed = numpy.zeros(batch_count, dtype=bool)
+
+    def isPrepared(self) -> bool:
+        return self._origins is not None
+
+    ##  Get the unique vertices of the mesh in its local space; the thickness is given per vertex of these.
+    def getVertices(self) -> numpy.ndarray:
+        return self._mesh_geometry.getFeatures().getVertices()
+
+    def getFaces(self) -> numpy.ndarray:
+        return self._mesh_geometry.getFeatures().getFaces()
+
+    ##  Get the unit outward normals of the vertices, in the local space of the mesh.
+    def getNormals(self) -> numpy.ndarray:
+        return self._normals if self._normals is not None else numpy.zeros((0, 3))
+
+    ##  Get the thickness per vertex, in mm. The array is updated in place as batches finish, and should not be
+    #   modified.
+    def getThickness(self) -> numpy.ndarray:
+        return self._thickness
+
+    ##  Get a number that changes whenever the thickness changes, to check if something derived from it is outdated.
+    def getVersion(self) -> int:
+        return self._version
+
+    def getBatchCount(self) -> int:
+        return len(self._computed)
+
+    ##  Get the indices of the batches that have not been computed yet.
+    def getPendingBatches(self) -> List[int]:
+        return numpy.flatnonzero(~self._computed).tolist()
+
+    def isComplete(self) -> bool:
+        return self.isPrepared() and bool(self._computed.all())
+
+    ##  Get the fraction of the batches that have been computed.
+    def getProgress(self) -> float:
+        if not self.isPrepared():
+            return 0.0
+        if len(self._computed) == 0:
+            return 1.0
+        return float(self._computed.mean())
+
+    ##  Compute the thickness of a batch of vertices. This does not change the state of this object, so batches can
+    #   be computed in parallel; the result is stored with setBatchResult().
+    def computeBatch(self, batch: int) -> numpy.ndarray:
+        batch_slice = slice(batch * WallThickness.BatchSize, (batch + 1) * WallThickness.BatchSize)
+        distances, _, _, _ = self._mesh_geometry.getBVH().intersectRays(
+            self._origins[batch_slice], self._directions[batch_slice]
+        )
+        return distances + self._offset
+
+    def setBatchResult(self, batch: int, thickness: numpy.ndarray) -> None:
+        self._thickness[batch * WallThickness.BatchSize:(batch + 1) * WallThickness.BatchSize] = thickness
+        self._computed[batch] = True
+        self._version += 1
+        self._statistics = None
+
+    ##  Get the minimum and the percentiles of the thickness of the vertices computed so far.
+    #   \return A dictionary with the keys "min" and "p5", "p50", "p95", or None if no thickness has been found yet.
+    def getStatistics(self) -> Optional[Dict[str, float]]:
+        if self._statistics is None:
+            self._statistics = _computeStatistics([self._thickness])
+        return self._statistics
+
+
+##  Get the wall thickness analysis of the mesh of a node, creating it if needed.
+#   The analysis is cached with the mesh, per scale of the node, so it is kept when the node is moved or rotated.
+def getWallThickness(node_geometry: NodeGeometry) -> WallThickness:
+    return node_geometry.mesh_geometry.getDerived(
+        ("wall_thickness", node_geometry.getMetricKey()),
+        lambda: WallThickness(node_geometry.mesh_geometry, node_geometry.transformation[:3, :3])
+    )
+
+
+##  Get the statistics of the thickness of several meshes together.
+def getCombinedStatistics(analyses: List[WallThickness]) -> Optional[Dict[str, float]]:
+    if len(analyses) == 1:
+        return analyses[0].getStatistics()
+    return _computeStatistics([analysis.getThickness() for analysis in analyses])
+
+
+def _computeStatistics(thicknesses: List[numpy.ndarray]) -> Optional[Dict[str, float]]:
+    values = numpy.concatenate(thicknesses) if thicknesses else numpy.zeros(0)
+    values = values[numpy.isfinite(values)]
+    if len(values) == 0:
+        return None
+    statistics = {"min": float(values.min())}
+    for percentile, value in zip(WallThickness.Percentiles, numpy.percentile(values, WallThickness.Percentiles)):
+        statistics["p%d" % percentile] = float(value)
+    return statistics
+
+
+# Colors of the heat map, from thin to thick
+_HeatMapColors = numpy.array([
+    [0.85, 0.1, 0.1],
+    [0.95, 0.8, 0.1],
+    [0.2, 0.75, 0.25],
+    [0.15, 0.45, 0.9],
+])
+_UnknownColor = numpy.array([0.6, 0.6, 0.6])
+
+
+##  Map thickness values to RGBA colors, from red for 0 to blue for maximum and thicker.
+#   Vertices without a thickness (not computed yet, or no opposite surface) are gray.
+def getHeatMapColors(thickness: numpy.ndarray, maximum: float) -> numpy.ndarray:
+    known = numpy.isfinite(thickness)
+    scaled = numpy.clip(numpy.where(known, thickness, 0) / max(maximum, 1e-6), 0, 1) * (len(_HeatMapColors) - 1)
+    stops = numpy.arange(len(_HeatMapColors))
+    colors = numpy.ones((len(thickness), 4), dtype=numpy.float32)
+    for channel in range(3):
+        colors[:, channel] = numpy.where(known, numpy.interp(scaled, stops, _HeatMapColors[:, channel]), _UnknownColor[channel])
+    return colors
@@ -0,0 +1,93 @@
+# Copyright (c) 2023 Aldo Hoeben / fieldOfView
+# MeasureTool is released under the terms of the AGPLv3 or higher.
+
+from UM.Job import Job
+from UM.Logger import Logger
+
+from .IndexBuilder import IndexBuilder
+from .WallThickness import WallThickness
+
+from concurrent.futures import Future, FIRST_COMPLETED, wait
+import threading
+import time
+
+from typing import Dict, List
+
+
+##  Computes the wall thickness of meshes in the background, spreading the batches of rays over the worker threads of
+#   the index builder.
+#
+#   The job does not run on the job queue, because it mostly waits for its batches; it runs on a thread of its own,
+#   and only hands out the batches and reports through its signals. Results are stored in the WallThickness objects as
+#   batches finish, and the progress signal is emitted at most every ProgressInterval seconds so the heat map can be
+#   updated progressively. Because the WallThickness objects are cached with the meshes, a cancelled job leaves its
+#   finished batches behind, and a new job for the same meshes continues where it left off.
+class WallThicknessJob(Job):
+    ProgressInterval = 0.25  # seconds between progress signals
+
+    def __init__(self, analyses: List[WallThickness], index_builder: IndexBuilder) -> None:
+        super().__init__()
+        self._analyses = analyses
+        self._index_builder = index_builder
+        self._cancelled = False
+
+    def getAnalyses(self) -> List[WallThickness]:
+        return self._analyses
+
+    ##  Start the job on a thread of its own instead of adding it to the job queue. The finished signal is emitted
+    #   from that thread, like the job queue does.
+    def start(self) -> None:
+        threading.Thread(target=self._runAndFinish, name="MeasureToolWallThickness", daemon=True).start()
+
+    def cancel(self) -> None:
+        self._cancelled = True
+        super().cancel()
+
+    def isCancelled(self) -> bool:
+        return self._cancelled
+
+    def run(self) -> None:
+        worker_count = self._index_builder.getWorkerCount()
+        last_progress = time.monotonic()
+        try:
+            for analysis in self._analyses:
+                analysis.prepare()
+                if self._cancelled:
+                    return
+
+                # Keep only a few batches in flight, so cancelling does not have to wait for all of them
+                pending_batches = analysis.getPendingBatches()
+                futures = {}  # type: Dict[Future, int]
+                while pending_batches or futures:
+                    while pending_batches and len(futures) < 2 * worker_count and not self._cancelled:
+                        batch = pending_batches.pop(0)
+                        future = self._index_builder.submit(analysis.computeBatch, batch)
+                        if future is None:
+                            self._cancelled = True  # the application is shutting down
+                            break
+                        futures[future] = batch
+
+                    if futures:
+                        done, _ = wait(list(futures.keys()), return_when=FIRST_COMPLETED)
+                        for future in done:
+                            analysis.setBatchResult(futures.pop(future), future.result())
+
+                    if self._cancelled:
+                        pending_batches = []
+                    elif time.monotonic() - last_progress > WallThicknessJob.ProgressInterval:
+                        last_progress = time.monotonic()
+                        self.progress.emit(self, self._getProgress())
+        except Exception:
+            Logger.logException("e", "Unable to compute the wall thickness")
+        finally:
+            self.setResult(self._analyses)
+
+    def _runAndFinish(self) -> None:
+        self.run()
+        self.finished.emit(self)
+
+    ##  Get the fraction of the batches of all meshes that has been computed, as a percentage.
+    def _getProgress(self) -> float:
+        batch_counts = [max(1, analysis.getBatchCount()) for analysis in self._analyses]
+        done = sum(analysis.getProgress() * count for analysis, count in zip(self._analyses, batch_counts))
+        return 100 * done / sum(batch_counts)
@@ -0,0 +1,485 @@
+#!/usr/bin/env python3
+# Copyright (c) 2023 Aldo Hoeben / fieldOfView
+# MeasureTool is released under the terms of the AGPLv3 or higher.
+
+##  Headless benchmarks for the picking, decoding and handle mesh code of the plugin.
+#
+#   Runs without Cura, using the stand-ins from standins.py, and writes the results as JSON so they can be compared
+#   between commits:
+#
+#       python benchmarks/run_benchmarks.py --output before.json
+#       (apply changes)
+#       python benchmarks/run_benchmarks.py --output after.json --compare before.json
+
+import argparse
+import itertools
+import json
+import os.path
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import standins  # noqa: E402
+
+import numpy  # noqa: E402
+
+from typing import Any, Callable, Dict, List, Optional  # noqa: E402
+
+RESULTS_VERSION = 1
+
+
+##  Time a function, after calling it a few times to warm up caches.
+#   \return Statistics of the durations in milliseconds.
+def timeFunction(function: Callable[[], Any], repeat: int, warmup: int = 2) -> Dict[str, float]:
+    for _ in range(warmup):
+        function()
+
+    durations = []  # type: List[float]
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        durations.append((time.perf_counter() - start) * 1000)
+
+    return {
+        "min": min(durations),
+        "median": statistics.median(durations),
+        "mean": statistics.mean(durations),
+        "stdev": statistics.stdev(durations) if len(durations) > 1 else 0.0,
+        "repeat": repeat,
+    }
+
+
+##  Create a UV sphere mesh with separate vertices per triangle, like the mesh data of a loaded model.
+def createSphereMesh(radius: float, segments: int) -> standins.MeshData:
+    theta = numpy.linspace(0, numpy.pi, segments + 1)
+    phi = numpy.linspace(0, 2 * numpy.pi, 2 * segments + 1)
+    grid = numpy.stack([
+        radius * numpy.outer(numpy.sin(theta), numpy.cos(phi)),
+        radius * numpy.outer(numpy.cos(theta), numpy.ones_like(phi)),
+        radius * numpy.outer(numpy.sin(theta), numpy.sin(phi)),
+    ], axis=-1)
+
+    corners = numpy.stack([grid[:-1, :-1], grid[1:, :-1], grid[1:, 1:], grid[:-1, 1:]], axis=2).reshape(-1, 4, 3)
+    triangles = numpy.concatenate([corners[:, [0, 1, 2]], corners[:, [0, 2, 3]]])
+    return standins.MeshData(vertices=triangles.reshape(-1, 3).astype(numpy.float32))
+
+
+##  Create a scene with a grid of spheres on the build plate.
+def createScene(object_count: int, segments: int) -> standins.SceneNode:
+    root = standins.SceneNode()
+    mesh_data = createSphereMesh(10, segments)
+    columns = int(numpy.ceil(numpy.sqrt(object_count)))
+    for index in range(object_count):
+        transformation = numpy.identity(4)
+        transformation[0, 3] = (index % columns - columns / 2) * 25
+        transformation[1, 3] = 10
+        transformation[2, 3] = (index // columns - columns / 2) * 25
+        # Each node gets its own mesh data, like separately loaded models
+        root.addChild(standins.SceneNode(standins.MeshData(vertices=mesh_data.getVertices().copy()), transformation))
+    return root
+
+
+def benchmarkCpuPicking(repeat: int) -> List[Dict[str, Any]]:
+    RayCastPicker = standins.importPluginModule("RayCastPicker")
+
+    results = []
+    for object_count in (1, 10, 50, 200):
+        root = createScene(object_count, 48)  # 48 segments is 9216 triangles per object
+        items = list(RayCastPicker.getPickableItems(root))
+        camera = standins.Camera(1920, 1080)
+        rays = [camera.getRay(x, y) for x, y in numpy.random.RandomState(0).uniform(-0.5, 0.5, (16, 2))]
+        parameters = {"objects": object_count, "triangles": object_count * 9216}
+
+        def coldPick() -> None:
+            picker = RayCastPicker.RayCastPicker()
+            picker.pick(items, *rays[0])
+        results.append(dict(name="pick_cpu_cold", parameters=parameters, **timeFunction(coldPick, max(1, repeat // 10), warmup=0)))
+
+        picker = RayCastPicker.RayCastPicker()
+        ray_index = [0]
+
+        def warmPick() -> None:
+            picker.pick(items, *rays[ray_index[0] % len(rays)])
+            ray_index[0] += 1
+        results.append(dict(name="pick_cpu_warm", parameters=parameters, **timeFunction(warmPick, repeat)))
+
+    return results
+
+
+def benchmarkRenderTraversal(repeat: int) -> List[Dict[str, Any]]:
+    MeasurePass = standins.importPluginModule("MeasurePass")
+    application = standins.CuraApplication.getInstance()
+
+    results = []
+    for object_count in (10, 100, 500):
+        application.setScene(createScene(object_count, 8), 1920, 1080)
+        parameters = {"objects": object_count}
+
+        measure_pass = MeasurePass.MeasurePass(1920, 1080, 0)
+        results.append(dict(name="render_traversal", parameters=parameters, **timeFunction(
+            lambda: measure_pass.render(), repeat
+        )))
+
+        measure_pass = MeasurePass.MeasurePass(1920, 1080, 0)
+        results.append(dict(name="render_traversal_scissored", parameters=parameters, **timeFunction(
+            lambda: measure_pass.render((0.0, 0.0)), repeat
+        )))
+
+    return results
+
+
+def benchmarkDecoding(repeat: int) -> List[Dict[str, Any]]:
+    MeasurePass = standins.importPluginModule("MeasurePass")
+    random = numpy.random.RandomState(0)
+
+    application = standins.CuraApplication.getInstance()
+    context = standins.PixelContext()
+
+    results = []
+    for width, height in ((640, 480), (1280, 720), (1920, 1080), (3840, 2160)):
+        parameters = {"width": width, "height": height}
+        application.setScene(standins.SceneNode(), width, height)
+        measure_pass = MeasurePass.MeasurePass(width, height, 0)
+        measure_pass.bind()
+        framebuffer = standins.getBoundFramebuffer()
+        framebuffer.pixels[..., :3] = random.randint(0, 256, framebuffer.pixels.shape[:2] + (3,))
+        framebuffer.pixels[..., 3] = 255
+        measure_pass.release()
+
+        # Without a context the whole framebuffer is read back as an image to decode the pixel under the cursor
+        results.append(dict(name="pick_axis_image", parameters=parameters, **timeFunction(
+            lambda: measure_pass.getPickedCoordinate(0.1, -0.2), repeat
+        )))
+
+        # With a context only the window around the cursor is read, with glReadPixels
+        def pickWindow() -> None:
+            context.makeCurrent()
+            measure_pass.getPickedCoordinate(0.1, -0.2)
+            context.doneCurrent()
+        results.append(dict(name="pick_axis_window", parameters=parameters, **timeFunction(pickWindow, repeat)))
+
+    for window_size in (1, 3, 9):
+        parameters = {"window_size": window_size}
+        window = random.randint(0, 256, (window_size, window_size, 4)).astype(numpy.uint8)
+        window[..., 3] = random.randint(0, 2, (window_size, window_size))
+
+        def decodeWindow() -> None:
+            pixel = MeasurePass._nearestHitPixel(window)
+            if pixel is not None:
+                MeasurePass.decodeAxisPixels(pixel)
+        results.append(dict(name="decode_axis_window", parameters=parameters, **timeFunction(decodeWindow, repeat * 10)))
+
+        # The windows of the three passes of a pick, decoded together
+        windows = random.randint(0, 256, (3, window_size, window_size, 4)).astype(numpy.uint8)
+        windows[..., 3] = random.randint(0, 2, (3, window_size, window_size))
+        origins = numpy.array([12000.0, -3000.0, 250.0])
+
+        def decodeWindows() -> None:
+            nearest = MeasurePass._nearestHit(windows[..., 3].min(axis=0) != 0)
+            if nearest is not None:
+                MeasurePass.decodeAxisPixels(windows[:, nearest[0], nearest[1]], origins)
+        results.append(dict(name="decode_axes_windows", parameters=parameters, **timeFunction(decodeWindows, repeat * 10)))
+
+    return results
+
+
+def benchmarkHandleMesh(repeat: int) -> List[Dict[str, Any]]:
+    try:
+        import trimesh
+    except ImportError:
+        return [{"name": "handle_mesh", "skipped": "trimesh is not installed"}]
+    MeasureToolHandle = standins.importPluginModule("MeasureToolHandle")
+
+    results = []
+    handle = MeasureToolHandle.MeasureToolHandle()
+    for subdivisions in (2, 3, 4):
+        sphere = trimesh.creation.icosphere(subdivisions=subdivisions, radius=1)
+        parameters = {"subdivisions": subdivisions, "triangles": len(sphere.faces)}
+        results.append(dict(name="to_mesh_data", parameters=parameters, **timeFunction(
+            lambda: handle._toMeshData(sphere), max(1, repeat // 5)
+        )))
+
+    def buildColdMesh() -> None:
+        MeasureToolHandle._sphere_meshes.clear()
+        handle._buildSolidMesh()
+    results.append(dict(name="handle_build_mesh", parameters={}, **timeFunction(buildColdMesh, repeat)))
+    results.append(dict(name="handle_build_mesh_cached", parameters={}, **timeFunction(handle._buildSolidMesh, repeat)))
+    return results
+
+
+def benchmarkMinimumDistance(repeat: int) -> List[Dict[str, Any]]:
+    GeometryCache = standins.importPluginModule("GeometryCache")
+    MeshDistance = standins.importPluginModule("MeshDistance")
+
+    results = []
+    for segments in (48, 128, 256):
+        node_a = standins.SceneNode(createSphereMesh(10, segments))
+        node_b = standins.SceneNode(createSphereMesh(10, segments))
+        transformation_b = numpy.identity(4)
+        transformation_b[:3, :3] = numpy.linalg.qr(numpy.random.RandomState(0).randn(3, 3))[0]
+        transformation_b[0, 3] = 21.5
+        parameters = {"triangles": segments * segments * 4}
+
+        def coldDistance() -> None:
+            cache = GeometryCache.GeometryCache()
+            geometry_a = cache.getNodeGeometry(node_a, numpy.identity(4), node_a.getMeshData())
+            geometry_b = cache.getNodeGeometry(node_b, transformation_b, node_b.getMeshData())
+            MeshDistance.findClosestPoints(geometry_a, geometry_b)
+        results.append(dict(name="minimum_distance_cold", parameters=parameters, **timeFunction(
+            coldDistance, max(1, repeat // 10), warmup=0
+        )))
+
+        # The hierarchies are kept with the mesh data; only the transformed boxes depend on the position
+        cache = GeometryCache.GeometryCache()
+        cache.getMeshGeometry(node_a.getMeshData()).getBVH()
+        cache.getMeshGeometry(node_b.getMeshData()).getBVH()
+
+        def movedDistance() -> None:
+            transformation_b[2, 3] += 0.01
+            geometry_a = cache.getNodeGeometry(node_a, numpy.identity(4), node_a.getMeshData())
+            geometry_b = cache.getNodeGeometry(node_b, transformation_b, node_b.getMeshData())
+            MeshDistance.findClosestPoints(geometry_a, geometry_b)
+        results.append(dict(name="minimum_distance_moved", parameters=parameters, **timeFunction(movedDistance, repeat)))
+
+    return results
+
+
+def benchmarkWallThickness(repeat: int) -> List[Dict[str, Any]]:
+    GeometryCache = standins.importPluginModule("GeometryCache")
+    WallThickness = standins.importPluginModule("WallThickness")
+
+    results = []
+    for segments in (48, 128):
+        node = standins.SceneNode(createSphereMesh(10, segments))
+        node_geometry = GeometryCache.GeometryCache().getNodeGeometry(node, numpy.identity(4), node.getMeshData())
+        analysis = WallThickness.getWallThickness(node_geometry)
+        parameters = {"triangles": segments * segments * 4, "rays": WallThickness.WallThickness.BatchSize}
+
+        results.append(dict(name="wall_thickness_prepare", parameters=parameters, **timeFunction(
+            analysis.prepare, 1, warmup=0
+        )))
+        results.append(dict(name="wall_thickness_batch", parameters=parameters, **timeFunction(
+            lambda: analysis.computeBatch(0), max(1, repeat // 10)
+        )))
+
+    return results
+
+
+def benchmarkGeodesic(repeat: int) -> List[Dict[str, Any]]:
+    GeometryCache = standins.importPluginModule("GeometryCache")
+    Geodesic = standins.importPluginModule("Geodesic")
+
+    results = []
+    for segments in (64, 200):
+        node = standins.SceneNode(createSphereMesh(10, segments))
+        node_geometry = GeometryCache.GeometryCache().getNodeGeometry(node, numpy.identity(4), node.getMeshData())
+        triangle_count = node_geometry.mesh_geometry.getTriangleCount()
+        parameters = {"triangles": triangle_count}
+
+        results.append(dict(name="geodesic_graph", parameters=parameters, **timeFunction(
+            lambda: Geodesic.SurfaceGraph(node_geometry.mesh_geometry, numpy.identity(3)), 1, warmup=0
+        )))
+
+        # From a point near one pole to points around the other, searching the graph again for every path
+        graph = Geodesic.getSurfaceGraph(node_geometry)
+        targets = itertools.cycle(range(triangle_count - 2 * segments, triangle_count))
+        results.append(dict(name="geodesic_search", parameters=parameters, **timeFunction(
+            lambda: graph.findPath((next(targets), (0.3, 0.3)), (0, (0.3, 0.3))), max(1, repeat // 5)
+        )))
+
+        # Dragging the target, which reuses the distances from the source and does not refine the path
+        results.append(dict(name="geodesic_drag", parameters=parameters, **timeFunction(
+            lambda: graph.findPath((0, (0.3, 0.3)), (next(targets), (0.3, 0.3)), refine=False), repeat
+        )))
+
+    return results
+
+
+def benchmarkCalipers(repeat: int) -> List[Dict[str, Any]]:
+    GeometryCache = standins.importPluginModule("GeometryCache")
+    Calipers = standins.importPluginModule("Calipers")
+
+    results = []
+    for segments in (64, 200):
+        # An ellipsoid, so the box has a single best orientation
+        mesh = standins.MeshData(vertices=createSphereMesh(10, segments).getVertices() * numpy.array([1.0, 0.6, 0.3], dtype=numpy.float32))
+        parameters = {"vertices": len(mesh.getVertices())}
+
+        results.append(dict(name="calipers_hull", parameters=parameters, **timeFunction(
+            lambda: Calipers.getHullPoints(GeometryCache.MeshGeometry(mesh)), 1, warmup=0
+        )))
+
+        # Measuring at a new scale transforms the cached hull and searches it again
+        cache = GeometryCache.GeometryCache()
+        node = standins.SceneNode(mesh)
+        scales = itertools.count(1)
+        def measureScaled():
+            transformation = numpy.identity(4)
+            transformation[0, 0] = 1 + next(scales) * 1e-3
+            Calipers.measureCalipers([cache.getNodeGeometry(node, transformation, mesh)])
+        results.append(dict(name="calipers_scaled", parameters=parameters, **timeFunction(measureScaled, max(1, repeat // 10))))
+
+        # Rotating the node, which moves the measurement at the same scale along
+        angles = itertools.count(1)
+        def measureRotated():
+            angle = next(angles) * 1e-2
+            transformation = numpy.identity(4)
+            transformation[:2, :2] = [[numpy.cos(angle), -numpy.sin(angle)], [numpy.sin(angle), numpy.cos(angle)]]
+            Calipers.measureCalipers([cache.getNodeGeometry(node, transformation, mesh)])
+        results.append(dict(name="calipers_rotated", parameters=parameters, **timeFunction(measureRotated, repeat)))
+
+    return results
+
+
+def benchmarkBatchMeasurer(repeat: int) -> List[Dict[str, Any]]:
+    BatchMeasurer = standins.importPluginModule("BatchMeasurer")
+
+    results = []
+    mesh = createSphereMesh(10, 64)
+    random = numpy.random.default_rng(0)
+    for node_count in (10, 100):
+        nodes = []
+        for index in range(node_count):
+            transformation = numpy.identity(4)
+            transformation[:3, 3] = [25 * (index % 10), 25 * (index // 10), 10]
+            nodes.append(standins.SceneNode(mesh, transformation))
+        parameters = {"nodes": node_count}
+        measurer = BatchMeasurer.BatchMeasurer()
+
+        points = random.uniform(-100, 100, (10000, 2, 3))
+        results.append(dict(name="batch_distances", parameters=dict(parameters, queries=len(points)), **timeFunction(
+            lambda: list(measurer.measure(BatchMeasurer.DistanceQuery(a, b) for a, b in points)), max(1, repeat // 10)
+        )))
+
+        results.append(dict(name="batch_extents", parameters=parameters, **timeFunction(
+            lambda: list(measurer.measure(BatchMeasurer.ExtentsQuery(node) for node in nodes)), repeat
+        )))
+
+        # Every node against all others; the meshes of the nodes are shared, so only the first batch builds indexes
+        results.append(dict(name="batch_clearances", parameters=parameters, **timeFunction(
+            lambda: list(measurer.measure(
+                BatchMeasurer.ClearanceQuery(node, nodes[:index] + nodes[index + 1:]) for index, node in enumerate(nodes)
+            )), max(1, repeat // 10)
+        )))
+
+    return results
+
+
+def benchmarkPinnedMeasurements(repeat: int) -> List[Dict[str, Any]]:
+    GeometryCache = standins.importPluginModule("GeometryCache")
+    Measurements = standins.importPluginModule("Measurements")
+
+    results = []
+    mesh = createSphereMesh(10, 64)
+    triangle_count = len(mesh.getVertices()) // 3
+    for node_count, measurement_count in ((10, 1000), (100, 10000)):
+        nodes = [standins.SceneNode(mesh) for _ in range(node_count)]
+        cache = GeometryCache.GeometryCache()
+        store = Measurements.MeasurementStore(cache)
+        random = numpy.random.default_rng(0)
+        for _ in range(measurement_count):
+            node_a, node_b = random.integers(0, node_count, 2)
+            store.addMeasurement([
+                (nodes[node_a], int(random.integers(0, triangle_count)), (0.25, 0.25)),
+                (nodes[node_b], int(random.integers(0, triangle_count)), (0.25, 0.25)),
+            ], numpy.zeros((2, 3)))
+        parameters = {"nodes": node_count, "measurements": measurement_count}
+
+        # Only the measurements on the moved node are recomputed
+        results.append(dict(name="pinned_measurements_move_one", parameters=parameters, **timeFunction(
+            lambda: store.update(nodes[:1]), repeat
+        )))
+        results.append(dict(name="pinned_measurements_serialize", parameters=parameters, **timeFunction(
+            lambda: store.serialize(nodes), repeat
+        )))
+
+    return results
+
+
+BENCHMARKS = {
+    "pick_cpu": benchmarkCpuPicking,
+    "render_traversal": benchmarkRenderTraversal,
+    "decoding": benchmarkDecoding,
+    "handle_mesh": benchmarkHandleMesh,
+    "minimum_distance": benchmarkMinimumDistance,
+    "wall_thickness": benchmarkWallThickness,
+    "pinned_measurements": benchmarkPinnedMeasurements,
+    "geodesic": benchmarkGeodesic,
+    "calipers": benchmarkCalipers,
+    "batch": benchmarkBatchMeasurer,
+}
+
+
+def getCommit() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)), stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _resultKey(result: Dict[str, Any]) -> str:
+    return json.dumps([result["name"], result.get("parameters", {})], sort_keys=True)
+
+
+##  Print the change of the median durations compared to an earlier run.
+#   \return The number of results that are slower than the threshold allows.
+def compareResults(results: List[Dict[str, Any]], baseline_path: str, threshold: float) -> int:
+    with open(baseline_path) as baseline_file:
+        baseline = {_resultKey(result): result for result in json.load(baseline_file)["results"]}
+
+    regressions = 0
+    for result in results:
+        previous = baseline.get(_resultKey(result))
+        if "median" not in result or previous is None or "median" not in previous:
+            continue
+        ratio = result["median"] / previous["median"] if previous["median"] > 0 else 1.0
+        regressed = ratio > threshold
+        regressions += regressed
+        print("%-28s %-40s %10.3f ms -> %10.3f ms  x%.2f%s" % (
+            result["name"], json.dumps(result.get("parameters", {})), previous["median"], result["median"], ratio,
+            "  REGRESSION" if regressed else ""
+        ))
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--output", default="benchmark_results.json", help="path of the JSON file to write")
+    parser.add_argument("--repeat", type=int, default=50, help="number of timed repetitions per benchmark")
+    parser.add_argument("--only", action="append", choices=sorted(BENCHMARKS.keys()), help="run only these benchmarks")
+    parser.add_argument("--compare", help="JSON file of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=1.25, help="median slowdown that counts as a regression")
+    args = parser.parse_args()
+
+    standins.install()
+
+    results = []  # type: List[Dict[str, Any]]
+    for name in args.only or BENCHMARKS.keys():
+        print("Running %s..." % name, file=sys.stderr)
+        results.extend(BENCHMARKS[name](args.repeat))
+
+    output = {
+        "version": RESULTS_VERSION,
+        "commit": getCommit(),
+        "timestamp": time.time(),
+        "python": platform.python_version(),
+        "numpy": numpy.__version__,
+        "platform": platform.platform(),
+        "results": results,
+    }
+    with open(args.output, "w") as output_file:
+        json.dump(output, output_file, indent=2)
+    print("Wrote %d results to %s" % (len(results), args.output), file=sys.stderr)
+
+    if args.compare:
+        return 1 if compareResults(results, args.compare, args.threshold) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
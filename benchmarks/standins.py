@@ -0,0 +1,514 @@
+# Copyright (c) 2023 Aldo Hoeben / fieldOfView
+# MeasureTool is released under the terms of the AGPLv3 or higher.
+
+##  Minimal stand-ins for the parts of Cura, Uranium and Qt that the plugin modules use, so the plugin code can be
+#   benchmarked without starting Cura or creating an OpenGL context.
+#
+#   The stand-ins do no rendering work; OpenGL calls are recorded or ignored, and render batches only do the work that
+#   Uranium does on the CPU for each item. Benchmarks of the rendering paths therefore measure the Python side of the
+#   work (scene traversal, culling, decoding), not the GPU. Framebuffers keep their contents in an array, which can be
+#   read back as a whole as an image, or in part through glReadPixels while a PixelContext is current.
+
+import ctypes
+import importlib
+import os.path
+import sys
+import types
+
+import numpy
+
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+PLUGIN_PACKAGE = "MeasureTool"
+
+
+class Vector:
+    def __init__(self, x: float = 0, y: float = 0, z: float = 0) -> None:
+        self.x = x
+        self.y = y
+        self.z = z
+
+
+class Matrix:
+    def __init__(self, data: Optional[numpy.ndarray] = None) -> None:
+        self._data = numpy.identity(4) if data is None else numpy.array(data, dtype=numpy.float64)
+
+    def setToIdentity(self) -> None:
+        self._data = numpy.identity(4)
+
+    def translate(self, direction: Vector) -> None:
+        translation = numpy.identity(4)
+        translation[:3, 3] = (direction.x, direction.y, direction.z)
+        self._data = self._data.dot(translation)
+
+    def getData(self) -> numpy.ndarray:
+        return self._data
+
+
+class AxisAlignedBox:
+    def __init__(self, minimum: Vector, maximum: Vector) -> None:
+        self.minimum = minimum
+        self.maximum = maximum
+
+
+class Version:
+    def __init__(self, version: str) -> None:
+        self._parts = tuple(int(part) for part in version.split(" ")[0].split(".") if part.isdigit())
+
+    def __ge__(self, other: "Version") -> bool:
+        return self._parts >= other._parts
+
+    def __lt__(self, other: "Version") -> bool:
+        return self._parts < other._parts
+
+
+class Logger:
+    @classmethod
+    def log(cls, log_type: str, message: str, *args: Any) -> None:
+        pass
+
+    @classmethod
+    def logException(cls, log_type: str, message: str, *args: Any) -> None:
+        pass
+
+
+class Resources:
+    Shaders = "shaders"
+
+    @classmethod
+    def getPath(cls, resource_type: str, *args: str) -> str:
+        return os.path.join(resource_type, *args)
+
+
+class MeshData:
+    def __init__(self, vertices: Optional[numpy.ndarray] = None, normals: Optional[numpy.ndarray] = None, indices: Optional[numpy.ndarray] = None, **kwargs: Any) -> None:
+        self._vertices = vertices
+        self._normals = normals
+        self._indices = indices
+
+    def getVertices(self) -> Optional[numpy.ndarray]:
+        return self._vertices
+
+    def getNormals(self) -> Optional[numpy.ndarray]:
+        return self._normals
+
+    def getIndices(self) -> Optional[numpy.ndarray]:
+        return self._indices
+
+    def getVertexCount(self) -> int:
+        return 0 if self._vertices is None else len(self._vertices)
+
+
+class SceneNode:
+    def __init__(self, mesh_data: Optional[MeshData] = None, transformation: Optional[numpy.ndarray] = None) -> None:
+        self._mesh_data = mesh_data
+        self._transformation = Matrix(transformation)
+        self._children = []  # type: List[SceneNode]
+        self._bounding_box = None  # type: Optional[AxisAlignedBox]
+
+        if mesh_data is not None:
+            vertices = mesh_data.getVertices()
+            world_vertices = vertices.dot(self._transformation.getData()[:3, :3].T) + self._transformation.getData()[:3, 3]
+            self._bounding_box = AxisAlignedBox(Vector(*world_vertices.min(axis=0)), Vector(*world_vertices.max(axis=0)))
+
+    def addChild(self, node: "SceneNode") -> None:
+        self._children.append(node)
+
+    def getChildren(self) -> List["SceneNode"]:
+        return self._children
+
+    def callDecoration(self, name: str) -> Any:
+        if name == "isSliceable":
+            return self._mesh_data is not None
+        return None
+
+    def getMeshData(self) -> Optional[MeshData]:
+        return self._mesh_data
+
+    def isVisible(self) -> bool:
+        return True
+
+    def getWorldTransformation(self) -> Matrix:
+        return self._transformation
+
+    def getBoundingBox(self) -> Optional[AxisAlignedBox]:
+        return self._bounding_box
+
+
+def DepthFirstIterator(root: SceneNode) -> Iterator[SceneNode]:
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        yield node
+        stack.extend(reversed(node.getChildren()))
+
+
+class ToolHandle(SceneNode):
+    def __init__(self, parent: Any = None) -> None:
+        super().__init__()
+        self._shader = None
+        self._auto_scale = True
+        self._solid_mesh = None  # type: Optional[MeshData]
+
+    def setSolidMesh(self, mesh: MeshData) -> None:
+        self._solid_mesh = mesh
+
+
+##  A perspective camera at a fixed position, looking at the origin.
+class Camera:
+    def __init__(self, width: int, height: int) -> None:
+        self._width = width
+        self._height = height
+
+        eye = numpy.array([0.0, 300.0, 700.0])
+        forward = -eye / numpy.linalg.norm(eye)
+        right = numpy.cross(forward, [0.0, 1.0, 0.0])
+        right /= numpy.linalg.norm(right)
+        up = numpy.cross(right, forward)
+        world = numpy.identity(4)
+        world[:3, 0] = right
+        world[:3, 1] = up
+        world[:3, 2] = -forward
+        world[:3, 3] = eye
+        self._world_transformation = Matrix(world)
+
+        near, far, fov = 1.0, 5000.0, numpy.radians(30)
+        aspect = width / height
+        f = 1 / numpy.tan(fov / 2)
+        projection = numpy.zeros((4, 4))
+        projection[0, 0] = f / aspect
+        projection[1, 1] = f
+        projection[2, 2] = (far + near) / (near - far)
+        projection[2, 3] = 2 * far * near / (near - far)
+        projection[3, 2] = -1
+        self._projection_matrix = Matrix(projection)
+
+    def getViewportWidth(self) -> int:
+        return self._width
+
+    def getViewportHeight(self) -> int:
+        return self._height
+
+    def getWorldTransformation(self) -> Matrix:
+        return self._world_transformation
+
+    def getProjectionMatrix(self) -> Matrix:
+        return self._projection_matrix
+
+    ##  Get the origin and direction of the ray through a mouse position, in the -1..1 coordinates Uranium uses.
+    def getRay(self, x: float, y: float) -> Tuple[numpy.ndarray, numpy.ndarray]:
+        inverse = numpy.linalg.inv(self._projection_matrix.getData())
+        target = inverse.dot([x, -y, 1.0, 1.0])
+        target = target[:3] / target[3]
+        world = self._world_transformation.getData()
+        direction = world[:3, :3].dot(target)
+        return world[:3, 3].copy(), direction / numpy.linalg.norm(direction)
+
+
+class Scene:
+    def __init__(self, root: SceneNode, camera: Camera) -> None:
+        self._root = root
+        self._camera = camera
+
+    def getRoot(self) -> SceneNode:
+        return self._root
+
+    def getActiveCamera(self) -> Camera:
+        return self._camera
+
+
+class Controller:
+    def __init__(self, scene: Scene) -> None:
+        self._scene = scene
+
+    def getScene(self) -> Scene:
+        return self._scene
+
+
+class Renderer:
+    def __init__(self, camera: Camera) -> None:
+        self._camera = camera
+
+    def getWindowSize(self) -> Tuple[int, int]:
+        return self._camera.getViewportWidth(), self._camera.getViewportHeight()
+
+
+class BuildVolume:
+    def __init__(self) -> None:
+        vertices = numpy.array([[-100, 0, -100], [100, 0, -100], [100, 0, 100], [-100, 0, 100]], dtype=numpy.float32)
+        self._grid_mesh = MeshData(vertices=vertices, indices=numpy.array([[0, 1, 2], [0, 2, 3]], dtype=numpy.int32))
+
+
+class CuraApplication:
+    __instance = None  # type: Optional[CuraApplication]
+
+    def __init__(self) -> None:
+        self._controller = Controller(Scene(SceneNode(), Camera(1920, 1080)))
+        self._renderer = Renderer(self._controller.getScene().getActiveCamera())
+        self._build_volume = BuildVolume()
+
+    @classmethod
+    def getInstance(cls) -> "CuraApplication":
+        if cls.__instance is None:
+            cls.__instance = cls()
+        return cls.__instance
+
+    ##  Replace the scene, with a camera for a viewport of the given size.
+    def setScene(self, root: SceneNode, width: int, height: int) -> None:
+        camera = Camera(width, height)
+        self._controller = Controller(Scene(root, camera))
+        self._renderer = Renderer(camera)
+
+    def getController(self) -> Controller:
+        return self._controller
+
+    def getRenderer(self) -> Renderer:
+        return self._renderer
+
+    def getBuildVolume(self) -> BuildVolume:
+        return self._build_volume
+
+
+##  OpenGL bindings that accept any call and do nothing.
+class _GLBindings:
+    def __getattr__(self, name: str) -> Any:
+        if name.startswith("GL_"):
+            return 0
+        return lambda *args, **kwargs: None
+
+
+class ShaderProgram:
+    def setUniformValue(self, name: str, value: Any) -> None:
+        pass
+
+
+class OpenGL:
+    __instance = None  # type: Optional[OpenGL]
+
+    @classmethod
+    def getInstance(cls) -> "OpenGL":
+        if cls.__instance is None:
+            cls.__instance = cls()
+        return cls.__instance
+
+    def getBindingsObject(self) -> _GLBindings:
+        return _GLBindings()
+
+    def getOpenGLVersion(self) -> str:
+        return "4.1"
+
+    def createShaderProgram(self, path: str) -> ShaderProgram:
+        return ShaderProgram()
+
+
+##  Collects the items of a batch; rendering them only does the work that Uranium does on the CPU for every item,
+#   which is computing the normal matrix of its transformation. There are no draw calls.
+class RenderBatch:
+    def __init__(self, shader: ShaderProgram) -> None:
+        self._items = []  # type: List[Tuple[Matrix, MeshData]]
+
+    def addItem(self, transformation: Matrix, mesh: MeshData) -> None:
+        self._items.append((transformation, mesh))
+
+    def render(self, camera: Camera) -> None:
+        for transformation, mesh in self._items:
+            if mesh.getVertexCount() == 0:
+                continue
+            normal_matrix = transformation.getData().copy()
+            normal_matrix[3, :] = normal_matrix[:, 3] = (0, 0, 0, 1)
+            numpy.linalg.inv(normal_matrix).transpose()
+
+
+class RenderPass:
+    def __init__(self, name: str, width: int, height: int) -> None:
+        self._name = name
+        self._width = width
+        self._height = height
+        self._gl = OpenGL.getInstance().getBindingsObject()
+        self._fbo = None  # type: Any
+
+    def getSize(self) -> Tuple[int, int]:
+        return self._width, self._height
+
+    def setSize(self, width: int, height: int) -> None:
+        self._width = width
+        self._height = height
+        self._fbo = None
+
+    def getOutput(self) -> "QImage":
+        return self._fbo.getContents()
+
+    def bind(self) -> None:
+        if self._fbo:
+            self._fbo.bind()
+
+    def release(self) -> None:
+        if self._fbo:
+            self._fbo.release()
+
+
+# The framebuffer object that is bound, which glReadPixels of the PixelContext reads from
+_bound_framebuffer = None  # type: Optional[QOpenGLFramebufferObject]
+
+
+##  Get the framebuffer object that is bound, to fill it with the pixels a render would produce.
+def getBoundFramebuffer() -> Optional["QOpenGLFramebufferObject"]:
+    return _bound_framebuffer
+
+
+##  An image of RGBA pixels, with the first row being the top row.
+class QImage:
+    def __init__(self, pixels: numpy.ndarray) -> None:
+        self._pixels = pixels
+
+    def width(self) -> int:
+        return self._pixels.shape[1]
+
+    def height(self) -> int:
+        return self._pixels.shape[0]
+
+    ##  Get a pixel as an integer in ARGB order.
+    def pixel(self, x: int, y: int) -> int:
+        red, green, blue, alpha = (int(channel) for channel in self._pixels[y, x])
+        return (alpha << 24) | (red << 16) | (green << 8) | blue
+
+
+##  A framebuffer object with the contents of its pixels in an array, with the first row being the bottom row like in
+#   OpenGL.
+class QOpenGLFramebufferObject:
+    class Attachment:
+        CombinedDepthStencil = 1
+
+    def __init__(self, width: int, height: int, fbo_format: Any = None) -> None:
+        self._width = width
+        self._height = height
+        self.pixels = numpy.zeros((height, width, 4), dtype=numpy.uint8)
+
+    def isValid(self) -> bool:
+        return True
+
+    def width(self) -> int:
+        return self._width
+
+    def height(self) -> int:
+        return self._height
+
+    def texture(self) -> int:
+        return 0
+
+    def bind(self) -> None:
+        global _bound_framebuffer
+        _bound_framebuffer = self
+
+    def release(self) -> None:
+        global _bound_framebuffer
+        _bound_framebuffer = None
+
+    ##  Read back the complete framebuffer, flipped so the first row is the top row, like Qt does.
+    def toImage(self) -> QImage:
+        return QImage(self.pixels[::-1].copy())
+
+
+class QOpenGLFramebufferObjectFormat:
+    def setAttachment(self, attachment: Any) -> None:
+        pass
+
+    def setInternalTextureFormat(self, texture_format: int) -> None:
+        pass
+
+
+##  By default there is no current OpenGL context, so pixels can not be read back directly. Making a PixelContext
+#   current lets the plugin resolve glReadPixels, to read from the bound framebuffer object.
+class QOpenGLContext:
+    _current = None  # type: Optional[QOpenGLContext]
+
+    @staticmethod
+    def currentContext() -> Optional["QOpenGLContext"]:
+        return QOpenGLContext._current
+
+    def makeCurrent(self, surface: Any = None) -> bool:
+        QOpenGLContext._current = self
+        return True
+
+    def doneCurrent(self) -> None:
+        QOpenGLContext._current = None
+
+    def getProcAddress(self, name: bytes) -> int:
+        return 0
+
+
+##  A context that only offers glReadPixels, implemented on the pixels of the bound framebuffer object.
+class PixelContext(QOpenGLContext):
+    def __init__(self) -> None:
+        function_type = ctypes.WINFUNCTYPE if sys.platform == "win32" else ctypes.CFUNCTYPE  # type: ignore
+        self._read_pixels = function_type(
+            None, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_uint, ctypes.c_uint, ctypes.c_void_p
+        )(self._readPixels)
+
+    def getProcAddress(self, name: bytes) -> int:
+        if name == b"glReadPixels":
+            return ctypes.cast(self._read_pixels, ctypes.c_void_p).value or 0
+        return 0
+
+    def _readPixels(self, x: int, y: int, width: int, height: int, pixel_format: int, data_type: int, data: int) -> None:
+        if _bound_framebuffer is None:
+            return
+        pixels = _bound_framebuffer.pixels[y:y + height, x:x + width]
+        if data_type == 0x1406:  # GL_FLOAT; the integer channels are normalized like OpenGL does
+            target = numpy.ctypeslib.as_array(ctypes.cast(data, ctypes.POINTER(ctypes.c_float)), (height, width, 4))
+            target[...] = pixels / 255.0
+        else:
+            target = numpy.ctypeslib.as_array(ctypes.cast(data, ctypes.POINTER(ctypes.c_ubyte)), (height, width, 4))
+            target[...] = pixels
+
+
+def _makeModule(name: str, attributes: Dict[str, Any]) -> types.ModuleType:
+    module = types.ModuleType(name)
+    module.__dict__.update(attributes)
+    module.__path__ = []  # type: ignore
+    return module
+
+
+##  Register the stand-in modules and the plugin package, without running the __init__ of the plugin.
+#   \return The plugin package module.
+def install() -> types.ModuleType:
+    modules = {
+        "cura": {},
+        "cura.CuraApplication": {"CuraApplication": CuraApplication},
+        "cura.ApplicationMetadata": {"CuraSDKVersion": "8.0.0"},
+        "UM": {},
+        "UM.Logger": {"Logger": Logger},
+        "UM.Resources": {"Resources": Resources},
+        "UM.Version": {"Version": Version},
+        "UM.Math": {},
+        "UM.Math.Matrix": {"Matrix": Matrix},
+        "UM.Math.Vector": {"Vector": Vector},
+        "UM.Mesh": {},
+        "UM.Mesh.MeshData": {"MeshData": MeshData},
+        "UM.Scene": {},
+        "UM.Scene.ToolHandle": {"ToolHandle": ToolHandle},
+        "UM.Scene.Iterator": {},
+        "UM.Scene.Iterator.DepthFirstIterator": {"DepthFirstIterator": DepthFirstIterator},
+        "UM.View": {},
+        "UM.View.RenderPass": {"RenderPass": RenderPass},
+        "UM.View.RenderBatch": {"RenderBatch": RenderBatch},
+        "UM.View.GL": {},
+        "UM.View.GL.OpenGL": {"OpenGL": OpenGL},
+        "PyQt6": {},
+        "PyQt6.QtGui": {"QOpenGLContext": QOpenGLContext},
+        "PyQt6.QtOpenGL": {
+            "QOpenGLFramebufferObject": QOpenGLFramebufferObject,
+            "QOpenGLFramebufferObjectFormat": QOpenGLFramebufferObjectFormat,
+        },
+    }
+    for name, attributes in modules.items():
+        sys.modules[name] = _makeModule(name, attributes)
+
+    package = types.ModuleType(PLUGIN_PACKAGE)
+    package.__path__ = [os.path.dirname(os.path.dirname(os.path.abspath(__file__)))]  # type: ignore
+    sys.modules[PLUGIN_PACKAGE] = package
+    return package
+
+
+def importPluginModule(name: str) -> types.ModuleType:
+    return importlib.import_module("%s.%s" % (PLUGIN_PACKAGE, name))
@@ -325,8 +325,6 @@ Item
 
             checked: UM.ActiveTool.properties.getValue("SnapVertices")
             onClicked: UM.ActiveTool.setProperty("SnapVertices", checked)
-
-            visible: UM.ActiveTool.properties.getValue("SnapVerticesSupported") == true
         }
 
         Binding
@@ -335,5 +333,361 @@ Item
             property: "checked"
             value: UM.ActiveTool.properties.getValue("SnapVertices")
         }
+
+        Item
+        {
+            width: height
+            height: UM.Theme.getSize("setting_control").height
+        }
+
+        UM.CheckBox
+        {
+            id: snapEdgeMidpointsCheckbox
+
+            Layout.columnSpan: 3
+
+            text: catalog.i18nc("@option:check", "Snap to edge midpoints")
+
+            checked: UM.ActiveTool.properties.getValue("SnapEdgeMidpoints")
+            onClicked: UM.ActiveTool.setProperty("SnapEdgeMidpoints", checked)
+        }
+
+        Binding
+        {
+            target: snapEdgeMidpointsCheckbox
+            property: "checked"
+            value: UM.ActiveTool.properties.getValue("SnapEdgeMidpoints")
+        }
+
+        Item
+        {
+            width: height
+            height: UM.Theme.getSize("setting_control").height
+        }
+
+        UM.CheckBox
+        {
+            id: snapFaceCentroidsCheckbox
+
+            Layout.columnSpan: 3
+
+            text: catalog.i18nc("@option:check", "Snap to face centers")
+
+            checked: UM.ActiveTool.properties.getValue("SnapFaceCentroids")
+            onClicked: UM.ActiveTool.setProperty("SnapFaceCentroids", checked)
+        }
+
+        Binding
+        {
+            target: snapFaceCentroidsCheckbox
+            property: "checked"
+            value: UM.ActiveTool.properties.getValue("SnapFaceCentroids")
+        }
+
+        Item
+        {
+            width: height
+            height: UM.Theme.getSize("setting_control").height
+        }
+
+        UM.CheckBox
+        {
+            id: snapCircleCentersCheckbox
+
+            Layout.columnSpan: 3
+
+            text: catalog.i18nc("@option:check", "Snap to hole and circle centers")
+
+            checked: UM.ActiveTool.properties.getValue("SnapCircleCenters")
+            onClicked: UM.ActiveTool.setProperty("SnapCircleCenters", checked)
+        }
+
+        Binding
+        {
+            target: snapCircleCentersCheckbox
+            property: "checked"
+            value: UM.ActiveTool.properties.getValue("SnapCircleCenters")
+        }
+
+        Item
+        {
+            width: height
+            height: UM.Theme.getSize("setting_control").height
+        }
+
+        UM.CheckBox
+        {
+            id: polylineModeCheckbox
+
+            Layout.columnSpan: 3
+
+            text: catalog.i18nc("@option:check", "Measure along a chain of points")
+
+            checked: UM.ActiveTool.properties.getValue("PolylineMode")
+            onClicked: UM.ActiveTool.setProperty("PolylineMode", checked)
+        }
+
+        Binding
+        {
+            target: polylineModeCheckbox
+            property: "checked"
+            value: UM.ActiveTool.properties.getValue("PolylineMode")
+        }
+
+        Repeater
+        {
+            model: UM.ActiveTool.properties.getValue("PolylineMode") ? UM.ActiveTool.properties.getValue("SegmentLengths") : []
+
+            UM.Label
+            {
+                Layout.columnSpan: 4
+
+                height: UM.Theme.getSize("setting_control").height
+                text: catalog.i18nc("@label", "Segment %1: %2").arg(index + 1).arg(base.formatMeasurement(modelData))
+                color: UM.Theme.getColor("text")
+                verticalAlignment: Text.AlignVCenter
+            }
+        }
+
+        UM.Label
+        {
+            Layout.columnSpan: 4
+
+            visible: UM.ActiveTool.properties.getValue("PolylineMode") == true
+            height: UM.Theme.getSize("setting_control").height
+            text: catalog.i18nc("@label", "Total length: %1").arg(base.formatMeasurement(UM.ActiveTool.properties.getValue("TotalLength")))
+            font: UM.Theme.getFont("default_bold")
+            color: UM.Theme.getColor("text")
+            verticalAlignment: Text.AlignVCenter
+        }
+
+        Item
+        {
+            width: height
+            height: UM.Theme.getSize("setting_control").height
+        }
+
+        UM.CheckBox
+        {
+            id: geodesicModeCheckbox
+
+            Layout.columnSpan: 3
+
+            text: catalog.i18nc("@option:check", "Measure along the surface")
+
+            checked: UM.ActiveTool.properties.getValue("GeodesicMode")
+            onClicked: UM.ActiveTool.setProperty("GeodesicMode", checked)
+        }
+
+        Binding
+        {
+            target: geodesicModeCheckbox
+            property: "checked"
+            value: UM.ActiveTool.properties.getValue("GeodesicMode")
+        }
+
+        UM.Label
+        {
+            Layout.columnSpan: 4
+
+            property string status: UM.ActiveTool.properties.getValue("GeodesicStatus") || ""
+
+            visible: UM.ActiveTool.properties.getValue("GeodesicMode") == true
+            height: UM.Theme.getSize("setting_control").height
+            text: status != "" ? status : catalog.i18nc("@label", "Along the surface: %1").arg(base.formatMeasurement(UM.ActiveTool.properties.getValue("GeodesicDistance")))
+            font: UM.Theme.getFont("default_bold")
+            color: UM.Theme.getColor("text")
+            verticalAlignment: Text.AlignVCenter
+        }
+
+        Item
+        {
+            width: height
+            height: UM.Theme.getSize("setting_control").height
+        }
+
+        UM.CheckBox
+        {
+            id: minimumDistanceModeCheckbox
+
+            Layout.columnSpan: 3
+
+            text: catalog.i18nc("@option:check", "Measure clearance between two selected objects")
+
+            checked: UM.ActiveTool.properties.getValue("MinimumDistanceMode")
+            onClicked: UM.ActiveTool.setProperty("MinimumDistanceMode", checked)
+        }
+
+        Binding
+        {
+            target: minimumDistanceModeCheckbox
+            property: "checked"
+            value: UM.ActiveTool.properties.getValue("MinimumDistanceMode")
+        }
+
+        UM.Label
+        {
+            Layout.columnSpan: 4
+
+            visible: UM.ActiveTool.properties.getValue("MinimumDistanceMode") == true && UM.ActiveTool.properties.getValue("MinimumDistanceStatus") != ""
+            height: UM.Theme.getSize("setting_control").height
+            text: UM.ActiveTool.properties.getValue("MinimumDistanceStatus") || ""
+            color: UM.Theme.getColor("text")
+            verticalAlignment: Text.AlignVCenter
+        }
+
+        Item
+        {
+            width: height
+            height: UM.Theme.getSize("setting_control").height
+        }
+
+        UM.CheckBox
+        {
+            id: wallThicknessModeCheckbox
+
+            Layout.columnSpan: 3
+
+            text: catalog.i18nc("@option:check", "Show wall thickness of the selected objects")
+
+            checked: UM.ActiveTool.properties.getValue("WallThicknessMode")
+            onClicked: UM.ActiveTool.setProperty("WallThicknessMode", checked)
+        }
+
+        Binding
+        {
+            target: wallThicknessModeCheckbox
+            property: "checked"
+            value: UM.ActiveTool.properties.getValue("WallThicknessMode")
+        }
+
+        UM.Label
+        {
+            Layout.columnSpan: 4
+
+            property var statistics: UM.ActiveTool.properties.getValue("WallThicknessStatistics")
+            property real progress: UM.ActiveTool.properties.getValue("WallThicknessProgress") || 0
+
+            visible: UM.ActiveTool.properties.getValue("WallThicknessMode") == true
+            height: UM.Theme.getSize("setting_control").height
+            text:
+            {
+                var result = "";
+                if (statistics != undefined && statistics.length == 4)
+                {
+                    result = catalog.i18nc("@label", "Thinnest: %1, 5%: %2, median: %3")
+                        .arg(base.formatMeasurement(statistics[0]))
+                        .arg(base.formatMeasurement(statistics[1]))
+                        .arg(base.formatMeasurement(statistics[2]));
+                }
+                if (progress < 100)
+                {
+                    result = catalog.i18nc("@label", "Analyzing (%1%) %2").arg(Math.floor(progress)).arg(result);
+                }
+                return result;
+            }
+            color: UM.Theme.getColor("text")
+            verticalAlignment: Text.AlignVCenter
+        }
+
+        Item
+        {
+            width: height
+            height: UM.Theme.getSize("setting_control").height
+        }
+
+        UM.CheckBox
+        {
+            id: caliperModeCheckbox
+
+            Layout.columnSpan: 3
+
+            text: catalog.i18nc("@option:check", "Measure the size of the selected objects")
+
+            checked: UM.ActiveTool.properties.getValue("CaliperMode")
+            onClicked: UM.ActiveTool.setProperty("CaliperMode", checked)
+        }
+
+        Binding
+        {
+            target: caliperModeCheckbox
+            property: "checked"
+            value: UM.ActiveTool.properties.getValue("CaliperMode")
+        }
+
+        UM.Label
+        {
+            Layout.columnSpan: 4
+
+            property var dimensions: UM.ActiveTool.properties.getValue("CaliperDimensions")
+
+            visible: UM.ActiveTool.properties.getValue("CaliperMode") == true
+            height: UM.Theme.getSize("setting_control").height
+            text:
+            {
+                if (dimensions == undefined || dimensions.length != 5)
+                {
+                    return UM.ActiveTool.properties.getValue("CaliperStatus") || "";
+                }
+                return catalog.i18nc("@label", "Box: %1 x %2 x %3, width: %4 to %5")
+                    .arg(base.formatMeasurement(dimensions[0]))
+                    .arg(base.formatMeasurement(dimensions[1]))
+                    .arg(base.formatMeasurement(dimensions[2]))
+                    .arg(base.formatMeasurement(dimensions[3]))
+                    .arg(base.formatMeasurement(dimensions[4]));
+            }
+            color: UM.Theme.getColor("text")
+            verticalAlignment: Text.AlignVCenter
+        }
+
+        Item
+        {
+            width: height
+            height: UM.Theme.getSize("setting_control").height
+        }
+
+        Cura.SecondaryButton
+        {
+            Layout.columnSpan: 2
+
+            text: catalog.i18nc("@action:button", "Pin measurement")
+            onClicked: UM.ActiveTool.triggerAction("pinMeasurement")
+        }
+
+        Cura.SecondaryButton
+        {
+            enabled: (UM.ActiveTool.properties.getValue("PinnedMeasurements") || []).length > 0
+            text: catalog.i18nc("@action:button", "Clear pinned")
+            onClicked: UM.ActiveTool.triggerAction("clearPinnedMeasurements")
+        }
+
+        Repeater
+        {
+            model: UM.ActiveTool.properties.getValue("PinnedMeasurements") || []
+
+            UM.Label
+            {
+                Layout.columnSpan: 4
+
+                height: UM.Theme.getSize("setting_control").height
+                text: catalog.i18nc("@label", "Pinned %1: %2").arg(index + 1).arg(base.formatMeasurement(modelData))
+                color: UM.Theme.getColor("text")
+                verticalAlignment: Text.AlignVCenter
+            }
+        }
+
+        UM.Label
+        {
+            id: pickStatisticsLabel
+
+            Layout.columnSpan: 4
+            Layout.maximumWidth: 250 * screenScaleFactor
+
+            visible: UM.ActiveTool.properties.getValue("PickProfiling") == true
+            text: catalog.i18nc("@label", "Pick latency in ms (p50/p90/p99): %1").arg(UM.ActiveTool.properties.getValue("PickStatistics") || "-")
+            color: UM.Theme.getColor("text")
+            font: UM.Theme.getFont("small")
+            wrapMode: Text.WordWrap
+        }
     }
 }
@@ -3,6 +3,7 @@ vertex =
     uniform highp mat4 u_modelMatrix;
     uniform highp mat4 u_viewMatrix;
     uniform highp mat4 u_projectionMatrix;
+    uniform highp vec3 u_origin;
 
     attribute highp vec4 a_vertex;
 
@@ -13,20 +14,30 @@ vertex =
         vec4 world_space_vert = u_modelMatrix * a_vertex;
         gl_Position = u_projectionMatrix * u_viewMatrix * world_space_vert;
 
-        v_vertex = world_space_vert.xyz;
+        // the position relative to the origin of the pass, so the range and precision of the output are centered on it
+        v_vertex = world_space_vert.xyz - u_origin;
     }
 
 fragment =
     uniform lowp int u_axisId;
+    uniform lowp int u_floatOutput;
 
     varying highp vec3 v_vertex;
 
     void main()
     {
+        if(u_floatOutput == 1)
+        {
+            // write all three coordinates relative to the origin unencoded to a floating point render target
+            gl_FragColor.rgb = v_vertex;
+            gl_FragColor.a = 1.0;
+            return;
+        }
+
         highp float coordinate = ((u_axisId == 0) ? v_vertex.x : (u_axisId == 1) ? v_vertex.y : v_vertex.z) * 1000.; // coordinate in micron
         coordinate += 8388608.; // offset coordinate to account for negative values (half of the coordinate-space: 128 * 256 * 256)
 
-        highp vec3 encoded; // encode float into 3 8-bit channels; this gives a precision of a micron at a range of up to ~16 meter
+        highp vec3 encoded; // encode float into 3 8-bit channels; this gives a precision of a micron at a range of ~8 meter around the origin
         encoded.r = floor(coordinate / 65536.0);
         encoded.g = floor((coordinate - encoded.r * 65536.0) / 256.0);
         encoded.b = floor(coordinate - encoded.r * 65536.0 - encoded.g * 256.0);
@@ -41,6 +52,8 @@ vertex41core =
     uniform highp mat4 u_viewMatrix;
     uniform highp mat4 u_projectionMatrix;
 
+    uniform highp vec3 u_origin;
+
     in highp vec4 a_vertex;
     out highp vec3 v_vertex;
 
@@ -49,87 +62,32 @@ vertex41core =
         vec4 world_space_vert = u_modelMatrix * a_vertex;
         gl_Position = u_projectionMatrix * u_viewMatrix * world_space_vert;
 
-        v_vertex = world_space_vert.xyz;
-    }
-
-geometry41core =
-    #version 410
-    uniform highp mat4 u_modelMatrix;
-    uniform highp mat4 u_viewMatrix;
-    uniform highp mat4 u_projectionMatrix;
-
-    layout(triangles) in;
-    layout(triangle_strip, max_vertices = 3) out;
-
-    in highp vec3 v_vertex[];
-    out highp vec3 v_positions[4];
-
-    void main()
-    {
-        for(int i = 0; i < gl_in.length(); i++)
-        {
-            v_positions[i] = v_vertex[i];
-        }
-
-        for(int i = 0; i < gl_in.length(); i++)
-        {
-            // just copy the position calculated by the vertex shader
-            gl_Position = gl_in[i].gl_Position;
-
-            v_positions[3] = v_vertex[i];
-
-            EmitVertex();
-        }
+        v_vertex = world_space_vert.xyz - u_origin;
     }
 
-
 fragment41core =
     #version 410
     uniform lowp int u_axisId;
-    uniform lowp int u_snapVertices;
+    uniform lowp int u_floatOutput;
 
-    in highp vec3 v_positions[4];
+    in highp vec3 v_vertex;
 
     out vec4 frag_color;
 
     void main()
     {
-        highp vec3 position = v_positions[3];
-        if(u_snapVertices == 1)
+        if(u_floatOutput == 1)
         {
-            highp double distances[3];
-            for(int i = 0; i < 3; i++)
-            {
-                distances[i] = distance(position, v_positions[i]);
-            }
-            if(distances[0] <= distances[1])
-            {
-                if(distances[0] <= distances[2])
-                {
-                    position = v_positions[0];
-                }
-                else
-                {
-                    position = v_positions[2];
-                }
-            }
-            else
-            {
-                if(distances[1] <= distances[2])
-                {
-                    position = v_positions[1];
-                }
-                else
-                {
-                    position = v_positions[2];
-                }
-            }
+            // write all three coordinates relative to the origin unencoded to a floating point render target
+            frag_color.rgb = v_vertex;
+            frag_color.a = 1.0;
+            return;
         }
 
-        highp float coordinate = ((u_axisId == 0) ? position.x : (u_axisId == 1) ? position.y : position.z) * 1000.; // coordinate in micron
+        highp float coordinate = ((u_axisId == 0) ? v_vertex.x : (u_axisId == 1) ? v_vertex.y : v_vertex.z) * 1000.; // coordinate in micron
         coordinate += 8388608.; // offset coordinate to account for negative values (half of the coordinate-space: 128 * 256 * 256)
 
-        highp vec3 encoded; // encode float into 3 8-bit channels; this gives a precision of a micron at a range of up to ~16 meter
+        highp vec3 encoded; // encode float into 3 8-bit channels; this gives a precision of a micron at a range of ~8 meter around the origin
         encoded.r = floor(coordinate / 65536.0);
         encoded.g = floor((coordinate - encoded.r * 65536.0) / 256.0);
         encoded.b = floor(coordinate - encoded.r * 65536.0 - encoded.g * 256.0);
@@ -139,6 +97,7 @@ fragment41core =
     }
 
 [defaults]
+u_floatOutput = 0
 
 [bindings]
 u_modelMatrix = model_matrix
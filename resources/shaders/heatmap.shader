@@ -0,0 +1,100 @@
+[shaders]
+vertex =
+    uniform highp mat4 u_modelMatrix;
+    uniform highp mat4 u_viewMatrix;
+    uniform highp mat4 u_projectionMatrix;
+    uniform highp mat4 u_normalMatrix;
+
+    attribute highp vec4 a_vertex;
+    attribute highp vec3 a_normal;
+    attribute lowp vec4 a_color;
+
+    varying highp vec3 v_vertex;
+    varying highp vec3 v_normal;
+    varying lowp vec4 v_color;
+
+    void main()
+    {
+        vec4 world_space_vert = u_modelMatrix * a_vertex;
+        gl_Position = u_projectionMatrix * u_viewMatrix * world_space_vert;
+
+        v_vertex = world_space_vert.xyz;
+        v_normal = (u_normalMatrix * normalize(vec4(a_normal, 0.0))).xyz;
+        v_color = a_color;
+    }
+
+fragment =
+    uniform highp vec3 u_viewPosition;
+
+    varying highp vec3 v_vertex;
+    varying highp vec3 v_normal;
+    varying lowp vec4 v_color;
+
+    void main()
+    {
+        // light the colors from the camera, so the shape of the model stays visible under the heat map
+        highp vec3 normal = normalize(v_normal);
+        highp vec3 view_direction = normalize(u_viewPosition - v_vertex);
+        highp float lighting = 0.4 + 0.6 * abs(dot(normal, view_direction));
+
+        gl_FragColor = vec4(v_color.rgb * lighting, 1.0);
+    }
+
+vertex41core =
+    #version 410
+    uniform highp mat4 u_modelMatrix;
+    uniform highp mat4 u_viewMatrix;
+    uniform highp mat4 u_projectionMatrix;
+    uniform highp mat4 u_normalMatrix;
+
+    in highp vec4 a_vertex;
+    in highp vec3 a_normal;
+    in lowp vec4 a_color;
+
+    out highp vec3 v_vertex;
+    out highp vec3 v_normal;
+    out lowp vec4 v_color;
+
+    void main()
+    {
+        vec4 world_space_vert = u_modelMatrix * a_vertex;
+        gl_Position = u_projectionMatrix * u_viewMatrix * world_space_vert;
+
+        v_vertex = world_space_vert.xyz;
+        v_normal = (u_normalMatrix * normalize(vec4(a_normal, 0.0))).xyz;
+        v_color = a_color;
+    }
+
+fragment41core =
+    #version 410
+    uniform highp vec3 u_viewPosition;
+
+    in highp vec3 v_vertex;
+    in highp vec3 v_normal;
+    in lowp vec4 v_color;
+
+    out vec4 frag_color;
+
+    void main()
+    {
+        // light the colors from the camera, so the shape of the model stays visible under the heat map
+        highp vec3 normal = normalize(v_normal);
+        highp vec3 view_direction = normalize(u_viewPosition - v_vertex);
+        highp float lighting = 0.4 + 0.6 * abs(dot(normal, view_direction));
+
+        frag_color = vec4(v_color.rgb * lighting, 1.0);
+    }
+
+[defaults]
+
+[bindings]
+u_modelMatrix = model_matrix
+u_viewMatrix = view_matrix
+u_projectionMatrix = projection_matrix
+u_normalMatrix = normal_matrix
+u_viewPosition = view_position
+
+[attributes]
+a_vertex = vertex
+a_normal = normal
+a_color = color
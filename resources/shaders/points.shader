@@ -0,0 +1,74 @@
+[shaders]
+vertex =
+    uniform highp mat4 u_modelMatrix;
+    uniform highp mat4 u_viewMatrix;
+    uniform highp mat4 u_projectionMatrix;
+    uniform highp vec3 u_viewPosition;
+    uniform highp float u_pointScale;
+    uniform highp float u_distanceScale;
+
+    attribute highp vec4 a_vertex;
+    attribute highp vec3 a_offset;
+
+    void main()
+    {
+        // a_vertex is the center of the sphere, a_offset the position on the sphere; the sphere is scaled with the
+        // distance to the camera, so it has about the same size on screen
+        vec4 world_space_center = u_modelMatrix * a_vertex;
+        highp float scale = u_pointScale + u_distanceScale * distance(world_space_center.xyz, u_viewPosition);
+        gl_Position = u_projectionMatrix * u_viewMatrix * vec4(world_space_center.xyz + a_offset * scale, 1.0);
+    }
+
+fragment =
+    uniform lowp vec4 u_color;
+
+    void main()
+    {
+        gl_FragColor = u_color;
+    }
+
+vertex41core =
+    #version 410
+    uniform highp mat4 u_modelMatrix;
+    uniform highp mat4 u_viewMatrix;
+    uniform highp mat4 u_projectionMatrix;
+    uniform highp vec3 u_viewPosition;
+    uniform highp float u_pointScale;
+    uniform highp float u_distanceScale;
+
+    in highp vec4 a_vertex;
+    in highp vec3 a_offset;
+
+    void main()
+    {
+        // a_vertex is the center of the sphere, a_offset the position on the sphere; the sphere is scaled with the
+        // distance to the camera, so it has about the same size on screen
+        vec4 world_space_center = u_modelMatrix * a_vertex;
+        highp float scale = u_pointScale + u_distanceScale * distance(world_space_center.xyz, u_viewPosition);
+        gl_Position = u_projectionMatrix * u_viewMatrix * vec4(world_space_center.xyz + a_offset * scale, 1.0);
+    }
+
+fragment41core =
+    #version 410
+    uniform lowp vec4 u_color;
+
+    out vec4 frag_color;
+
+    void main()
+    {
+        frag_color = u_color;
+    }
+
+[defaults]
+u_color = [0.0, 0.0, 0.0, 1.0]
+u_pointScale = 1.0
+u_distanceScale = 0.0
+
+[bindings]
+u_modelMatrix = model_matrix
+u_viewMatrix = view_matrix
+u_projectionMatrix = projection_matrix
+u_viewPosition = view_position
+
+[attributes]
+a_vertex = vertex
@@ -0,0 +1,58 @@
+# Copyright (c) 2023 Aldo Hoeben / fieldOfView
+# MeasureTool is released under the terms of the AGPLv3 or higher.
+
+##  Runs the tests without Cura, using the stand-ins that the benchmarks use.
+#
+#   The tests compare the accelerated searches of the plugin against brute force over small meshes:
+#
+#       python -m pytest tests
+
+import os.path
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+import standins  # noqa: E402
+
+import numpy  # noqa: E402
+
+from typing import Any, Optional  # noqa: E402
+
+standins.install()
+
+
+##  Create the geometry of a node with a mesh, as the tool gets it from its geometry cache.
+#   \param vertices The vertices of the mesh; without indices, every three vertices are a triangle.
+#   \param transformation The 4x4 world transformation of the node.
+def createNodeGeometry(vertices: numpy.ndarray, indices: Optional[numpy.ndarray] = None, transformation: Optional[numpy.ndarray] = None) -> Any:
+    GeometryCache = standins.importPluginModule("GeometryCache")
+    if transformation is None:
+        transformation = numpy.identity(4)
+    mesh_data = standins.MeshData(
+        vertices=numpy.asarray(vertices, dtype=numpy.float32),
+        indices=None if indices is None else numpy.asarray(indices, dtype=numpy.int32)
+    )
+    node = standins.SceneNode(mesh_data, transformation)
+    return GeometryCache.GeometryCache().getNodeGeometry(node, transformation, mesh_data)
+
+
+##  Create a triangle mesh of a grid in the plane z = 0, with the inner vertices moved a little so the triangles are
+#   not all alike.
+#   \param jitter The largest distance the inner vertices are moved, as a fraction of the size of the cells.
+#   \return The vertices and the indices of the triangles.
+def createPlaneMesh(size: float, cells: int, jitter: float = 0.3, seed: int = 0) -> Any:
+    coordinates = numpy.linspace(0, size, cells + 1)
+    x, y = numpy.meshgrid(coordinates, coordinates, indexing="ij")
+    inner = (x > 0) & (x < size) & (y > 0) & (y < size)
+    offsets = numpy.random.RandomState(seed).uniform(-jitter, jitter, (2,) + x.shape) * size / cells
+    x = numpy.where(inner, x + offsets[0], x)
+    y = numpy.where(inner, y + offsets[1], y)
+    vertices = numpy.stack([x.ravel(), y.ravel(), numpy.zeros(x.size)], axis=1)
+
+    row = cells + 1
+    cell_x, cell_y = numpy.meshgrid(numpy.arange(cells), numpy.arange(cells), indexing="ij")
+    first = (cell_x * row + cell_y).ravel()
+    indices = numpy.concatenate([
+        numpy.stack([first, first + row, first + row + 1], axis=1),
+        numpy.stack([first, first + row + 1, first + 1], axis=1),
+    ])
+    return vertices, indices
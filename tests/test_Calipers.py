@@ -0,0 +1,63 @@
+# Copyright (c) 2023 Aldo Hoeben / fieldOfView
+# MeasureTool is released under the terms of the AGPLv3 or higher.
+
+from conftest import createNodeGeometry
+
+import standins
+
+import numpy
+import pytest
+
+Calipers = standins.importPluginModule("Calipers")
+
+SweepDirectionCount = 50000
+
+
+##  Get directions spread evenly over a half sphere, which are all the directions a width can be measured along.
+def getSweepDirections() -> numpy.ndarray:
+    indices = numpy.arange(SweepDirectionCount) + 0.5
+    z = indices / SweepDirectionCount
+    radius = numpy.sqrt(1 - z * z)
+    angle = numpy.pi * (1 + 5 ** 0.5) * indices
+    return numpy.stack([radius * numpy.cos(angle), radius * numpy.sin(angle), z], axis=1)
+
+
+def createPointCloud(seed: int) -> numpy.ndarray:
+    random = numpy.random.RandomState(seed)
+    count = random.randint(9, 200) // 3 * 3
+    points = random.normal(size=(count, 3)) * random.uniform(1, 30, 3)
+    rotation = numpy.linalg.qr(random.normal(size=(3, 3)))[0]
+    return points.dot(rotation.T)
+
+
+@pytest.mark.parametrize("seed", range(8))
+def test_measureCalipers_matchesSweep(seed):
+    points = createPointCloud(seed)
+    measurement = Calipers.measureCalipers([createNodeGeometry(points)])
+    assert measurement is not None
+
+    # The smallest width is the width along its direction, no direction of the sweep is narrower, and the narrowest
+    # direction of the sweep is close to it
+    assert numpy.ptp(points.dot(measurement.minimum_width_direction)) == pytest.approx(measurement.minimum_width, rel=1e-6)
+    sweep = numpy.ptp(points.dot(getSweepDirections().T), axis=0)
+    assert sweep.min() >= measurement.minimum_width * (1 - 1e-6)
+    assert sweep.min() <= measurement.minimum_width * 1.02
+
+    # The largest width is the largest distance between any two points
+    distances = numpy.linalg.norm(points[:, numpy.newaxis] - points[numpy.newaxis], axis=2)
+    assert measurement.getMaximumWidth() == pytest.approx(float(distances.max()), rel=1e-6)
+    assert sweep.max() <= measurement.getMaximumWidth() * (1 + 1e-6)
+
+    # The box contains all points, and is not larger than the box along the axes
+    local = (points - measurement.center).dot(measurement.axes.T)
+    assert numpy.all(numpy.abs(local) <= measurement.extents / 2 + 1e-4)
+    assert measurement.getVolume() <= numpy.prod(numpy.ptp(points, axis=0)) * (1 + 1e-6)
+
+
+def test_measureCalipers_tetrahedron():
+    # The smallest width of this tetrahedron is between two opposite edges, not between a face and a vertex
+    points = numpy.array([[-3, 0, -0.8], [3, 0, -0.8], [0, -5, 0.8], [0, 5, 0.8]], dtype=numpy.float64)
+    measurement = Calipers.measureCalipers([createNodeGeometry(points[[0, 1, 2, 0, 1, 3, 0, 2, 3, 1, 2, 3]])])
+    assert measurement is not None
+    assert measurement.minimum_width == pytest.approx(1.6, rel=1e-6)
+    assert abs(measurement.minimum_width_direction[2]) == pytest.approx(1.0, rel=1e-6)
@@ -0,0 +1,95 @@
+# Copyright (c) 2023 Aldo Hoeben / fieldOfView
+# MeasureTool is released under the terms of the AGPLv3 or higher.
+
+from conftest import createNodeGeometry, createPlaneMesh
+
+import standins
+
+import numpy
+import pytest
+
+from typing import Tuple
+
+Geodesic = standins.importPluginModule("Geodesic")
+
+
+##  Find the triangle that a point in the plane z = 0 is on, and the barycentric coordinates of the point on it.
+def locate(vertices: numpy.ndarray, indices: numpy.ndarray, point: numpy.ndarray) -> Tuple[int, Tuple[float, float]]:
+    corners = vertices[indices][:, :, :2]
+    first = corners[:, 0]
+    edges = numpy.stack([corners[:, 1] - first, corners[:, 2] - first], axis=2)
+    uv = numpy.linalg.solve(edges, (point[:2] - first)[:, :, numpy.newaxis])[:, :, 0]
+    inside = numpy.flatnonzero((uv >= -1e-9).all(axis=1) & (uv.sum(axis=1) <= 1 + 1e-9))
+    assert len(inside) > 0
+    return int(inside[0]), (float(uv[inside[0], 0]), float(uv[inside[0], 1]))
+
+
+##  Remove the triangles of a plane mesh that have a corner beyond both coordinates of a point, which leaves an L
+#   shaped mesh with a corner at that point.
+def cutCorner(vertices: numpy.ndarray, indices: numpy.ndarray, corner: numpy.ndarray) -> numpy.ndarray:
+    beyond = (vertices[:, 0] > corner[0] + 1e-9) & (vertices[:, 1] > corner[1] + 1e-9)
+    return indices[~beyond[indices].any(axis=1)]
+
+
+def findPath(vertices: numpy.ndarray, indices: numpy.ndarray, source: numpy.ndarray, target: numpy.ndarray, transformation: numpy.ndarray = None, refine: bool = True) -> "Geodesic.SurfacePath":
+    graph = Geodesic.getSurfaceGraph(createNodeGeometry(vertices, indices, transformation))
+    path = graph.findPath(locate(vertices, indices, source), locate(vertices, indices, target), refine=refine)
+    assert path is not None
+    return path
+
+
+@pytest.mark.parametrize("seed", range(6))
+def test_findPath_planeIsStraightLine(seed):
+    vertices, indices = createPlaneMesh(100, 30, seed=seed)
+    random = numpy.random.RandomState(seed)
+    source, target = random.uniform(5, 95, (2, 3)) * [1, 1, 0]
+
+    path = findPath(vertices, indices, source, target)
+    # The end points are on the float32 vertices of the mesh, so they are compared to the points of the path
+    straight = float(numpy.linalg.norm(path.points[-1] - path.points[0]))
+    assert path.distance == pytest.approx(straight, rel=1e-4)
+    assert path.distance >= straight * (1 - 1e-9)
+    assert float(numpy.linalg.norm(numpy.diff(path.points, axis=0), axis=1).sum()) == pytest.approx(path.distance, rel=1e-6)
+    assert numpy.allclose(path.points[0], source, atol=1e-4)
+    assert numpy.allclose(path.points[-1], target, atol=1e-4)
+
+
+def test_findPath_scaledNode():
+    vertices, indices = createPlaneMesh(100, 20)
+    source, target = numpy.array([10.0, 20.0, 0.0]), numpy.array([80.0, 70.0, 0.0])
+    scale = numpy.diag([2.0, 3.0, 1.0, 1.0])
+
+    path = findPath(vertices, indices, source, target, scale)
+    assert path.distance == pytest.approx(float(numpy.linalg.norm((target - source) * [2, 3, 1])), rel=1e-4)
+
+
+@pytest.mark.parametrize("refine", [True, False])
+def test_findPath_aroundCorner(refine):
+    # The straight line between the points leaves the L shaped mesh, so the shortest path bends around its corner
+    vertices, indices = createPlaneMesh(100, 20, jitter=0.0)
+    corner = numpy.array([50.0, 50.0, 0.0])
+    indices = cutCorner(vertices, indices, corner)
+    source, target = numpy.array([90.0, 30.0, 0.0]), numpy.array([30.0, 90.0, 0.0])
+
+    path = findPath(vertices, indices, source, target, refine=refine)
+    around = float(numpy.linalg.norm(corner - source) + numpy.linalg.norm(target - corner))
+    assert path.distance >= around * (1 - 1e-9)
+    assert path.distance == pytest.approx(around, rel=1e-4 if refine else 2e-2)
+    if refine:
+        assert numpy.min(numpy.linalg.norm(path.points - corner, axis=1)) < 1e-3
+
+
+def test_findPath_samePoint():
+    vertices, indices = createPlaneMesh(10, 4)
+    point = numpy.array([3.0, 4.0, 0.0])
+    assert findPath(vertices, indices, point, point).distance == pytest.approx(0.0, abs=1e-9)
+
+
+def test_findPath_notConnected():
+    vertices, indices = createPlaneMesh(10, 4, jitter=0.0)
+    other = numpy.concatenate([vertices, vertices + [20.0, 0.0, 0.0]])
+    other_indices = numpy.concatenate([indices, indices + len(vertices)])
+    graph = Geodesic.getSurfaceGraph(createNodeGeometry(other, other_indices))
+    source = locate(other, other_indices, numpy.array([3.0, 4.0, 0.0]))
+    target = locate(other, other_indices, numpy.array([24.0, 4.0, 0.0]))
+    assert graph.findPath(source, target) is None
@@ -0,0 +1,82 @@
+# Copyright (c) 2023 Aldo Hoeben / fieldOfView
+# MeasureTool is released under the terms of the AGPLv3 or higher.
+
+import standins
+
+import numpy
+import pytest
+
+MeshBVH = standins.importPluginModule("MeshBVH")
+
+
+##  Intersect rays with every triangle, in both directions of the triangles and only in front of the ray origins.
+#   \return The distance to the nearest hit of each ray, inf for rays that miss.
+def intersectAll(triangles: numpy.ndarray, origins: numpy.ndarray, directions: numpy.ndarray) -> numpy.ndarray:
+    v0 = triangles[:, 0]
+    e1 = triangles[:, 1] - v0
+    e2 = triangles[:, 2] - v0
+    nearest = numpy.full(len(origins), numpy.inf)
+    for ray, (origin, direction) in enumerate(zip(origins, directions)):
+        p = numpy.cross(direction, e2)
+        determinant = numpy.einsum("ij,ij->i", e1, p)
+        valid = numpy.abs(determinant) > 1e-12
+        inverse = numpy.where(valid, 1.0 / numpy.where(valid, determinant, 1.0), 0.0)
+        t = origin - v0
+        u = numpy.einsum("ij,ij->i", t, p) * inverse
+        q = numpy.cross(t, e1)
+        v = q.dot(direction) * inverse
+        distance = numpy.einsum("ij,ij->i", e2, q) * inverse
+        hit = valid & (u >= 0) & (v >= 0) & (u + v <= 1) & (distance > 0)
+        if hit.any():
+            nearest[ray] = distance[hit].min()
+    return nearest
+
+
+def createTriangleSoup(count: int, seed: int) -> numpy.ndarray:
+    random = numpy.random.RandomState(seed)
+    centers = random.uniform(-50, 50, (count, 1, 3))
+    return centers + random.uniform(-8, 8, (count, 3, 3))
+
+
+@pytest.mark.parametrize("triangle_count", [1, 40, 1000])
+def test_intersectRays_matchesAllTriangles(triangle_count):
+    triangles = createTriangleSoup(triangle_count, triangle_count)
+    bvh = MeshBVH.MeshBVH(triangles.reshape(-1, 3))
+
+    # Rays from outside the soup towards points in it, so most rays hit something
+    random = numpy.random.RandomState(1)
+    origins = random.uniform(-100, 100, (300, 3))
+    directions = random.uniform(-40, 40, (300, 3)) - origins
+    directions /= numpy.linalg.norm(directions, axis=1)[:, numpy.newaxis]
+
+    distances, triangle_ids, u, v = bvh.intersectRays(origins, directions)
+    expected = intersectAll(triangles, origins, directions)
+
+    assert numpy.array_equal(numpy.isinf(distances), numpy.isinf(expected))
+    hits = ~numpy.isinf(expected)
+    assert numpy.allclose(distances[hits], expected[hits], rtol=1e-9, atol=1e-9)
+
+    # The triangle and barycentric coordinates of each hit give back the hit point
+    hit_triangles = triangles[triangle_ids[hits]]
+    points = (
+        hit_triangles[:, 0] * (1 - u[hits] - v[hits])[:, numpy.newaxis]
+        + hit_triangles[:, 1] * u[hits][:, numpy.newaxis] + hit_triangles[:, 2] * v[hits][:, numpy.newaxis]
+    )
+    assert numpy.allclose(points, origins[hits] + directions[hits] * distances[hits][:, numpy.newaxis], atol=1e-6)
+
+
+def test_intersectRays_maxDistance():
+    triangles = createTriangleSoup(500, 2)
+    bvh = MeshBVH.MeshBVH(triangles.reshape(-1, 3))
+    origins = numpy.zeros((50, 3))
+    directions = numpy.random.RandomState(3).normal(size=(50, 3))
+    directions /= numpy.linalg.norm(directions, axis=1)[:, numpy.newaxis]
+
+    expected = intersectAll(triangles, origins, directions)
+    distances, triangle_ids, _, _ = bvh.intersectRays(origins, directions, 20.0)
+    assert numpy.array_equal(triangle_ids >= 0, expected <= 20.0)
+
+
+def test_intersectRay_emptyMesh():
+    bvh = MeshBVH.MeshBVH(numpy.zeros((0, 3)))
+    assert bvh.intersectRay(numpy.zeros(3), numpy.array([0.0, 0.0, 1.0])) is None
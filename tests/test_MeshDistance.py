@@ -0,0 +1,87 @@
+# Copyright (c) 2023 Aldo Hoeben / fieldOfView
+# MeasureTool is released under the terms of the AGPLv3 or higher.
+
+from conftest import createNodeGeometry
+
+import standins
+
+import numpy
+import pytest
+
+MeshDistance = standins.importPluginModule("MeshDistance")
+
+SampleSteps = 12  # points along each edge of a triangle at which the triangles are sampled
+
+
+##  Get points on triangles, on a grid of barycentric coordinates.
+#   \return An array of shape (triangles * points, 3).
+def sampleTriangles(triangles: numpy.ndarray) -> numpy.ndarray:
+    steps = numpy.arange(SampleSteps + 1) / SampleSteps
+    u, v = numpy.meshgrid(steps, steps)
+    inside = u + v <= 1 + 1e-12
+    weights = numpy.stack([1 - u[inside] - v[inside], u[inside], v[inside]], axis=1)
+    return numpy.einsum("pc,tca->tpa", weights, triangles).reshape(-1, 3)
+
+
+##  Get the smallest distance between any two points of two sets, by comparing all pairs.
+def getSmallestDistance(points_a: numpy.ndarray, points_b: numpy.ndarray) -> float:
+    smallest = numpy.inf
+    for start in range(0, len(points_a), 256):
+        chunk = points_a[start:start + 256]
+        distances = numpy.linalg.norm(chunk[:, numpy.newaxis] - points_b[numpy.newaxis], axis=2)
+        smallest = min(smallest, float(distances.min()))
+    return smallest
+
+
+def createTriangleSoup(count: int, center: numpy.ndarray, seed: int) -> numpy.ndarray:
+    random = numpy.random.RandomState(seed)
+    centers = center + random.uniform(-10, 10, (count, 1, 3))
+    return centers + random.uniform(-3, 3, (count, 3, 3))
+
+
+def getLongestEdge(triangles: numpy.ndarray) -> float:
+    return float(numpy.linalg.norm(triangles - numpy.roll(triangles, 1, axis=1), axis=2).max())
+
+
+def translation(offset) -> numpy.ndarray:
+    transformation = numpy.identity(4)
+    transformation[:3, 3] = offset
+    return transformation
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_findClosestPoints_matchesAllPointPairs(seed):
+    triangles_a = createTriangleSoup(30, numpy.zeros(3), seed)
+    triangles_b = createTriangleSoup(30, numpy.zeros(3), seed + 100)
+    offset = numpy.random.RandomState(seed).normal(size=3)
+    offset *= 35 / numpy.linalg.norm(offset)
+    geometry_a = createNodeGeometry(triangles_a.reshape(-1, 3))
+    geometry_b = createNodeGeometry(triangles_b.reshape(-1, 3), transformation=translation(offset))
+
+    closest = MeshDistance.findClosestPoints(geometry_a, geometry_b)
+    assert closest is not None
+
+    # The points are on the triangles they are reported on, and as far apart as reported
+    triangle_a = geometry_a.transformPoints(geometry_a.mesh_geometry.getTriangles(numpy.array([closest.triangle_a]))[0])
+    triangle_b = geometry_b.transformPoints(geometry_b.mesh_geometry.getTriangles(numpy.array([closest.triangle_b]))[0])
+    assert getSmallestDistance(sampleTriangles(triangle_a[numpy.newaxis]), closest.point_a[numpy.newaxis]) <= getLongestEdge(triangle_a[numpy.newaxis]) / SampleSteps
+    assert getSmallestDistance(sampleTriangles(triangle_b[numpy.newaxis]), closest.point_b[numpy.newaxis]) <= getLongestEdge(triangle_b[numpy.newaxis]) / SampleSteps
+    assert closest.distance == pytest.approx(float(numpy.linalg.norm(closest.point_b - closest.point_a)), abs=1e-6)
+
+    # No pair of points on the meshes is closer, and the closest pair of sampled points is not much further apart
+    world_a = geometry_a.transformPoints(triangles_a.reshape(-1, 3)).reshape(-1, 3, 3)
+    world_b = geometry_b.transformPoints(triangles_b.reshape(-1, 3)).reshape(-1, 3, 3)
+    sampled = getSmallestDistance(sampleTriangles(world_a), sampleTriangles(world_b))
+    assert closest.distance <= sampled + 1e-6
+    assert closest.distance >= sampled - (getLongestEdge(world_a) + getLongestEdge(world_b)) / SampleSteps
+
+
+def test_findClosestPoints_intersecting():
+    triangles = createTriangleSoup(20, numpy.zeros(3), 7)
+    geometry_a = createNodeGeometry(triangles.reshape(-1, 3))
+    geometry_b = createNodeGeometry(triangles.reshape(-1, 3), transformation=translation([0.5, 0.0, 0.0]))
+
+    closest = MeshDistance.findClosestPoints(geometry_a, geometry_b)
+    assert closest is not None
+    assert closest.distance == pytest.approx(0.0, abs=1e-6)
+